@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+"""
+archive_walker.py
+=================
+
+Description: This script walks a directory tree (i.e. the Landsat archive or the site shapefile zones on a network
+drive) with os.scandir, listing the sub-directories concurrently in a thread pool. On a network file system each
+directory listing is a round trip, so the listings of sibling directories are requested together instead of one
+after the other, and the file sizes and modification times come from the cached DirEntry stat results.
+
+walk_fn is a drop-in for os.walk (top down, same order: each directory before its sub-directories, in listing
+order, unreadable directories are skipped) and walk_entries_fn returns the DirEntry objects of the sub-directories
+and files (i.e. the directory modification times of the archive catalog). Both accept:
+
+    max_depth - the number of directory levels below top to descend (None: no limit, 0: top only).
+    suffixes  - only the files ending with one of the suffixes are returned (i.e. ('.img',) or ('.shp',)).
+    prune     - names of the sub-directories that are never descended (PRUNE_DIRS by default, i.e. snapshot and
+                recycle bin directories of the network drives).
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# import modules
+from __future__ import print_function, division
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+
+# number of directory listings requested concurrently.
+WORKERS = 16
+
+# sub-directories that never hold archive data (network drive snapshots and recycle bins).
+PRUNE_DIRS = ('.snapshot', '~snapshot', '$RECYCLE.BIN', 'System Volume Information')
+
+
+def scan_directory_fn(dir_path, suffixes=None, stat=False):
+    """ List one directory.
+
+    @param dir_path: string object containing the path to the directory.
+    @param suffixes: tuple object containing the file name suffixes to return, None for every file.
+    @param stat: boolean object, True to read the stat result of each sub-directory and returned file (cached in
+    the DirEntry).
+    @return dir_entries: list object containing the DirEntry of each sub-directory (listing order).
+    @return file_entries: list object containing the DirEntry of each returned file (listing order).
+    """
+    dir_entries = []
+    file_entries = []
+    with os.scandir(dir_path) as iterator:
+        for entry in iterator:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+
+            if is_dir:
+                dir_entries.append(entry)
+            elif suffixes is None or entry.name.endswith(suffixes):
+                file_entries.append(entry)
+            else:
+                continue
+
+            if stat:
+                try:
+                    entry.stat()
+                except OSError:
+                    pass
+
+    return dir_entries, file_entries
+
+
+def walk_entries_fn(top, workers=WORKERS, max_depth=None, suffixes=None, prune=PRUNE_DIRS, stat=False):
+    """ Walk a directory tree top down, listing the directories concurrently.
+
+    @param top: string object containing the path to the top directory.
+    @param workers: integer object containing the number of concurrent directory listings.
+    @param max_depth: integer object containing the number of directory levels below top to descend, None for all.
+    @param suffixes: iterable object containing the file name suffixes to return (i.e. ['.img']), None for every file.
+    @param prune: iterable object containing the names of the sub-directories not to descend.
+    @param stat: boolean object, True to read the stat result of each sub-directory and returned file in the thread
+    pool.
+    @return: generator object yielding a tuple (directory path, list of sub-directory DirEntry objects, list of file
+    DirEntry objects) for each directory, in os.walk (top down) order.
+    """
+    suffixes = None if suffixes is None else tuple(suffixes)
+    prune = frozenset(prune or ())
+    futures = {}
+    lock = threading.Lock()
+    # set when the walk is closed early, the outstanding listings do not request further directories.
+    stop = threading.Event()
+
+    with ThreadPoolExecutor(max_workers=max(int(workers), 1)) as executor:
+
+        def scan_fn(dir_path, depth):
+            # list the directory and request its sub-directories before returning, so that the future of every
+            # sub-directory exists once the future of its parent is done.
+            if stop.is_set():
+                return None
+            try:
+                dir_entries, file_entries = scan_directory_fn(dir_path, suffixes, stat)
+            except OSError:
+                return None
+
+            list_dir = []
+            for entry in dir_entries:
+                if entry.name in prune or (max_depth is not None and depth >= max_depth):
+                    continue
+                list_dir.append(entry)
+                if not entry.is_symlink():
+                    with lock:
+                        futures[entry.path] = executor.submit(scan_fn, entry.path, depth + 1)
+
+            return list_dir, file_entries
+
+        futures[top] = executor.submit(scan_fn, top, 0)
+        stack = [top]
+        try:
+            while stack:
+                dir_path = stack.pop()
+                with lock:
+                    future = futures.pop(dir_path, None)
+                result = None if future is None else future.result()
+                if result is None:
+                    continue
+
+                list_dir, file_entries = result
+                yield dir_path, list_dir, file_entries
+                stack.extend(entry.path for entry in reversed(list_dir))
+        finally:
+            stop.set()
+
+
+def walk_fn(top, workers=WORKERS, max_depth=None, suffixes=None, prune=PRUNE_DIRS):
+    """ Drop-in for os.walk (top down) listing the directories concurrently.
+
+    @param top: string object containing the path to the top directory.
+    @param workers: integer object containing the number of concurrent directory listings.
+    @param max_depth: integer object containing the number of directory levels below top to descend, None for all.
+    @param suffixes: iterable object containing the file name suffixes to return (i.e. ['.shp']), None for every file.
+    @param prune: iterable object containing the names of the sub-directories not to descend.
+    @return: generator object yielding a tuple (directory path, list of sub-directory names, list of file names).
+    """
+    for dir_path, list_dir, file_entries in walk_entries_fn(top, workers, max_depth, suffixes, prune):
+        yield dir_path, [entry.name for entry in list_dir], [entry.name for entry in file_entries]
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+
+"""
+image_date_filter.py
+====================
+
+Description: This script filters Landsat image lists on the dates parsed from the file names (image_name_parser),
+so that a targeted re-run (one season, or the last N years) discovers and processes only the images it needs. The
+filter is applied at discovery (landsat_archive_catalog), so the image count threshold of the step1_5 scripts is
+checked against the filtered images.
+
+Filters (combined, an image must pass every filter that is set):
+    from / to - the date range of the image (start and end date of the date code) lies within the from and to dates.
+                A date is given as YYYY, YYYY-MM or YYYY-MM-DD: a from date starts on the first day and a to date
+                ends on the last day of the year or month (i.e. --from 2018 --to 2020-02).
+    months    - every month covered by the image lies within the months (i.e. 12 1 2 for the summer composites).
+    seasons   - the months of the seasons (Australian seasons: summer Dec-Feb, autumn Mar-May, winter Jun-Aug and
+                spring Sep-Nov), added to the months.
+
+Images without a parsed date are left out when a filter is set.
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# import modules
+from __future__ import print_function, division
+from collections import namedtuple
+import calendar
+import datetime
+import image_name_parser
+
+# months of each season (Australian seasons).
+SEASONS = {'summer': (12, 1, 2), 'autumn': (3, 4, 5), 'winter': (6, 7, 8), 'spring': (9, 10, 11)}
+
+# date_from, date_to: datetime.date objects, None for an open range.
+# months: frozenset object containing the month numbers, None for every month.
+DateFilter = namedtuple('DateFilter', ['date_from', 'date_to', 'months'])
+
+
+def parse_date_bound_fn(value, end=False):
+    """ Convert a YYYY, YYYY-MM or YYYY-MM-DD string to a date.
+
+    @param value: string object containing the date (separators '-', '/' or none).
+    @param end: boolean object, True for the last day of the year or month (to date), False for the first day.
+    @return: datetime.date object.
+    """
+    digits = ''.join(i for i in str(value) if i.isdigit())
+    if len(digits) not in (4, 6, 8):
+        raise ValueError("Unknown date: {0} (options: YYYY, YYYY-MM or YYYY-MM-DD)".format(value))
+
+    year = int(digits[:4])
+    if len(digits) == 4:
+        return datetime.date(year, 12, 31) if end else datetime.date(year, 1, 1)
+
+    month = int(digits[4:6])
+    if len(digits) == 6:
+        return datetime.date(year, month, calendar.monthrange(year, month)[1] if end else 1)
+
+    return datetime.date(year, month, int(digits[6:]))
+
+
+def date_filter_fn(date_from=None, date_to=None, months=None, seasons=None):
+    """ Create the date filter of the command arguments.
+
+    @param date_from: string object containing the from date (--from), None for an open start.
+    @param date_to: string object containing the to date (--to), None for an open end.
+    @param months: list object containing the month numbers (--months), None for every month.
+    @param seasons: list object containing the season names (--seasons), None for every season.
+    @return: DateFilter object, None when no filter is set.
+    """
+    set_month = set(int(i) for i in months or [])
+    for season in seasons or []:
+        if season.lower() not in SEASONS:
+            raise ValueError("Unknown season: {0} (options: {1})".format(season, ', '.join(SEASONS)))
+        set_month.update(SEASONS[season.lower()])
+
+    for month in set_month:
+        if not 1 <= month <= 12:
+            raise ValueError("Unknown month: {0} (options: 1 to 12)".format(month))
+
+    if date_from is None and date_to is None and not set_month:
+        return None
+
+    date_filter = DateFilter(None if date_from is None else parse_date_bound_fn(date_from),
+                             None if date_to is None else parse_date_bound_fn(date_to, end=True),
+                             frozenset(set_month) if set_month else None)
+    print("Date filter: from {0} to {1}, months {2}".format(
+        date_filter.date_from or 'start', date_filter.date_to or 'end',
+        'all' if date_filter.months is None else ' '.join(str(i) for i in sorted(date_filter.months))))
+
+    return date_filter
+
+
+def range_months_fn(start_date, end_date):
+    """ Return the months covered by a date range.
+
+    @param start_date: datetime.date object.
+    @param end_date: datetime.date object.
+    @return: set object containing the month numbers.
+    """
+    n_months = (end_date.year - start_date.year) * 12 + end_date.month - start_date.month + 1
+
+    return set((start_date.month - 1 + i) % 12 + 1 for i in range(min(max(n_months, 1), 12)))
+
+
+def in_filter_fn(start_date, end_date, date_filter):
+    """ Check whether the date range of an image passes the filter.
+
+    @param start_date: datetime.date object (or ISO string, i.e. a catalog record), None if not parsed.
+    @param end_date: datetime.date object (or ISO string), None if not parsed.
+    @param date_filter: DateFilter object, None for no filter.
+    @return: boolean object.
+    """
+    if date_filter is None:
+        return True
+
+    if start_date is None or end_date is None:
+        return False
+
+    if isinstance(start_date, str):
+        start_date = datetime.date(*(int(i) for i in start_date.split('-')))
+        end_date = datetime.date(*(int(i) for i in end_date.split('-')))
+
+    if date_filter.date_from is not None and start_date < date_filter.date_from:
+        return False
+
+    if date_filter.date_to is not None and end_date > date_filter.date_to:
+        return False
+
+    return date_filter.months is None or range_months_fn(start_date, end_date) <= date_filter.months
+
+
+def filter_images_fn(list_path, date_filter):
+    """ Filter an image list on the dates parsed from the file names.
+
+    @param list_path: list object containing the image paths.
+    @param date_filter: DateFilter object, None for no filter.
+    @return: list object containing the image paths that pass the filter (list order).
+    """
+    if date_filter is None:
+        return list(list_path)
+
+    list_keep = []
+    for image_s in list_path:
+        image_name = image_name_parser.parse_image_name_fn(image_s)
+        if in_filter_fn(image_name.start_date, image_name.end_date, date_filter):
+            list_keep.append(image_s)
+
+    return list_keep
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+
+"""
+image_name_parser.py
+====================
+
+Description: This script parses Landsat product file names (i.e. lztmre_p101r073_m201701201702_h99m3.img or
+l8olre_p101r073_20170120_dbim3_dknmask.img) into an ImageName record (sensor, path, row, date code, start/end date,
+product code, zone and mask suffixes) so that the discovery, zonal stats and pipeline scripts no longer slice the
+file name or the dataset string by position.
+
+The file name is split on '_' and each part is identified by a precompiled regular expression, so extra mask
+suffixes or a missing sensor/tile part do not shift the date. Parts that are not found are returned as None.
+Results are memoized per file name, and parse_image_names_fn parses a whole image list into a dataframe (each
+unique file name is parsed once).
+
+Date codes:
+    mYYYYMMYYYYMM - seasonal (start and end month).
+    YYYY          - annual.
+    YYYYMMDD      - single date.
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# import modules
+from __future__ import print_function, division
+from collections import namedtuple
+from functools import lru_cache
+import calendar
+import datetime
+import re
+import pandas as pd
+
+# path separators of both Windows and posix paths (image lists are written on Windows).
+SEP_RE = re.compile(r'[\\/]')
+
+# file extension(s) removed before the name is split (i.e. .img, .tif, .img.aux.xml).
+EXTENSION_RE = re.compile(r'(\.[a-z]{3,4})+$', re.IGNORECASE)
+
+# date code: seasonal (mYYYYMMYYYYMM), annual (YYYY) or single date (YYYYMMDD).
+DATE_RE = re.compile(r'^(?:m(?P<start>\d{6})(?P<end>\d{6})|(?P<year>\d{4})|(?P<day>\d{8}))$', re.IGNORECASE)
+
+# Landsat path and row (i.e. p101r073 or 101073).
+TILE_RE = re.compile(r'^p?(?P<path>\d{3})r?(?P<row>\d{3})$', re.IGNORECASE)
+
+# product code and zone (i.e. h99m3, dbim3 or fdc).
+PRODUCT_RE = re.compile(r'^(?P<product>[a-z][a-z0-9]{2})(?P<zone>[ma]\d{1,2})?$', re.IGNORECASE)
+
+# name: file name.
+# sensor: sensor and processing stage (i.e. lztmre), None if not found.
+# path, row: strings (i.e. '101', '073'), None if not found.
+# tile: string object (i.e. '101_073'), None if not found.
+# date: date code without the seasonal 'm' (i.e. '201701201702', '2017' or '20170120'), None if not found.
+# date_type: 'seasonal', 'annual' or 'single', None if not found.
+# start_date, end_date: datetime.date objects (first day of the start month, last day of the end month).
+# product: product code (i.e. 'h99'), zone: zone suffix (i.e. 'm3'), None if not found.
+# masks: tuple object containing the mask suffixes following the product (i.e. ('dknmask',)).
+ImageName = namedtuple('ImageName', ['name', 'sensor', 'path', 'row', 'tile', 'date', 'date_type', 'start_date',
+                                     'end_date', 'product', 'zone', 'masks'])
+
+
+def date_range_fn(match):
+    """ Convert a date code match into the date type and the start and end dates.
+
+    @param match: regular expression match object (DATE_RE).
+    @return: tuple object (date code, date type, start date, end date).
+    """
+    if match.group('start'):
+        start, end = match.group('start'), match.group('end')
+        end_year, end_month = int(end[:4]), int(end[4:])
+        return (start + end, 'seasonal', datetime.date(int(start[:4]), int(start[4:]), 1),
+                datetime.date(end_year, end_month, calendar.monthrange(end_year, end_month)[1]))
+
+    if match.group('year'):
+        year = int(match.group('year'))
+        return match.group('year'), 'annual', datetime.date(year, 1, 1), datetime.date(year, 12, 31)
+
+    day = datetime.datetime.strptime(match.group('day'), '%Y%m%d').date()
+
+    return match.group('day'), 'single', day, day
+
+
+@lru_cache(maxsize=None)
+def parse_name_fn(name):
+    """ Parse a Landsat product file name (memoized).
+
+    @param name: string object containing the file name (no directory).
+    @return: ImageName object.
+    """
+    parts = EXTENSION_RE.sub('', name).split('_')
+
+    # the date is the first date code after the sensor (the sensor is only checked when it is the sole candidate).
+    date_position = None
+    for position in list(range(1, len(parts))) + [0]:
+        match = DATE_RE.match(parts[position])
+        if match is not None:
+            try:
+                date, date_type, start_date, end_date = date_range_fn(match)
+            except ValueError:
+                continue
+            date_position = position
+            break
+
+    if date_position is None:
+        date = date_type = start_date = end_date = None
+        date_position = len(parts)
+
+    path = row = tile = sensor = None
+    for position in range(date_position):
+        match = TILE_RE.match(parts[position])
+        if match is not None:
+            path, row = match.group('path'), match.group('row')
+            tile = '{0}_{1}'.format(path, row)
+        elif position == 0:
+            sensor = parts[0].lower()
+
+    product = zone = None
+    masks = ()
+    if date_position < len(parts) - 1:
+        match = PRODUCT_RE.match(parts[date_position + 1])
+        if match is not None:
+            product = match.group('product').lower()
+            zone = match.group('zone').lower() if match.group('zone') else None
+            masks = tuple(i.lower() for i in parts[date_position + 2:] if i)
+
+    return ImageName(name, sensor, path, row, tile, date, date_type, start_date, end_date, product, zone, masks)
+
+
+def parse_image_name_fn(image_s):
+    """ Parse the file name of an image path (Windows or posix).
+
+    @param image_s: string object containing the image path or file name.
+    @return: ImageName object.
+    """
+    return parse_name_fn(SEP_RE.split(image_s.strip())[-1])
+
+
+def parse_image_names_fn(image_list):
+    """ Parse the file names of an image list into a dataframe (one row per image, each unique name parsed once).
+
+    @param image_list: iterable object containing the image paths (i.e. an open csv file, one path per line).
+    @return df: dataframe object with the feature image (path) and the ImageName features, start_date and end_date
+    as datetime64 features.
+    """
+    images = pd.Series([i.strip() for i in image_list if i.strip()], dtype=object)
+    codes, unique_names = pd.factorize(images.str.split(r'[\\/]').str[-1])
+
+    df = pd.DataFrame([parse_name_fn(i) for i in unique_names], columns=ImageName._fields).take(codes)
+    df.index = images.index
+    df.insert(0, 'image', images)
+    for i in ('start_date', 'end_date'):
+        df[i] = pd.to_datetime(df[i])
+
+    return df
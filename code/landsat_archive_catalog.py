@@ -0,0 +1,734 @@
+#!/usr/bin/env python
+
+"""
+landsat_archive_catalog.py
+==========================
+
+Description: This script indexes the Landsat archive into a local SQLite catalog, so that the step1_5 landsat list
+scripts query the catalog for their images instead of each walking the same (network) tile directory.
+
+The first query for a Landsat tile walks the tile directory (<lsat_dir>/<tile>, including the height and density
+sub-directories) once and records every file with its parsed name (image_name_parser), size and modification time.
+Every later query for the tile, for any product, is an indexed query of the catalog. The images are returned in the
+order the walk located them, so the image lists are unchanged.
+
+discover_tile_products_fn classifies every indexed file of a tile against all registered product suffixes
+(<product>m<zone>.img, PRODUCT_SUB_DIRS) in a single pass and returns the image list of each product, so a pipeline
+run discovers the images of every product with one walk and one pass over the tile files. The image lists hold one
+image per acquisition (landsat_image_variants): zone variants, reprocessed versions of an image in another directory
+of the tile and sidecar files are resolved (the tile zone, then the newest version is kept) and reported. A date
+filter (image_date_filter: from/to dates, months and seasons) is applied to the parsed dates of the catalog records,
+so the image lists (and the image count threshold of the step1_5 scripts) only hold the images of the filter.
+
+stream_tile_images_fn yields the images of one product as the tile directory is walked and indexed (the walk runs
+in a producer thread, zonal_image_stream), so the zonal stats stage starts on the first images instead of waiting
+for the walk of the tile. The streamed lists keep the first located variant of an acquisition (STREAM_POLICY),
+whether or not the tile was indexed.
+
+The catalog is held in memory (one walk per tile per run) unless a catalog file is given (--catalog command
+argument), in which case the indexed tiles are re-used by later runs. The modification time and entry count of every
+indexed directory are recorded, and a refresh only lists the directories whose modification time changed since the
+last scan (a file added, removed or renamed in the directory): the file records of a changed directory are replaced,
+new sub-directories are walked and the records of removed directories are deleted. The directory modification times
+are read concurrently (archive_walker.WORKERS), so a refresh of an unchanged archive costs one stat per directory.
+
+Command line:
+    python landsat_archive_catalog.py index -c <catalog> -l <lsat_dir> [-t <tile> ...]
+    python landsat_archive_catalog.py refresh -c <catalog> [-l <lsat_dir> -t <tile> ...]
+
+index walks the tiles (every tile directory of lsat_dir by default) and refresh updates the tiles (every indexed
+tile by default), i.e. as a nightly task so that each pipeline run starts from an up to date catalog.
+
+Tables:
+    images      - path, root (tile directory), directory, sub_dir (first sub-directory below the tile directory, ''
+                  for the tile directory), name, tile, product, date, date_type, start_date, end_date, zone, size and
+                  mtime of each file.
+    directories - path, root, mtime and entries (number of sub-directories and files) of each indexed directory.
+    scans       - root, scanned (time of the last walk or refresh) and files (number of files) of each indexed tile
+                  directory.
+    headers     - path, size and mtime (of the image when the header was read) and the header metadata of each
+                  harvested image (zonal_image_header.header_record_fn).
+    footprints  - path, size, mtime, band, no_data, cell, crs and valid data polygon (WKB) of each image footprint
+                  (landsat_footprint_index), with the bounds of each polygon in the footprint_index R-tree.
+    meta        - key and value of the catalog properties (i.e. the content hash of the loaded snapshot,
+                  landsat_catalog_snapshot).
+
+Image headers (--headers command argument of the pipeline): discover_tile_products_fn(headers=True) harvests the
+header of every discovered image in a thread pool (zonal_image_header) and registers the headers for the zonal stats
+engines, which then plan their reads without opening every image. The headers are stored in the catalog, and are
+only read again from an image whose size or modification time differs from the catalog record.
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# import modules
+from __future__ import print_function, division
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import os
+import sqlite3
+import sys
+import time
+import archive_walker
+import image_date_filter
+import image_name_parser
+import landsat_image_variants
+import zonal_image_header
+import zonal_image_stream
+
+# catalog used when no catalog file is given (one per process).
+MEMORY_CATALOG = ':memory:'
+
+# tile sub-directory searched for each product (None: the whole tile directory), as the step1_5 landsat list scripts.
+PRODUCT_SUB_DIRS = {'h99': 'height', 'hcv': 'height', 'hmc': 'height', 'hsd': 'height', 'h25': 'height',
+                    'fdc': 'density', 'ccw': 'density', 'n17': 'density', 'wdc': None, 'wfp': None}
+
+# largest number of paths per query (sqlite host parameter limit).
+QUERY_PATHS = 500
+
+# variant policy of the streamed image lists (stream_tile_images_fn): the search zone, then the first located image
+# (an image is handed to the zonal stage before its later variants are found).
+STREAM_POLICY = ('zone',)
+
+# open catalog connections (catalog path: connection), shared by the step1_5 scripts of a run.
+CONNECTIONS = {}
+
+# catalog layout version (PRAGMA user_version), catalogs of an older layout are re-built.
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    path TEXT NOT NULL,
+    root TEXT NOT NULL,
+    directory TEXT NOT NULL,
+    sub_dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    tile TEXT,
+    product TEXT,
+    date TEXT,
+    date_type TEXT,
+    start_date TEXT,
+    end_date TEXT,
+    zone TEXT,
+    size INTEGER,
+    mtime REAL
+);
+CREATE INDEX IF NOT EXISTS images_root ON images (root, sub_dir);
+CREATE INDEX IF NOT EXISTS images_product ON images (tile, product, zone);
+CREATE INDEX IF NOT EXISTS images_directory ON images (directory);
+CREATE INDEX IF NOT EXISTS images_path ON images (path);
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    root TEXT NOT NULL,
+    mtime REAL,
+    entries INTEGER
+);
+CREATE INDEX IF NOT EXISTS directories_root ON directories (root);
+CREATE TABLE IF NOT EXISTS scans (
+    root TEXT PRIMARY KEY,
+    scanned REAL,
+    files INTEGER
+);
+CREATE TABLE IF NOT EXISTS headers (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime REAL,
+    width INTEGER,
+    height INTEGER,
+    count INTEGER,
+    dtypes TEXT,
+    nodata TEXT,
+    crs TEXT,
+    a REAL,
+    b REAL,
+    c REAL,
+    d REAL,
+    e REAL,
+    f REAL,
+    block_shapes TEXT,
+    valid_percent TEXT
+);
+CREATE TABLE IF NOT EXISTS footprints (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    size INTEGER,
+    mtime REAL,
+    band INTEGER,
+    no_data TEXT,
+    cell INTEGER,
+    crs TEXT,
+    footprint BLOB
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# spatial index of the footprint bounds (footprints id), a plain table where sqlite is built without the R-tree module.
+FOOTPRINT_INDEX_SCHEMA = "CREATE VIRTUAL TABLE IF NOT EXISTS footprint_index USING rtree(id, minx, maxx, miny, maxy)"
+FOOTPRINT_TABLE_SCHEMA = ("CREATE TABLE IF NOT EXISTS footprint_index (id INTEGER PRIMARY KEY, minx REAL, maxx REAL, "
+                          "miny REAL, maxy REAL)")
+
+
+def open_catalog_fn(catalog_path=None):
+    """ Open (and create if required) a catalog, connections are re-used for the lifetime of the process.
+
+    @param catalog_path: string object containing the path to the catalog file, None for the in memory catalog.
+    @return conn: sqlite3 connection object.
+    """
+    catalog_path = MEMORY_CATALOG if catalog_path is None else catalog_path
+    conn = CONNECTIONS.get(catalog_path)
+    if conn is None:
+        conn = sqlite3.connect(catalog_path)
+        if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            print("Catalog: creating catalog {0} (layout version {1}).".format(catalog_path, SCHEMA_VERSION))
+            conn.executescript("DROP TABLE IF EXISTS images; DROP TABLE IF EXISTS directories; "
+                               "DROP TABLE IF EXISTS scans; DROP TABLE IF EXISTS headers; "
+                               "DROP TABLE IF EXISTS footprints; DROP TABLE IF EXISTS footprint_index; "
+                               "DROP TABLE IF EXISTS meta;")
+            conn.execute("PRAGMA user_version = {0}".format(SCHEMA_VERSION))
+        conn.executescript(SCHEMA)
+        try:
+            conn.execute(FOOTPRINT_INDEX_SCHEMA)
+        except sqlite3.OperationalError:
+            conn.execute(FOOTPRINT_TABLE_SCHEMA)
+        CONNECTIONS[catalog_path] = conn
+
+    return conn
+
+
+def image_record_fn(root, dir_path, entry):
+    """ Create the catalog record of a file.
+
+    @param root: string object containing the indexed tile directory.
+    @param dir_path: string object containing the directory of the file.
+    @param entry: DirEntry object of the file (archive_walker).
+    @return: tuple object (images table column order).
+    """
+    path = os.path.join(dir_path, entry.name)
+    file = entry.name
+    try:
+        stat = entry.stat()
+        size, mtime = stat.st_size, stat.st_mtime
+    except OSError:
+        size = mtime = None
+
+    relative = os.path.relpath(dir_path, root)
+    sub_dir = '' if relative == os.curdir else relative.split(os.sep)[0]
+    image_name = image_name_parser.parse_name_fn(file)
+
+    return (path, root, dir_path, sub_dir, file, image_name.tile, image_name.product, image_name.date,
+            image_name.date_type,
+            None if image_name.start_date is None else image_name.start_date.isoformat(),
+            None if image_name.end_date is None else image_name.end_date.isoformat(), image_name.zone, size, mtime)
+
+
+def entry_mtime_fn(entry):
+    """ Return the modification time of a DirEntry (stat result cached by archive_walker), None if unreadable.
+
+    @param entry: DirEntry object.
+    @return: float object, None if the entry can not be read.
+    """
+    try:
+        return entry.stat().st_mtime
+    except OSError:
+        return None
+
+
+def path_mtime_fn(path):
+    """ Return the modification time of a directory, None if it no longer exists.
+
+    @param path: string object containing the path to the directory.
+    @return: float object, None if the directory can not be read.
+    """
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def walk_directories_fn(root, top, top_mtime):
+    """ Walk a directory tree and create the image and directory records of each directory as it is listed.
+
+    @param root: string object containing the indexed tile directory.
+    @param top: string object containing the path to the directory to walk (root or a directory below root).
+    @param top_mtime: float object containing the modification time of top (read before the walk).
+    @return: generator object yielding a tuple (list object containing the image records, directory record (path,
+    root, mtime, entries)) per directory (walk order).
+    """
+    dir_mtimes = {top: top_mtime}
+
+    for dir_path, list_dir, file_entries in archive_walker.walk_entries_fn(top, stat=True):
+        # the modification time of a directory is read from its entry in the parent listing (before it is listed,
+        # so a change during the walk is listed again by the next refresh).
+        for entry in list_dir:
+            dir_mtimes[entry.path] = entry_mtime_fn(entry)
+        yield ([image_record_fn(root, dir_path, entry) for entry in file_entries],
+               (dir_path, root, dir_mtimes.get(dir_path), len(list_dir) + len(file_entries)))
+
+
+def walk_records_fn(root, top, top_mtime):
+    """ Walk a directory tree and create the image and directory records.
+
+    @param root: string object containing the indexed tile directory.
+    @param top: string object containing the path to the directory to walk (root or a directory below root).
+    @param top_mtime: float object containing the modification time of top (read before the walk).
+    @return list_image: list object containing the image records (walk order).
+    @return list_directory: list object containing the directory records (path, root, mtime, entries).
+    """
+    list_image = []
+    list_directory = []
+    for dir_image, directory in walk_directories_fn(root, top, top_mtime):
+        list_image.extend(dir_image)
+        list_directory.append(directory)
+
+    return list_image, list_directory
+
+
+def update_scan_fn(conn, root):
+    """ Record the time and number of files of the last walk or refresh of a tile directory.
+
+    @param conn: sqlite3 connection object.
+    @param root: string object containing the path to the tile directory.
+    @return: integer object containing the number of files of the tile directory.
+    """
+    files = conn.execute("SELECT count(*) FROM images WHERE root = ?", (root,)).fetchone()[0]
+    conn.execute("INSERT OR REPLACE INTO scans VALUES (?, ?, ?)", (root, time.time(), files))
+    # the catalog no longer matches the snapshot it was loaded from (landsat_catalog_snapshot).
+    conn.execute("DELETE FROM meta WHERE key = 'snapshot'")
+
+    return files
+
+
+def prune_records_fn(conn):
+    """ Delete the headers and footprints of the images that are no longer in the catalog.
+
+    @param conn: sqlite3 connection object.
+    """
+    conn.execute("DELETE FROM headers WHERE path NOT IN (SELECT path FROM images)")
+    conn.execute("DELETE FROM footprints WHERE path NOT IN (SELECT path FROM images)")
+    conn.execute("DELETE FROM footprint_index WHERE id NOT IN (SELECT id FROM footprints)")
+
+
+def index_directory_fn(conn, root):
+    """ Walk a tile directory once (archive_walker, the sub-directories are listed concurrently) and replace its
+    catalog records.
+
+    @param conn: sqlite3 connection object.
+    @param root: string object containing the path to the tile directory.
+    @return: integer object containing the number of indexed files.
+    """
+    start_time = time.time()
+    list_image, list_directory = walk_records_fn(root, root, path_mtime_fn(root))
+
+    with conn:
+        conn.execute("DELETE FROM images WHERE root = ?", (root,))
+        conn.execute("DELETE FROM directories WHERE root = ?", (root,))
+        conn.executemany("INSERT INTO images VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", list_image)
+        conn.executemany("INSERT OR REPLACE INTO directories VALUES (?, ?, ?, ?)", list_directory)
+        prune_records_fn(conn)
+        update_scan_fn(conn, root)
+
+    print("Catalog: indexed {0} files under {1} in {2:.2f} seconds.".format(
+        len(list_image), root, time.time() - start_time))
+
+    return len(list_image)
+
+
+def refresh_directory_fn(conn, root):
+    """ Update the catalog records of a tile directory, listing only the directories whose modification time changed
+    since the last scan. A tile directory that is not in the catalog is indexed.
+
+    @param conn: sqlite3 connection object.
+    @param root: string object containing the path to the tile directory.
+    @return: tuple object (number of listed directories, number of added files, number of removed files).
+    """
+    known = {path: (mtime, entries) for path, mtime, entries in conn.execute(
+        "SELECT path, mtime, entries FROM directories WHERE root = ?", (root,))}
+    if not known:
+        return 1, index_directory_fn(conn, root), 0
+
+    start_time = time.time()
+    list_path = sorted(known)
+    with ThreadPoolExecutor(max_workers=archive_walker.WORKERS) as executor:
+        current = dict(zip(list_path, executor.map(path_mtime_fn, list_path)))
+
+    listed = added = removed = 0
+    with conn:
+        for path in list_path:
+            mtime = current[path]
+            if mtime is not None and mtime == known[path][0]:
+                continue
+
+            # remove the records of the directory (and of the directories below it when it no longer exists).
+            removed += conn.execute("DELETE FROM images WHERE directory = ?", (path,)).rowcount
+            conn.execute("DELETE FROM directories WHERE path = ?", (path,))
+            if mtime is None:
+                continue
+
+            listed += 1
+            try:
+                dir_entries, file_entries = archive_walker.scan_directory_fn(path, stat=True)
+            except OSError:
+                continue
+
+            list_dir = [i for i in dir_entries if i.name not in archive_walker.PRUNE_DIRS]
+            list_image = [image_record_fn(root, path, entry) for entry in file_entries]
+            list_directory = [(path, root, mtime, len(list_dir) + len(file_entries))]
+            for entry in list_dir:
+                if entry.path not in known and not entry.is_symlink():
+                    # new sub-directory: walk it.
+                    sub_image, sub_directory = walk_records_fn(root, entry.path, entry_mtime_fn(entry))
+                    list_image.extend(sub_image)
+                    list_directory.extend(sub_directory)
+                    listed += len(sub_directory)
+
+            conn.executemany("INSERT INTO images VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", list_image)
+            conn.executemany("INSERT OR REPLACE INTO directories VALUES (?, ?, ?, ?)", list_directory)
+            added += len(list_image)
+
+        if removed:
+            prune_records_fn(conn)
+        update_scan_fn(conn, root)
+
+    print("Catalog: refreshed {0} in {1:.2f} seconds ({2} of {3} directories listed, {4} file records added, "
+          "{5} removed).".format(root, time.time() - start_time, listed, len(known), added, removed))
+
+    return listed, added, removed
+
+
+def refresh_fn(catalog_path, roots=None):
+    """ Refresh tile directories of a catalog (every indexed tile directory by default).
+
+    @param catalog_path: string object containing the path to the catalog file, None for the in memory catalog.
+    @param roots: list object containing the paths to the tile directories, None for every indexed tile directory.
+    @return: list object containing the refresh counts of each tile directory (refresh_directory_fn).
+    """
+    conn = open_catalog_fn(catalog_path)
+    if roots is None:
+        roots = [i[0] for i in conn.execute("SELECT root FROM scans ORDER BY root")]
+
+    return [refresh_directory_fn(conn, os.path.normpath(root)) for root in roots]
+
+
+def indexed_root_fn(conn, lsat_dir, lsat_tile):
+    """ Return the tile directory of a Landsat tile, indexing it when it is not in the catalog.
+
+    @param conn: sqlite3 connection object.
+    @param lsat_dir: string object containing the path to the Landsat directory.
+    @param lsat_tile: string object containing the Landsat tile (i.e. '101_073').
+    @return root: string object containing the path to the tile directory (catalog key).
+    """
+    root = os.path.normpath(os.path.join(lsat_dir, lsat_tile))
+    if conn.execute("SELECT 1 FROM scans WHERE root = ?", (root,)).fetchone() is None:
+        index_directory_fn(conn, root)
+
+    return root
+
+
+def date_clause_fn(date_filter):
+    """ Create the query condition of the from and to dates of a date filter (the months are checked per record).
+
+    @param date_filter: DateFilter object (image_date_filter), None for no filter.
+    @return: tuple object (string object containing the condition, list object containing the parameters).
+    """
+    if date_filter is None:
+        return '', []
+
+    clause = ''
+    params = []
+    if date_filter.date_from is not None:
+        clause += " AND start_date >= ?"
+        params.append(date_filter.date_from.isoformat())
+    if date_filter.date_to is not None:
+        clause += " AND end_date <= ?"
+        params.append(date_filter.date_to.isoformat())
+
+    return clause, params
+
+
+def tile_images_fn(lsat_dir, lsat_tile, sub_dir, suffix, catalog_path=None, resolve=True, date_filter=None,
+                   policy=landsat_image_variants.DEFAULT_POLICY):
+    """ Return the images of a Landsat tile that end with suffix, indexing the tile directory on the first request.
+
+    @param lsat_dir: string object containing the path to the Landsat directory (i.e. N:\\Landsat\\wrs2).
+    @param lsat_tile: string object containing the Landsat tile (i.e. '101_073').
+    @param sub_dir: string object containing the tile sub-directory to search (i.e. 'height' or 'density'), None
+    to search the whole tile directory.
+    @param suffix: string object containing the end part of the required file name (i.e. 'h99m2.img').
+    @param catalog_path: string object containing the path to the catalog file, None for the in memory catalog.
+    @param resolve: boolean object, True to keep one image per acquisition (landsat_image_variants).
+    @param date_filter: DateFilter object (image_date_filter), None for every date.
+    @param policy: iterable object containing the variant policy criteria (landsat_image_variants.POLICY_OPTIONS).
+    @return: list object containing the image paths (walk order).
+    """
+    conn = open_catalog_fn(catalog_path)
+    root = indexed_root_fn(conn, lsat_dir, lsat_tile)
+
+    query = "SELECT path, mtime, start_date, end_date FROM images WHERE root = ? AND substr(name, -?) = ?"
+    params = [root, len(suffix), suffix]
+    if sub_dir:
+        query += " AND sub_dir = ?"
+        params.append(sub_dir)
+    clause, clause_params = date_clause_fn(date_filter)
+
+    mtimes = OrderedDict((path, mtime) for path, mtime, start_date, end_date in conn.execute(
+        query + clause + " ORDER BY rowid", params + clause_params)
+        if image_date_filter.in_filter_fn(start_date, end_date, date_filter))
+    if not resolve:
+        return list(mtimes)
+
+    return landsat_image_variants.resolve_variants_fn(list(mtimes), [landsat_image_variants.search_zone_fn(suffix)],
+                                                      policy, mtimes=mtimes)[0]
+
+
+def is_indexed_fn(lsat_dir, lsat_tile, catalog_path=None):
+    """ Check whether a Landsat tile directory is in the catalog.
+
+    @param lsat_dir: string object containing the path to the Landsat directory.
+    @param lsat_tile: string object containing the Landsat tile (i.e. '101_073').
+    @param catalog_path: string object containing the path to the catalog file, None for the in memory catalog.
+    @return: boolean object.
+    """
+    root = os.path.normpath(os.path.join(lsat_dir, lsat_tile))
+
+    return open_catalog_fn(catalog_path).execute("SELECT 1 FROM scans WHERE root = ?", (root,)).fetchone() is not None
+
+
+def stream_tile_images_fn(lsat_dir, lsat_tile, sub_dir, suffix, catalog_path=None, date_filter=None):
+    """ Yield the images of a Landsat tile that end with suffix as they are found (zonal_image_stream).
+
+    A tile directory that is not in the catalog is walked by a producer thread, so the zonal stats of the first images
+    start while the walk goes on. The records are written to the catalog in one transaction once the walk has been
+    read to the end (a walk that is not read to the end is not recorded). An indexed tile is a query of the catalog
+    (tile_images_fn). Both give one image per acquisition by STREAM_POLICY: every matching image has the search zone
+    of the suffix, and the first located variant is kept (a later variant, i.e. a reprocessed version in another
+    directory, is dropped and reported, as the first image has already been handed on).
+
+    @param lsat_dir: string object containing the path to the Landsat directory.
+    @param lsat_tile: string object containing the Landsat tile (i.e. '101_073').
+    @param sub_dir: string object containing the tile sub-directory to search, None for the whole tile directory.
+    @param suffix: string object containing the end part of the required file name (i.e. 'h99m2.img').
+    @param catalog_path: string object containing the path to the catalog file, None for the in memory catalog.
+    @param date_filter: DateFilter object (image_date_filter), None for every date.
+    @return: generator object yielding the image paths (walk order).
+    """
+    if is_indexed_fn(lsat_dir, lsat_tile, catalog_path):
+        for path in tile_images_fn(lsat_dir, lsat_tile, sub_dir, suffix, catalog_path, date_filter=date_filter,
+                                   policy=STREAM_POLICY):
+            yield path
+        return
+
+    start_time = time.time()
+    root = os.path.normpath(os.path.join(lsat_dir, lsat_tile))
+    list_record = []
+    list_directory = []
+    yielded = {}
+    list_duplicate = []
+    # the walk runs in a producer thread, the records are buffered and written by this (catalog connection) thread
+    # after the walk, so no transaction is open while the zonal stage works on the yielded images.
+    item_stream = zonal_image_stream.start_stream_fn(walk_directories_fn(root, root, path_mtime_fn(root)))
+    for list_image, directory in zonal_image_stream.stream_items_fn(item_stream):
+        list_record.extend(list_image)
+        list_directory.append(directory)
+        for record in list_image:
+            path, image_sub_dir, name, start_date, end_date = record[0], record[3], record[4], record[9], record[10]
+            matched = (name.endswith(suffix) and (not sub_dir or image_sub_dir == sub_dir) and
+                       not landsat_image_variants.is_sidecar_fn(path) and
+                       image_date_filter.in_filter_fn(start_date, end_date, date_filter))
+            if not matched:
+                continue
+
+            key = landsat_image_variants.acquisition_key_fn(path)
+            if key in yielded:
+                list_duplicate.append(landsat_image_variants.Duplicate(yielded[key], path, 'order'))
+                continue
+
+            yielded[key] = path
+            yield path
+
+    conn = open_catalog_fn(catalog_path)
+    with conn:
+        conn.execute("DELETE FROM images WHERE root = ?", (root,))
+        conn.execute("DELETE FROM directories WHERE root = ?", (root,))
+        conn.executemany("INSERT INTO images VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", list_record)
+        conn.executemany("INSERT OR REPLACE INTO directories VALUES (?, ?, ?, ?)", list_directory)
+        prune_records_fn(conn)
+        update_scan_fn(conn, root)
+
+    for duplicate in list_duplicate:
+        print(" - dropped {0} (kept {1}, {2})".format(duplicate.dropped, duplicate.kept, duplicate.reason))
+    print("Catalog: indexed {0} files under {1} in {2:.2f} seconds ({3} {4} images streamed).".format(
+        len(list_record), root, time.time() - start_time, len(yielded), suffix))
+
+
+def discover_tile_products_fn(lsat_dir, lsat_tile, zone, products=None, catalog_path=None, headers=False,
+                              resolve=True, report_dir=None, date_filter=None):
+    """ Classify every file of a Landsat tile against the suffix of each product in one pass.
+
+    @param lsat_dir: string object containing the path to the Landsat directory.
+    @param lsat_tile: string object containing the Landsat tile (i.e. '101_073').
+    @param zone: string or integer object containing the zone number (i.e. 2).
+    @param products: dictionary object (product: tile sub-directory or None), default PRODUCT_SUB_DIRS.
+    @param catalog_path: string object containing the path to the catalog file, None for the in memory catalog.
+    @param headers: boolean object, True to harvest and register the header of every discovered image
+    (image_headers_fn).
+    @param resolve: boolean object, True to keep one image per acquisition of each product (landsat_image_variants).
+    @param report_dir: string object containing the directory of the duplicate report (<tile>_duplicate_images.csv),
+    None for no report file.
+    @param date_filter: DateFilter object (image_date_filter), None for every date.
+    @return tile_products: dictionary object (product: list object containing the image paths, walk order).
+    """
+    products = PRODUCT_SUB_DIRS if products is None else products
+    conn = open_catalog_fn(catalog_path)
+    root = indexed_root_fn(conn, lsat_dir, lsat_tile)
+
+    suffixes = {"{0}m{1}.img".format(product, zone): product for product in products}
+    lengths = sorted(set(len(i) for i in suffixes))
+    tile_products = {product: [] for product in products}
+    mtimes = {}
+    clause, clause_params = date_clause_fn(date_filter)
+
+    for path, sub_dir, name, mtime, start_date, end_date in conn.execute(
+            "SELECT path, sub_dir, name, mtime, start_date, end_date FROM images WHERE root = ?" + clause +
+            " ORDER BY rowid", [root] + clause_params):
+        if not image_date_filter.in_filter_fn(start_date, end_date, date_filter):
+            continue
+        for length in lengths:
+            product = suffixes.get(name[-length:])
+            if product is not None and products[product] in (None, sub_dir):
+                tile_products[product].append(path)
+                mtimes[path] = mtime
+
+    if resolve:
+        list_duplicate = []
+        for product, list_path in tile_products.items():
+            tile_products[product], product_duplicate = landsat_image_variants.resolve_variants_fn(
+                list_path, [zone], mtimes=mtimes)
+            list_duplicate.extend(product_duplicate)
+
+        if report_dir is not None:
+            landsat_image_variants.write_duplicates_fn(list_duplicate, os.path.join(
+                report_dir, "{0}_duplicate_images.csv".format(lsat_tile)))
+
+    print("Catalog: {0} images per product: {1}".format(lsat_tile, ', '.join(
+        "{0} {1}".format(product, len(list_path)) for product, list_path in tile_products.items())))
+
+    if headers:
+        image_headers_fn(conn, [path for list_path in tile_products.values() for path in list_path])
+
+    return tile_products
+
+
+def image_headers_fn(conn, list_path, workers=zonal_image_header.WORKERS):
+    """ Return the headers of indexed images and register them for the zonal stats engines (zonal_image_header). The
+    stored header of an image is used while the image size and modification time match the catalog record, the other
+    headers are read from the images in a thread pool and stored.
+
+    @param conn: sqlite3 connection object.
+    @param list_path: list object containing the image paths (catalog records).
+    @param workers: integer object containing the number of headers read concurrently.
+    @return headers: dictionary object (image path: ImageHeader), images that can not be opened are left out.
+    """
+    start_time = time.time()
+    headers = {}
+    list_stale = []
+    stat = {}
+    for start in range(0, len(list_path), QUERY_PATHS):
+        chunk = list_path[start:start + QUERY_PATHS]
+        query = ("SELECT i.path, i.size, i.mtime, h.size, h.mtime, h.width, h.height, h.count, h.dtypes, h.nodata, "
+                 "h.crs, h.a, h.b, h.c, h.d, h.e, h.f, h.block_shapes, h.valid_percent FROM images i "
+                 "LEFT JOIN headers h ON h.path = i.path WHERE i.path IN ({0})".format(', '.join('?' * len(chunk))))
+        for row in conn.execute(query, chunk):
+            path, size, mtime, header_size, header_mtime = row[:5]
+            if header_mtime is not None and (header_size, header_mtime) == (size, mtime):
+                headers[path] = zonal_image_header.record_header_fn(row[5:])
+            else:
+                list_stale.append(path)
+                stat[path] = (size, mtime)
+
+    harvested = zonal_image_header.harvest_headers_fn(list_stale, workers, register=False) if list_stale else {}
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO headers VALUES ({0})".format(', '.join('?' * 17)), [
+            (path,) + stat[path] + zonal_image_header.header_record_fn(header) for path, header in harvested.items()])
+
+    headers.update(harvested)
+    zonal_image_header.register_headers_fn(headers)
+    print("Catalog: {0} image headers ({1} stored, {2} read) in {3:.2f} seconds.".format(
+        len(headers), len(headers) - len(harvested), len(harvested), time.time() - start_time))
+
+    return headers
+
+
+def get_cmd_args_fn():
+    p = argparse.ArgumentParser(
+        description='''Index or refresh the Landsat archive catalog.''')
+
+    p.add_argument('command', choices=['index', 'refresh'],
+                   help="index: walk the tile directories, refresh: list the changed directories only.")
+
+    p.add_argument('-c', '--catalog', help="Enter the path to the catalog file (i.e. C:\\catalog\\wrs2.sqlite).")
+
+    p.add_argument('-l', '--lsat_dir', help="The wrs2 directory containing landsat data", default=None)
+
+    p.add_argument('-t', '--tiles', nargs='+', help="Enter the Landsat tiles (i.e. 101_073 101_074).", default=None)
+
+    cmd_args = p.parse_args()
+
+    if cmd_args.catalog is None or (cmd_args.command == 'index' and cmd_args.lsat_dir is None):
+        p.print_help()
+
+        sys.exit()
+
+    return cmd_args
+
+
+def main_routine():
+    """ Index or refresh the catalog tile directories (command arguments). """
+    cmd_args = get_cmd_args_fn()
+    conn = open_catalog_fn(cmd_args.catalog)
+
+    roots = None
+    if cmd_args.lsat_dir is not None:
+        tiles = cmd_args.tiles
+        if tiles is None:
+            tiles = sorted(i.name for i in os.scandir(cmd_args.lsat_dir) if i.is_dir())
+        roots = [os.path.normpath(os.path.join(cmd_args.lsat_dir, i)) for i in tiles]
+
+    if cmd_args.command == 'index':
+        for root in roots:
+            index_directory_fn(conn, root)
+    else:
+        refresh_fn(cmd_args.catalog, roots)
+
+
+if __name__ == '__main__':
+    main_routine()
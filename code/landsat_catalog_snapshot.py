@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+
+"""
+landsat_catalog_snapshot.py
+===========================
+
+Description: This script exports the Landsat archive catalog (landsat_archive_catalog) to a versioned Parquet
+snapshot on a shared drive, and loads the latest snapshot into the catalog of a pipeline run. Several machines walk
+the same archive (wrs2 and height trees); with a shared snapshot one machine pays for the scan (i.e. a nightly
+refresh followed by an export) and every other run loads the snapshot instead of walking the archive.
+
+A snapshot is a directory of the snapshot directory (snapshot_<build time>_<content hash>) holding one Parquet file
+per catalog table (images, directories, scans, headers and footprints, the footprints with their R-tree bounds) and
+a manifest.json file (layout version, build time, content hash, row count of each table and indexed tile
+directories). The content hash is a SHA-256 hash of the table rows, so snapshots of an unchanged archive share a
+hash. latest.json points at the latest snapshot and is replaced in one step after the snapshot is written, so a
+reader never loads a partly written snapshot. The oldest snapshots are deleted (KEEP_SNAPSHOTS are kept).
+
+load_snapshot_fn loads the latest snapshot when it was built within the staleness window (max_age_hours) and has
+the catalog layout version, and returns None otherwise (the pipeline then refreshes its catalog as before). The
+content hash of the loaded snapshot is recorded in the catalog meta table, so a catalog that already holds the
+snapshot is not loaded again. Reading the Parquet files requires pyarrow.
+
+Command line:
+    python landsat_catalog_snapshot.py export -c <catalog> -s <snapshot_dir>
+    python landsat_catalog_snapshot.py import -c <catalog> -s <snapshot_dir> [-a <max_age_hours>]
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# import modules
+from __future__ import print_function, division
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+import pandas as pd
+import landsat_archive_catalog
+
+# catalog tables of a snapshot (export and load order).
+SNAPSHOT_TABLES = ('images', 'directories', 'scans', 'headers', 'footprints')
+
+# query of each table, ordered so that equal catalogs give equal rows (images in walk order).
+TABLE_QUERIES = {
+    'images': "SELECT * FROM images ORDER BY rowid",
+    'directories': "SELECT * FROM directories ORDER BY path",
+    'scans': "SELECT * FROM scans ORDER BY root",
+    'headers': "SELECT * FROM headers ORDER BY path",
+    'footprints': "SELECT f.*, r.minx, r.maxx, r.miny, r.maxy FROM footprints f "
+                  "LEFT JOIN footprint_index r ON r.id = f.id ORDER BY f.id"}
+
+# footprint_index columns stored with the footprints table.
+BOUNDS_COLUMNS = ['minx', 'maxx', 'miny', 'maxy']
+
+# file pointing at the latest snapshot of the snapshot directory.
+LATEST_FILE = 'latest.json'
+
+# manifest file of a snapshot.
+MANIFEST_FILE = 'manifest.json'
+
+# number of snapshots kept in the snapshot directory.
+KEEP_SNAPSHOTS = 3
+
+# default staleness window of a snapshot (hours since it was built).
+MAX_AGE_HOURS = 24
+
+
+def require_pyarrow_fn():
+    """ Check that the Parquet engine is installed. """
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise ImportError("pyarrow is required for the catalog snapshots, install it or run without a snapshot "
+                          "directory.")
+
+
+def read_tables_fn(conn):
+    """ Read the snapshot tables of a catalog.
+
+    @param conn: sqlite3 connection object.
+    @return: dictionary object (table name: pandas dataframe object).
+    """
+    return {table: pd.read_sql_query(TABLE_QUERIES[table], conn) for table in SNAPSHOT_TABLES}
+
+
+def content_hash_fn(tables):
+    """ Calculate the content hash of the snapshot tables (table names, columns and rows).
+
+    @param tables: dictionary object (table name: pandas dataframe object).
+    @return: string object containing the SHA-256 hex digest.
+    """
+    digest = hashlib.sha256()
+    for table in SNAPSHOT_TABLES:
+        df = tables[table]
+        digest.update(json.dumps([table] + list(df.columns)).encode('utf-8'))
+        if len(df):
+            digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+
+    return digest.hexdigest()
+
+
+def latest_manifest_fn(snapshot_dir):
+    """ Read the manifest of the latest snapshot of a snapshot directory.
+
+    @param snapshot_dir: string object containing the path to the snapshot directory.
+    @return: dictionary object (manifest, with the snapshot directory path as 'path'), None if there is no snapshot.
+    """
+    try:
+        with open(os.path.join(snapshot_dir, LATEST_FILE)) as latest:
+            name = json.load(latest)['snapshot']
+        with open(os.path.join(snapshot_dir, name, MANIFEST_FILE)) as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError, KeyError):
+        return None
+
+    manifest['path'] = os.path.join(snapshot_dir, name)
+
+    return manifest
+
+
+def prune_snapshots_fn(snapshot_dir, keep=KEEP_SNAPSHOTS):
+    """ Delete the oldest snapshots of a snapshot directory.
+
+    @param snapshot_dir: string object containing the path to the snapshot directory.
+    @param keep: integer object containing the number of snapshots kept.
+    """
+    # snapshot names start with the build time, so they sort oldest first.
+    names = sorted(i.name for i in os.scandir(snapshot_dir) if i.is_dir() and i.name.startswith('snapshot_'))
+    for name in names[:max(len(names) - keep, 0)]:
+        shutil.rmtree(os.path.join(snapshot_dir, name), ignore_errors=True)
+
+
+def export_snapshot_fn(catalog_path, snapshot_dir, keep=KEEP_SNAPSHOTS):
+    """ Export a catalog to a new snapshot of the snapshot directory and point latest.json at it.
+
+    @param catalog_path: string object containing the path to the catalog file.
+    @param snapshot_dir: string object containing the path to the snapshot directory (i.e. on the shared drive).
+    @param keep: integer object containing the number of snapshots kept.
+    @return: dictionary object (manifest of the snapshot).
+    """
+    require_pyarrow_fn()
+    start_time = time.time()
+    conn = landsat_archive_catalog.open_catalog_fn(catalog_path)
+    tables = read_tables_fn(conn)
+    content_hash = content_hash_fn(tables)
+
+    built = time.time()
+    name = "snapshot_{0}_{1}".format(time.strftime('%Y%m%dT%H%M%SZ', time.gmtime(built)), content_hash[:12])
+    manifest = {'schema_version': landsat_archive_catalog.SCHEMA_VERSION, 'built': built,
+                'built_utc': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(built)), 'content_hash': content_hash,
+                'rows': {table: len(df) for table, df in tables.items()},
+                'roots': tables['scans']['root'].tolist()}
+
+    # the snapshot is written to a temporary directory and renamed, then latest.json is replaced.
+    if not os.path.isdir(snapshot_dir):
+        os.makedirs(snapshot_dir)
+    temp_dir = os.path.join(snapshot_dir, '_' + name)
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    os.makedirs(temp_dir)
+    for table, df in tables.items():
+        df.to_parquet(os.path.join(temp_dir, table + '.parquet'), index=False)
+    with open(os.path.join(temp_dir, MANIFEST_FILE), 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    if os.path.isdir(os.path.join(snapshot_dir, name)):
+        # the same content exported within the same second.
+        shutil.rmtree(temp_dir)
+    else:
+        os.rename(temp_dir, os.path.join(snapshot_dir, name))
+
+    latest_temp = os.path.join(snapshot_dir, LATEST_FILE + '.tmp')
+    with open(latest_temp, 'w') as latest:
+        json.dump({'snapshot': name}, latest)
+    os.replace(latest_temp, os.path.join(snapshot_dir, LATEST_FILE))
+
+    prune_snapshots_fn(snapshot_dir, keep)
+    print("Snapshot: exported {0} images of {1} tiles to {2} in {3:.2f} seconds.".format(
+        manifest['rows']['images'], len(manifest['roots']), name, time.time() - start_time))
+
+    return manifest
+
+
+def sql_rows_fn(df):
+    """ Convert a dataframe to sqlite rows (python values, None for missing values).
+
+    @param df: pandas dataframe object.
+    @return: list object containing a tuple per row.
+    """
+    return list(df.astype(object).where(df.notna(), None).itertuples(index=False, name=None))
+
+
+def load_snapshot_fn(snapshot_dir, catalog_path=None, max_age_hours=MAX_AGE_HOURS):
+    """ Load the latest snapshot into a catalog when it is fresh enough.
+
+    @param snapshot_dir: string object containing the path to the snapshot directory.
+    @param catalog_path: string object containing the path to the catalog file, None for the in memory catalog.
+    @param max_age_hours: float object containing the staleness window (hours since the snapshot was built).
+    @return: dictionary object (manifest of the loaded snapshot), None if there is no fresh snapshot.
+    """
+    manifest = latest_manifest_fn(snapshot_dir)
+    if manifest is None:
+        print("Snapshot: no snapshot in {0}.".format(snapshot_dir))
+        return None
+
+    age_hours = (time.time() - manifest['built']) / 3600
+    if age_hours > max_age_hours:
+        print("Snapshot: {0} is stale ({1:.1f} hours old, window {2} hours).".format(
+            manifest['path'], age_hours, max_age_hours))
+        return None
+
+    if manifest['schema_version'] != landsat_archive_catalog.SCHEMA_VERSION:
+        print("Snapshot: {0} has layout version {1} (catalog version {2}).".format(
+            manifest['path'], manifest['schema_version'], landsat_archive_catalog.SCHEMA_VERSION))
+        return None
+
+    conn = landsat_archive_catalog.open_catalog_fn(catalog_path)
+    loaded = conn.execute("SELECT value FROM meta WHERE key = 'snapshot'").fetchone()
+    if loaded is not None and loaded[0] == manifest['content_hash']:
+        print("Snapshot: catalog holds {0} ({1:.1f} hours old).".format(manifest['path'], age_hours))
+        return manifest
+
+    require_pyarrow_fn()
+    start_time = time.time()
+    tables = {table: pd.read_parquet(os.path.join(manifest['path'], table + '.parquet'))
+              for table in SNAPSHOT_TABLES}
+
+    with conn:
+        conn.execute("DELETE FROM footprint_index")
+        for table in SNAPSHOT_TABLES:
+            df = tables[table]
+            if table == 'footprints':
+                bounds = df[['id'] + BOUNDS_COLUMNS]
+                df = df.drop(columns=BOUNDS_COLUMNS)
+            conn.execute("DELETE FROM {0}".format(table))
+            conn.executemany("INSERT INTO {0} ({1}) VALUES ({2})".format(
+                table, ', '.join(df.columns), ', '.join('?' * len(df.columns))), sql_rows_fn(df))
+
+        # images without valid data have no footprint_index record.
+        conn.executemany("INSERT INTO footprint_index VALUES (?, ?, ?, ?, ?)",
+                         sql_rows_fn(bounds[bounds['minx'].notna()]))
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('snapshot', ?)", (manifest['content_hash'],))
+
+    print("Snapshot: loaded {0} images of {1} tiles from {2} ({3:.1f} hours old) in {4:.2f} seconds.".format(
+        len(tables['images']), len(manifest['roots']), manifest['path'], age_hours, time.time() - start_time))
+
+    return manifest
+
+
+def get_cmd_args_fn():
+    p = argparse.ArgumentParser(
+        description='''Export the Landsat archive catalog to a shared snapshot, or load the latest snapshot.''')
+
+    p.add_argument('command', choices=['export', 'import'],
+                   help="export: write a new snapshot of the catalog, import: load the latest snapshot.")
+
+    p.add_argument('-c', '--catalog', help="Enter the path to the catalog file (i.e. C:\\catalog\\wrs2.sqlite).")
+
+    p.add_argument('-s', '--snapshot_dir', help="Enter the path to the snapshot directory (i.e. on the shared drive).")
+
+    p.add_argument('-a', '--max_age', type=float, default=MAX_AGE_HOURS,
+                   help="Staleness window of the snapshot in hours (default {0}).".format(MAX_AGE_HOURS))
+
+    cmd_args = p.parse_args()
+
+    if cmd_args.catalog is None or cmd_args.snapshot_dir is None:
+        p.print_help()
+
+        sys.exit()
+
+    return cmd_args
+
+
+def main_routine():
+    """ Export or import a catalog snapshot (command arguments). """
+    cmd_args = get_cmd_args_fn()
+
+    if cmd_args.command == 'export':
+        export_snapshot_fn(cmd_args.catalog, cmd_args.snapshot_dir)
+    elif load_snapshot_fn(cmd_args.snapshot_dir, cmd_args.catalog, cmd_args.max_age) is None:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main_routine()
@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+
+"""
+landsat_footprint_index.py
+==========================
+
+Description: This script records the valid data footprint of each Landsat image (the polygon covering the pixels that
+are not no data) in the Landsat archive catalog (landsat_archive_catalog), so that the images without valid data over
+the sites (sites near a scene edge, or images clouded out over the sites) are left out of the step1_5 image lists
+before the zonal stats read them.
+
+The footprint of an image is calculated once: the valid data mask is read in strips and reduced to cells of
+FOOTPRINT_CELL x FOOTPRINT_CELL pixels, a cell being valid when any of its pixels is valid, and the valid cells are
+polygonised. The footprint therefore always covers every valid pixel (an overview resampled from the image may drop
+a small valid area, so the footprint is not taken from the overviews). The footprints are stored in the catalog with
+their bounds in an R-tree (footprint_index), and are only calculated again for an image whose size or modification
+time differs from the catalog record, or for another band or no data value. An image with a
+STATISTICS_VALID_PERCENT tag of 0 has an empty footprint without being read.
+
+images_with_data_fn returns the images of a list whose footprint intersects a site: the R-tree is queried with the
+bounds of each site (in the crs of each footprint) and the candidates are tested against the site geometries. Images
+that are not in the catalog are always returned.
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# import modules
+from __future__ import print_function, division
+from concurrent.futures import ThreadPoolExecutor
+import json
+import math
+import time
+import numpy as np
+import rasterio
+from rasterio.errors import RasterioIOError
+from rasterio.features import shapes
+from rasterio.windows import Window
+from shapely import wkb
+from shapely.geometry import shape
+from shapely.ops import unary_union
+import landsat_archive_catalog
+import zonal_geometry_cache
+import zonal_image_header
+
+# footprint cell size in pixels (16 x 16 Landsat pixels: 480 m).
+FOOTPRINT_CELL = 16
+
+# footprint cells read per strip.
+STRIP_CELLS = 32
+
+# number of footprints calculated concurrently.
+WORKERS = 8
+
+
+def valid_cells_fn(srci, band, no_data, cell):
+    """ Read the valid data mask of an image in strips and reduce it to cells (valid when any pixel is valid).
+
+    @param srci: open rasterio dataset.
+    @param band: integer object containing the band number.
+    @param no_data: no data value (NaN values are also no data), None to use the dataset mask.
+    @param cell: integer object containing the cell size in pixels.
+    @return cells: boolean numpy array object (cell rows x cell columns).
+    """
+    n_cols = int(math.ceil(srci.width / cell))
+    cells = np.zeros((int(math.ceil(srci.height / cell)), n_cols), dtype=bool)
+    strip = cell * STRIP_CELLS
+
+    for row_off in range(0, srci.height, strip):
+        window = Window(0, row_off, srci.width, min(strip, srci.height - row_off))
+        if no_data is None:
+            valid = srci.read_masks(band, window=window) > 0
+        else:
+            array = srci.read(band, window=window)
+            valid = array != no_data
+            if array.dtype.kind == 'f':
+                valid &= ~np.isnan(array)
+
+        n_rows = int(math.ceil(valid.shape[0] / cell))
+        padded = np.zeros((n_rows * cell, n_cols * cell), dtype=bool)
+        padded[:valid.shape[0], :valid.shape[1]] = valid
+        cells[row_off // cell:row_off // cell + n_rows] = padded.reshape(n_rows, cell, n_cols, cell).any(axis=(1, 3))
+
+    return cells
+
+
+def footprint_fn(image, band=1, no_data=None, cell=FOOTPRINT_CELL):
+    """ Calculate the valid data footprint of an image.
+
+    @param image: string object containing the path to the image.
+    @param band: integer object containing the band number.
+    @param no_data: no data value, None to use the dataset mask.
+    @param cell: integer object containing the cell size in pixels.
+    @return crs: string object containing the crs of the image ('EPSG:<code>' or WKT), None if undefined.
+    @return footprint: shapely geometry object in the image crs, None if the image has no valid data.
+    """
+    with rasterio.open(image) as srci:
+        crs_key = zonal_geometry_cache.crs_key_fn(srci.crs if srci.crs else None)
+        crs = 'EPSG:{0}'.format(crs_key) if isinstance(crs_key, int) else crs_key
+        if zonal_image_header.valid_percent_fn(srci.tags(band)) == 0:
+            return crs, None
+
+        cells = valid_cells_fn(srci, band, no_data, cell)
+        if not cells.any():
+            return crs, None
+
+        transform = srci.transform * rasterio.Affine.scale(cell)
+
+    footprint = unary_union([shape(geometry) for geometry, _ in shapes(cells.astype(np.uint8), mask=cells,
+                                                                       transform=transform)])
+
+    return crs, footprint
+
+
+def footprint_record_fn(image, band, no_data, cell):
+    """ Calculate the footprint of an image for the catalog, reporting an image that can not be opened.
+
+    @param image: string object containing the path to the image.
+    @param band: integer object containing the band number.
+    @param no_data: no data value, None to use the dataset mask.
+    @param cell: integer object containing the cell size in pixels.
+    @return: tuple object (crs, footprint) (footprint_fn), None if the image can not be opened.
+    """
+    try:
+        return footprint_fn(image, band, no_data, cell)
+    except (RasterioIOError, OSError) as error:
+        print("Footprint: unable to read {0}: {1}".format(image, error))
+        return None
+
+
+def index_footprints_fn(conn, list_path, band=1, no_data=None, cell=FOOTPRINT_CELL, workers=WORKERS):
+    """ Calculate and store the footprints of the catalog images that have no current footprint.
+
+    @param conn: sqlite3 connection object (landsat_archive_catalog.open_catalog_fn).
+    @param list_path: list object containing the image paths.
+    @param band: integer object containing the band number.
+    @param no_data: no data value, None to use the dataset mask.
+    @param cell: integer object containing the cell size in pixels.
+    @param workers: integer object containing the number of footprints calculated concurrently.
+    @return footprints: dictionary object (image path: footprint id) of the catalog images with a stored footprint.
+    """
+    start_time = time.time()
+    no_data_key = json.dumps(no_data)
+    footprints = {}
+    stat = {}
+    for start in range(0, len(list_path), landsat_archive_catalog.QUERY_PATHS):
+        chunk = list_path[start:start + landsat_archive_catalog.QUERY_PATHS]
+        query = ("SELECT i.path, i.size, i.mtime, f.id, f.size, f.mtime, f.band, f.no_data, f.cell FROM images i "
+                 "LEFT JOIN footprints f ON f.path = i.path WHERE i.path IN ({0})".format(', '.join('?' * len(chunk))))
+        for path, size, mtime, footprint_id, footprint_size, footprint_mtime, footprint_band, footprint_no_data, \
+                footprint_cell in conn.execute(query, chunk):
+            if footprint_id is not None and (footprint_size, footprint_mtime, footprint_band, footprint_no_data,
+                                             footprint_cell) == (size, mtime, band, no_data_key, cell):
+                footprints[path] = footprint_id
+            else:
+                stat[path] = (size, mtime)
+
+    list_stale = list(stat)
+    if list_stale:
+        with ThreadPoolExecutor(max_workers=max(min(int(workers), len(list_stale)), 1)) as executor:
+            list_record = list(executor.map(lambda path: footprint_record_fn(path, band, no_data, cell), list_stale))
+
+        with conn:
+            for path, record in zip(list_stale, list_record):
+                conn.execute("DELETE FROM footprint_index WHERE id IN (SELECT id FROM footprints WHERE path = ?)",
+                             (path,))
+                conn.execute("DELETE FROM footprints WHERE path = ?", (path,))
+                if record is None:
+                    continue
+
+                crs, footprint = record
+                footprint_id = conn.execute(
+                    "INSERT INTO footprints (path, size, mtime, band, no_data, cell, crs, footprint) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (path,) + stat[path] + (
+                        band, no_data_key, cell, crs, None if footprint is None else footprint.wkb)).lastrowid
+                if footprint is not None:
+                    minx, miny, maxx, maxy = footprint.bounds
+                    conn.execute("INSERT INTO footprint_index VALUES (?, ?, ?, ?, ?)",
+                                 (footprint_id, minx, maxx, miny, maxy))
+                footprints[path] = footprint_id
+
+    print("Footprint: {0} footprints ({1} calculated) in {2:.2f} seconds.".format(
+        len(footprints), len(list_stale), time.time() - start_time))
+
+    return footprints
+
+
+def images_with_data_fn(list_path, sites, band=1, no_data=None, catalog_path=None, cell=FOOTPRINT_CELL,
+                        workers=WORKERS):
+    """ Return the images whose valid data footprint intersects at least one site, calculating the missing
+    footprints first. Images that are not in the catalog are returned (their footprint is unknown).
+
+    @param list_path: list object containing the image paths (landsat_archive_catalog records).
+    @param sites: string object containing the path to the site shapefile, a geo-dataframe or a SiteCache.
+    @param band: integer object containing the band number.
+    @param no_data: no data value, None to use the dataset mask.
+    @param catalog_path: string object containing the path to the catalog file, None for the in memory catalog.
+    @param cell: integer object containing the cell size in pixels.
+    @param workers: integer object containing the number of footprints calculated concurrently.
+    @return: list object containing the image paths with valid data over the sites (list order).
+    """
+    list_path = list(list_path)
+    conn = landsat_archive_catalog.open_catalog_fn(catalog_path)
+    footprints = index_footprints_fn(conn, list_path, band, no_data, cell, workers)
+    site_cache = zonal_geometry_cache.site_cache_fn(sites)
+
+    # footprint ids of the images by crs (images without valid data have no footprint_index record).
+    crs_ids = {}
+    id_path = {footprint_id: path for path, footprint_id in footprints.items()}
+    list_id = list(id_path)
+    for start in range(0, len(list_id), landsat_archive_catalog.QUERY_PATHS):
+        chunk = list_id[start:start + landsat_archive_catalog.QUERY_PATHS]
+        for footprint_id, crs in conn.execute("SELECT id, crs FROM footprints WHERE footprint IS NOT NULL AND id IN "
+                                              "({0})".format(', '.join('?' * len(chunk))), chunk):
+            crs_ids.setdefault(crs, set()).add(footprint_id)
+
+    keep = set(path for path in list_path if path not in footprints)
+    for crs, ids in crs_ids.items():
+        sites_crs = zonal_geometry_cache.sites_in_crs_fn(site_cache, crs)
+        candidates = set()
+        for minx, miny, maxx, maxy in sites_crs.bounds.values:
+            candidates.update(i[0] for i in conn.execute(
+                "SELECT id FROM footprint_index WHERE minx <= ? AND maxx >= ? AND miny <= ? AND maxy >= ?",
+                (maxx, minx, maxy, miny)))
+        candidates &= ids
+        if not candidates:
+            continue
+
+        site_union = unary_union(list(sites_crs.geometry.values))
+        for footprint_id in candidates:
+            footprint = conn.execute("SELECT footprint FROM footprints WHERE id = ?", (footprint_id,)).fetchone()[0]
+            if wkb.loads(bytes(footprint)).intersects(site_union):
+                keep.add(id_path[footprint_id])
+
+    list_keep = [path for path in list_path if path in keep]
+    print("Footprint: {0} of {1} images with valid data over {2} sites.".format(
+        len(list_keep), len(list_path), len(site_cache.source)))
+
+    return list_keep
+
+
+def filter_tile_products_fn(tile_products, sites, band=1, no_data=None, catalog_path=None):
+    """ Filter the image list of every product to the images with valid data over the sites (one footprint pass over
+    every product).
+
+    @param tile_products: dictionary object (product: list object containing the image paths), i.e.
+    landsat_archive_catalog.discover_tile_products_fn.
+    @param sites: string object containing the path to the site shapefile, a geo-dataframe or a SiteCache.
+    @param band: integer object containing the band number.
+    @param no_data: no data value, None to use the dataset mask.
+    @param catalog_path: string object containing the path to the catalog file, None for the in memory catalog.
+    @return: dictionary object (product: list object containing the image paths with valid data over the sites).
+    """
+    keep = set(images_with_data_fn([path for list_path in tile_products.values() for path in list_path], sites, band,
+                                   no_data, catalog_path))
+
+    return {product: [path for path in list_path if path in keep] for product, list_path in tile_products.items()}
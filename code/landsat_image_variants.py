@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+
+"""
+landsat_image_variants.py
+=========================
+
+Description: This script resolves the variants of a Landsat acquisition in an image list, so that the same scene is
+only processed once per product. The archive holds the same acquisition as zone variants (i.e. ..._h99m2.img and
+..._h99m3.img for a tile that straddles a zone boundary), as reprocessed versions (the same file name in another
+directory of the tile) and with sidecar files (.img.aux.xml, .ovr), and the step1_5 scripts that accept two search
+suffixes listed every variant.
+
+The images are grouped by acquisition identity, parsed from the file name (image_name_parser): sensor, tile, date
+code, product and mask suffixes (the zone is the variant). One image per acquisition is kept, chosen by the policy
+criteria in order:
+
+    zone   - the preferred zone(s) first (i.e. the native zone of the tile, or the zone of the first search suffix).
+    newest - the most recently modified image first (reprocessed versions).
+
+Remaining ties keep the first image of the list (walk order). Sidecar files are never kept, and an image whose name
+can not be parsed is its own acquisition (only an identical file name in another directory is a variant). Every
+dropped variant is reported (printed, and written to a csv file when a report path is given).
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# import modules
+from __future__ import print_function, division
+from collections import namedtuple, OrderedDict
+import csv
+import os
+import image_name_parser
+
+# variant policy criteria (applied in order).
+POLICY_OPTIONS = ('zone', 'newest')
+DEFAULT_POLICY = ('zone', 'newest')
+
+# sidecar files of an image (never processed).
+SIDECAR_SUFFIXES = ('.aux.xml', '.ovr', '.rrd')
+
+# kept: path of the image kept for the acquisition.
+# dropped: path of the variant left out.
+# reason: string object, the policy criterion that decided ('zone', 'newest' or 'order').
+Duplicate = namedtuple('Duplicate', ['kept', 'dropped', 'reason'])
+
+
+def zone_suffix_fn(zone):
+    """ Normalise a zone to its file name suffix.
+
+    @param zone: string or integer object containing the zone (i.e. 2, '2' or 'm2').
+    @return: string object (i.e. 'm2'), None if zone is None.
+    """
+    if zone is None:
+        return None
+
+    zone = str(zone).lower()
+
+    return zone if zone[:1] in ('m', 'a') else 'm' + zone
+
+
+def search_zone_fn(suffix):
+    """ Return the zone of a file name search suffix (i.e. 'dilm2_zstdmask.img' > 'm2').
+
+    @param suffix: string object containing the end part of a file name.
+    @return: string object, None if the suffix holds no product and zone part.
+    """
+    for part in image_name_parser.EXTENSION_RE.sub('', suffix).split('_'):
+        match = image_name_parser.PRODUCT_RE.match(part)
+        if match is not None and match.group('zone'):
+            return match.group('zone').lower()
+
+    return None
+
+
+def is_sidecar_fn(image_s):
+    """ Check whether a path is the sidecar file of an image (i.e. .img.aux.xml).
+
+    @param image_s: string object containing the path.
+    @return: boolean object.
+    """
+    return image_s.lower().endswith(SIDECAR_SUFFIXES)
+
+
+def acquisition_key_fn(image_s):
+    """ Create the acquisition identity of an image from its file name (the zone and directory are variants).
+
+    @param image_s: string object containing the image path.
+    @return: tuple object (sensor, tile, date, product, masks), or (file name,) when the date or product can not be
+    parsed.
+    """
+    image_name = image_name_parser.parse_image_name_fn(image_s)
+    if image_name.date is None or image_name.product is None:
+        return (image_name.name,)
+
+    return image_name.sensor, image_name.tile, image_name.date, image_name.product, image_name.masks
+
+
+def image_mtime_fn(image_s, mtimes=None):
+    """ Return the modification time of an image.
+
+    @param image_s: string object containing the image path.
+    @param mtimes: dictionary object (path: modification time), i.e. from the archive catalog, None to stat the file.
+    @return: float object, None if unknown.
+    """
+    if mtimes is not None and image_s in mtimes:
+        return mtimes[image_s]
+
+    try:
+        return os.path.getmtime(image_s)
+    except OSError:
+        return None
+
+
+def resolve_variants_fn(list_path, zones=None, policy=DEFAULT_POLICY, mtimes=None, report_csv=None):
+    """ Keep one image per acquisition and report the dropped variants.
+
+    @param list_path: list object containing the image paths.
+    @param zones: list object containing the preferred zones in order (i.e. [2] or ['m2', 'm3']), None for no
+    preference.
+    @param policy: iterable object containing the policy criteria in order (POLICY_OPTIONS).
+    @param mtimes: dictionary object (path: modification time), None to stat the files (newest criterion).
+    @param report_csv: string object containing the path to the duplicate report csv file, None for no file.
+    @return list_keep: list object containing the kept image paths (list order).
+    @return list_duplicate: list object containing a Duplicate record for each dropped variant.
+    """
+    for criterion in policy:
+        if criterion not in POLICY_OPTIONS:
+            raise ValueError("Unknown variant policy: {0} (options: {1})".format(criterion, ', '.join(POLICY_OPTIONS)))
+
+    zone_rank = {zone_suffix_fn(zone): rank for rank, zone in enumerate(zones or [])}
+    groups = OrderedDict()
+    for position, image_s in enumerate(list_path):
+        if not is_sidecar_fn(image_s):
+            groups.setdefault(acquisition_key_fn(image_s), []).append(position)
+
+    def rank_fn(position):
+        image_s = list_path[position]
+        rank = []
+        for criterion in policy:
+            if criterion == 'zone':
+                rank.append(zone_rank.get(image_name_parser.parse_image_name_fn(image_s).zone, len(zone_rank)))
+            else:
+                mtime = image_mtime_fn(image_s, mtimes)
+                rank.append(float('inf') if mtime is None else -mtime)
+
+        return rank + [position]
+
+    keep = set()
+    list_duplicate = []
+    for positions in groups.values():
+        if len(positions) == 1:
+            keep.add(positions[0])
+            continue
+
+        ranks = {position: rank_fn(position) for position in positions}
+        kept = min(positions, key=ranks.get)
+        keep.add(kept)
+        for position in positions:
+            if position == kept:
+                continue
+
+            # the first criterion that tells the kept image and the variant apart.
+            reason = 'order'
+            for criterion, kept_rank, rank in zip(policy, ranks[kept], ranks[position]):
+                if kept_rank != rank:
+                    reason = criterion
+                    break
+            list_duplicate.append(Duplicate(list_path[kept], list_path[position], reason))
+
+    list_keep = [image_s for position, image_s in enumerate(list_path) if position in keep]
+    n_sidecar = sum(1 for image_s in list_path if is_sidecar_fn(image_s))
+    if list_duplicate or n_sidecar:
+        print("Variants: kept {0} of {1} images ({2} duplicate variants, {3} sidecar files).".format(
+            len(list_keep), len(list_path), len(list_duplicate), n_sidecar))
+        for duplicate in list_duplicate:
+            print(" - dropped {0} (kept {1}, {2})".format(duplicate.dropped, duplicate.kept, duplicate.reason))
+
+    if report_csv is not None:
+        write_duplicates_fn(list_duplicate, report_csv)
+
+    return list_keep, list_duplicate
+
+
+def write_duplicates_fn(list_duplicate, report_csv):
+    """ Write the dropped variants to a csv file (kept, dropped and reason features).
+
+    @param list_duplicate: list object containing Duplicate records.
+    @param report_csv: string object containing the path to the csv file.
+    """
+    with open(report_csv, "w") as output:
+        writer = csv.writer(output, lineterminator='\n')
+        writer.writerow(Duplicate._fields)
+        writer.writerows(list_duplicate)
@@ -1,17 +1,19 @@
 #!/usr/bin/env python
 
 from __future__ import print_function, division
-import fiona
 import rasterio
 import pandas as pd
 from rasterstats import zonal_stats
 import geopandas as gpd
 import warnings
 import os
-from glob import glob
+from collections import namedtuple
 import numpy as np
-import calendar
-import shutil
+from zonal_stats_clean import time_stamp_fn
+import zonal_zone_index
+import zonal_categorical_stats
+import zonal_geometry_cache
+import image_name_parser
 
 warnings.filterwarnings("ignore")
 
@@ -57,108 +59,30 @@ SOFTWARE.
 ========================================================================================================
 '''
 
+# im_name, date: file name and date of the image.
+# stats: float32 matrix of the categorical zonal stats (one row per site, zonal_categorical_stats.category_header_fn).
+# uid, site: numpy arrays containing the site identifiers of the matrix rows.
+CategoryResult = namedtuple('CategoryResult', ['im_name', 'date', 'stats', 'uid', 'site'])
 
-def time_stamp_fn(output_zonal_stats):
-    """Insert a timestamp into feature position 4, convert timestamp into year, month and day strings and append to
-    dataframe.
 
-    @param output_zonal_stats: dataframe object containing the Landsat tile Fractional Cover zonal stats
-    @return output_zonal_stats: processed dataframe object containing the Landsat tile Fractional Cover zonal stats and
-    updated features.
-    """
-
-    s_year_ = []
-    s_month_ = []
-    s_day_ = []
-    s_date_ = []
-    e_year_ = []
-    e_month_ = []
-    e_day_ = []
-    e_date_ = []
-
-    # import calendar
-    print("init time stamp")
-    # Convert the date to a time stamp
-
-    # output_zonal_stats.astype({'date': 'string'}).dtypes
-
-    for n in output_zonal_stats.date:
-        print("n: ", n)
-        i = str(n)
-        print("i: ", i)
-        s_year = i[:4]
-        s_month = i[4:6]
-        s_day = "01"
-        s_date = str(s_year) + str(s_month) + str(s_day)
-
-        s_year_.append(s_year)
-        s_month_.append(s_month)
-        s_day_.append(s_day)
-        s_date_.append(s_date)
-
-        e_year = i[6:10]
-        e_month = i[10:12]
-        m, d = calendar.monthrange(int(e_year), int(e_month))
-        e_day = str(d)
-        if len(e_day) < 1:
-            d_ = "0" + str(d)
-        else:
-            d_ = str(d)
-
-        e_date = str(e_year) + str(e_month) + str(d_)
-
-        e_year_.append(e_year)
-        e_month_.append(e_month)
-        e_day_.append(e_day)
-        e_date_.append(e_date)
-
-    output_zonal_stats.insert(4, 'e_date', e_date_)
-    output_zonal_stats.insert(4, 'e_year', e_year_)
-    output_zonal_stats.insert(4, 'e_month', e_month_)
-    output_zonal_stats.insert(4, 'e_day', e_day_)
-
-    output_zonal_stats.insert(4, 's_date', s_date_)
-    output_zonal_stats.insert(4, 's_year', s_year_)
-    output_zonal_stats.insert(4, 's_month', s_month_)
-    output_zonal_stats.insert(4, 's_day', s_day_)
+def image_date_fn(im_name):
+    """ Extract the date string from a dka image name (seasonal 'mYYYYMMYYYYMM', annual 'YYYY' or single date).
 
-    pd.to_datetime(output_zonal_stats.s_date, format='%Y%m%d')
-
-    pd.to_datetime(output_zonal_stats.e_date, format='%Y%m%d')
-
-    return output_zonal_stats
-
-
-def project_shapefile_gcs_wgs84_fn(albers, geo_df):
-    """ Re-project a shapefile to 'GCSWGS84' to match the projection of the max_temp data.
-    @param gcs_wgs84_dir: string object containing the path to the subdirectory located in the temporary_dir\gcs_wgs84
-    @return:
+    @param im_name: string object containing the image file name.
+    @return im_date: string object containing the image date.
     """
+    image_name = image_name_parser.parse_image_name_fn(im_name)
+    print("{0} date".format(image_name.date_type))
 
-    # read in shp as a geoDataFrame.
-    # df = gpd.read_file(zonal_stats_ready_dir + '\\' + complete_tile + '_by_tile.shp')
-
-    # project to Australian Albers
-    cgs_df = geo_df.to_crs(epsg=3577)
+    return image_name.date
 
-    # define crs file/path name variable.
-    crs_name = 'albers'
 
-    # Export re-projected shapefiles.
-    projected_shape_path = albers + '\\' + 'geo_df_' + str(crs_name) + '.shp'
-
-    # Export re-projected shapefiles.
-    cgs_df.to_file(projected_shape_path)
-
-    return cgs_df, projected_shape_path
-
-
-def apply_zonal_stats_fn(image_s, projected_shape_path, uid, variable, no_data, dis_temp_dir_bands):
+def apply_zonal_stats_fn(image_s, site_cache, uid, variable, no_data):
     """
     Derive zonal stats for a list of Landsat imagery.
 
     @param image_s: string object containing the file path to the current max_temp tiff.
-    @param projected_shape_path: string object containing the path to the current 1ha shapefile path.
+    @param site_cache: SiteCache object, geo-dataframe or shapefile path containing the 1ha sites.
     @param uid: ODK 1ha dataframe feature (unique numeric identifier)
     @return final_results: list object containing the specified zonal statistic values.
     """
@@ -199,103 +123,123 @@ def apply_zonal_stats_fn(image_s, projected_shape_path, uid, variable, no_data,
 
         # array = array - 100
 
-        # open the 'GCSWGS84' projected shapefile (1ha sites)
-        with fiona.open(projected_shape_path) as src:
+        # 1ha sites in the crs of the current image (re-projected once per crs).
+        src = zonal_geometry_cache.sites_in_crs_fn(zonal_geometry_cache.site_cache_fn(site_cache), srci.crs)
 
-            cmap = {1: 'jan', 2: 'feb', 3: 'mar', 4: 'april', 5: 'may', 6: 'june',
-                    7: 'july', 8: 'aug', 9: 'sep', 10: 'oct', 11: 'nov', 12: 'dec'}
+        cmap = {1: 'jan', 2: 'feb', 3: 'mar', 4: 'april', 5: 'may', 6: 'june',
+                7: 'july', 8: 'aug', 9: 'sep', 10: 'oct', 11: 'nov', 12: 'dec'}
 
-            zs = zonal_stats(src, array, affine=affine, nodata=no_data,
-                             stats=['count', 'min', 'max', 'mean', 'sum', 'std', 'median', 'majority', 'minority'],
-                             categorical=True, category_map=cmap, all_touched=True)
+        zs = zonal_stats(list(src.geometry), array, affine=affine, nodata=no_data,
+                         stats=['count', 'min', 'max', 'mean', 'sum', 'std', 'median', 'majority', 'minority'],
+                         categorical=True, category_map=cmap, all_touched=True)
 
-            print(zs)
+        print(zs)
 
-            path_, im_name = os.path.split(image_s)
-            print("path_: ", path_)
-            print("im_name: ", im_name)
-            im_name_list.append(im_name)
+        path_, im_name = os.path.split(image_s)
+        print("path_: ", path_)
+        print("im_name: ", im_name)
+        im_name_list.append(im_name)
 
-            image_name_split = im_name.split("_")
-            print(len(image_name_split[-2]))
+        im_date = image_date_fn(im_name)
+        im_date_st = str(im_date)
 
+        print("im_date: ", im_date)
+        im_date_list.append(str(im_date))
 
-            if str(image_name_split[-2]).startswith("m"):
-                print("seasonal")
-                im_date = str(image_name_split[-2][1:])
-                im_date_st = str(im_date)
+        df = pd.DataFrame.from_records(zs)
 
-            elif len(image_name_split[-2])==4:
-                print("annual date")
-                im_date = str(image_name_split[-2])
-                im_date_st = str(im_date)
+        df.insert(0, 'dka_image', im_name)
+        df.insert(0, 'date', str(im_date_st))
+        print("-" * 50)
+        print("df: ", df)
+        print("df shape: ", df.shape)
 
-            else:
-                print("single date")
-                im_date = str(image_name_split[-2])
-                im_date_st = str(im_date)
+        # extract out the site number for the polygon
 
-            print("im_date: ", im_date)
-            im_date_list.append(str(im_date))
+        for ident, site in zip(src[uid], src['site_name']):
+            uid_list.append(ident)
+            site_list.append(site)
+            image_name_list.append(im_name)
 
-            df = pd.DataFrame.from_records(zs)
+        df["uid"] = uid_list
+        df["site"] = site_list
+        band = 1
+        df["band"] = 1
 
-            df.insert(0, 'dka_image', im_name)
-            df.insert(0, 'date', str(im_date_st))
-            print("-" * 50)
-            print("df: ", df)
-            print("df shape: ", df.shape)
+        header = ['uid', 'site', 'count', 'min', 'max', 'mean', 'sum', 'std', 'median', 'majority', 'minority',
+                  'jan', 'feb', 'mar', 'april', 'may', 'june',
+                'july', 'aug', 'sep', 'oct', 'nov', 'dec']
 
-            # extract out the site number for the polygon
+        for i in header:
+            if not i in df.columns:
+                df[i] = np.nan
 
-            for i in src:
-                table_attributes = i['properties']  # reads in the attribute table for each record
+        numeric = ['count', 'min', 'max', 'mean', 'sum', 'std', 'median', 'majority', 'minority',
+                   'jan', 'feb', 'mar', 'april', 'may', 'june',
+                'july', 'aug', 'sep', 'oct', 'nov', 'dec']
 
-                ident = table_attributes[
-                    uid]
-                uid_list.append(
-                    ident)  # reads in the id field from the attribute table and prints out the selected record
+        for i in numeric:
+            df[i] = df[i].astype(float)
 
-                site = table_attributes['site_name']
-                site_list.append(site)
+        # df.to_csv(os.path.join(dis_temp_dir_bands, "band{0}".format(str(band)), image_results), index=False)
+        df_list.append(df)
 
-                # details = [ident, site, im_date]
+        srci.close()
 
-                # site_id_list.append(details)
-                # image_used = [file_name_final]
-                image_name_list.append(im_name)
+    final_df = pd.concat(df_list)
+    print(final_df)
+    # final_df.to_csv(r"Z:\Scratch\Zonal_Stats_Pipeline\non_rmb_fractional_cover_zonal_stats\{0}_test.csv".format(str(im_date)))
+    # final_results = None
+    return final_df
 
-            df["uid"] = uid_list
-            df["site"] = site_list
-            band = 1
-            df["band"] = 1
 
-            header = ['uid', 'site', 'count', 'min', 'max', 'mean', 'sum', 'std', 'median', 'majority', 'minority',
-                      'jan', 'feb', 'mar', 'april', 'may', 'june',
-                    'july', 'aug', 'sep', 'oct', 'nov', 'dec']
+def apply_categorical_zonal_stats_fn(image_s, site_cache, uid, variable, no_data, zone_cache):
+    """
+    Derive the categorical (month of burn) zonal stats for a dka image using the bincount engine, falling back to
+    apply_zonal_stats_fn (rasterstats) when the image does not contain integer class values.
 
-            for i in header:
-                if not i in df.columns:
-                    df[i] = np.nan
+    @param image_s: string object containing the file path to the current dka image.
+    @param site_cache: SiteCache object (zonal_geometry_cache) containing the 1ha sites.
+    @param uid: ODK 1ha dataframe feature (unique numeric identifier)
+    @param zone_cache: dictionary object caching the zone index per pixel grid and crs.
+    @return: CategoryResult object (bincount engine), or a dataframe object containing the zonal stats for each site
+    (rasterstats).
+    """
+    path_, im_name = os.path.split(image_s)
+    im_date = image_date_fn(im_name)
 
-            numeric = ['count', 'min', 'max', 'mean', 'sum', 'std', 'median', 'majority', 'minority',
-                       'jan', 'feb', 'mar', 'april', 'may', 'june',
-                    'july', 'aug', 'sep', 'oct', 'nov', 'dec']
+    with rasterio.open(image_s) as srci:
+        cgs_df = zonal_geometry_cache.sites_in_crs_fn(site_cache, srci.crs)
+        zone_index = zonal_zone_index.zone_index_cache_fn(zone_cache, cgs_df.geometry.values, srci.transform,
+                                                          srci.width, srci.height, all_touched=True,
+                                                          crs=srci.crs)
+        array = zonal_zone_index.read_zone_window_fn(srci, zone_index, 1)
 
-            for i in numeric:
-                df[i] = df[i].astype(float)
+    try:
+        stats = zonal_categorical_stats.categorical_zonal_stats_fn(array, zone_index, no_data)
+    except ValueError as err:
+        print("{0}: {1} - using rasterstats.".format(im_name, err))
+        return apply_zonal_stats_fn(image_s, site_cache, uid, variable, no_data)
 
-            # df.to_csv(os.path.join(dis_temp_dir_bands, "band{0}".format(str(band)), image_results), index=False)
-            df_list.append(df)
+    return CategoryResult(im_name, str(im_date), stats, cgs_df[uid].values, cgs_df['site_name'].values)
 
-        src.close()
-        srci.close()
 
-    final_df = pd.concat(df_list)
-    print(final_df)
-    final_df.to_csv(os.path.join(dis_temp_dir_bands, "{0}_{1}.csv".format(variable, im_date)), index=False)
-    # final_df.to_csv(r"Z:\Scratch\Zonal_Stats_Pipeline\non_rmb_fractional_cover_zonal_stats\{0}_test.csv".format(str(im_date)))
-    # final_results = None
+def category_frame_fn(list_result):
+    """ Concatenate the categorical zonal stats matrices of every image into one dataframe (one row per site and
+    image, image order).
+
+    @param list_result: list object containing CategoryResult objects.
+    @return: dataframe object (date, dka_image, the category_header_fn features, uid, site and band).
+    """
+    n_sites = [len(result.stats) for result in list_result]
+    final_df = pd.DataFrame(np.concatenate([result.stats for result in list_result]),
+                            columns=zonal_categorical_stats.category_header_fn())
+    final_df.insert(0, 'dka_image', np.repeat([result.im_name for result in list_result], n_sites))
+    final_df.insert(0, 'date', np.repeat([result.date for result in list_result], n_sites))
+    final_df["uid"] = np.concatenate([result.uid for result in list_result])
+    final_df["site"] = np.concatenate([result.site for result in list_result])
+    final_df["band"] = 1
+
     return final_df
 
 #
@@ -363,19 +307,22 @@ def main_routine(export_dir_path, variable, csv_file, temp_dir_path, geo_df, no_
     output_list = []
     print("variable: ", variable)
 
-    albers_dir = os.path.join(temp_dir_path, "albers")
-
     # # define the GCSWGS84 directory pathway
     # gcs_wgs84_dir = (temp_dir_path + '\\gcs_wgs84')
     #
     # define the max_tempOutput directory pathway
     output_dir = (os.path.join(export_dir_path, "{0}_zonal_stats".format(variable)))
 
-    # call the project_shapefile_gcs_wgs84_fn function
-    cgs_df, projected_shape_path = project_shapefile_gcs_wgs84_fn(albers_dir, geo_df)
+    # hold the sites in memory, each image crs is re-projected once and reused (no shapefiles written to disk).
+    site_cache = zonal_geometry_cache.site_cache_fn(geo_df)
+
+    # zone indexes are built once per pixel grid and reused by every image on that grid.
+    zone_cache = {}
 
-    dka_temp_dir_bands = os.path.join(temp_dir_path, 'dka_temp_individual_bands')
-    os.makedirs(dka_temp_dir_bands)
+    # the per image results are held in memory (the bincount matrices are concatenated once, rasterstats fallback
+    # images as dataframes).
+    list_result = []
+    list_df = []
 
     # open the list of imagery and read it into memory and call the apply_zonal_stats_fn function
     with open(csv_file, 'r') as imagery_list:
@@ -387,14 +334,15 @@ def main_routine(export_dir_path, variable, csv_file, temp_dir_path, geo_df, no_
             image_s = image.rstrip()
             print("image_s: ", image_s)
 
-            df_list = apply_zonal_stats_fn(image_s, projected_shape_path, uid, variable, no_data,
-                                           dka_temp_dir_bands)  # cgs_df,projected_shape_path,
+            result = apply_categorical_zonal_stats_fn(image_s, site_cache, uid, variable, no_data, zone_cache)
+            if isinstance(result, pd.DataFrame):
+                list_df.append(result)
+            else:
+                list_result.append(result)
 
-    all_files = glob(os.path.join(dka_temp_dir_bands,
-                                  '*.csv'))
-    # advisable to use os.path.join as this makes concatenation OS independent
-    df_from_each_file = (pd.read_csv(f) for f in all_files)
-    output_zonal_stats = pd.concat(df_from_each_file, ignore_index=False, axis=0, sort=False)
+    if list_result:
+        list_df.insert(0, category_frame_fn(list_result))
+    output_zonal_stats = pd.concat(list_df, ignore_index=True, axis=0, sort=False)
     print("-" * 50)
     print(output_zonal_stats.shape)
     print(output_zonal_stats.columns)
@@ -454,11 +402,7 @@ def main_routine(export_dir_path, variable, csv_file, temp_dir_path, geo_df, no_
         # export the pandas df to a csv file
         output_zonal_stats.to_csv(out_path, index=False)
 
-    # ----------------------------------------------- Delete temporary files -------------------------------------------
-    # remove the temp dir and single band csv files
-    shutil.rmtree(dka_temp_dir_bands)
-
-    return projected_shape_path
+    return output_zonal_stats
 
 
 if __name__ == "__main__":
@@ -77,13 +77,82 @@ NOTE1: the script will search for a duplicate folder and delete it if found.
 NOTE2: the folder created is titled (YYYYMMDD_TIME) to avoid the accidental deletion of data due to poor naming
 conventions.
 
+--buffers: float
+float objects containing the nested square buffer distances in metres (half the square side, i.e. 50 100 250 for
+1ha, 4ha and 25ha), every scale is calculated from one read window per site and the outputs hold a scale feature
+-- default set to None (1ha sites).
+
+--catalog: str
+string object containing the path to the Landsat archive catalog file (SQLite), each Landsat tile directory is walked
+once and indexed, and the image lists of every product are queried from the catalog. A catalog file is re-used by
+later runs and refreshed at the start of each run (only the tile directories modified since the last scan are
+listed) -- default set to None (in memory catalog, one walk per tile per run).
+
+--stream: bool
+boolean object, the images of each product are streamed from discovery to the zonal stats (zonal_image_stream): the
+walk of a tile directory that is not in the catalog runs while the first images are calculated, the image count is
+resolved as soon as it is crossed and the tile csv is written as the images pass. Can not be combined with --headers
+or --footprints (both need every image of the tile) -- default set to False.
+
+--snapshot_dir: str
+string object containing the path to the shared catalog snapshot directory (landsat_catalog_snapshot), the latest
+snapshot is loaded into the catalog instead of refreshing it when it is fresh enough (--snapshot_age), so only the
+machine that exports the snapshot scans the archive -- default set to None (no snapshot).
+
+--snapshot_age: float
+float object containing the staleness window of the catalog snapshot in hours, an older snapshot is ignored and the
+catalog is refreshed -- default set to 24.
+
+--headers: bool
+boolean object, the header of every discovered image (transform, dimensions, data types, no data, crs and raster
+blocks) is read in parallel and stored in the catalog, so the zonal stats engines plan their reads and skip the images
+without valid data over the sites without opening them -- default set to False.
+
+--footprints: bool
+boolean object, the valid data footprint of every discovered image is calculated once and stored in the catalog
+(landsat_footprint_index), and the images without valid data over the sites of the tile are left out of the image
+lists (the image count is checked against the remaining images) -- default set to False.
+
+--from: str
+string object containing the first date of the images to process (YYYY, YYYY-MM or YYYY-MM-DD), an image is
+discovered when its date range starts on or after the date -- default set to None (no limit).
+
+--to: str
+string object containing the last date of the images to process (YYYY, YYYY-MM or YYYY-MM-DD, the end of the year or
+month), an image is discovered when its date range ends on or before the date -- default set to None (no limit).
+
+--months: int
+integer objects containing the months of the images to process (i.e. 12 1 2), an image is discovered when every
+month of its date range is listed -- default set to None (every month).
+
+--seasons: str
+string objects containing the seasons of the images to process (summer, autumn, winter and/or spring), added to
+--months. The date filters are applied at discovery, so --image_count is checked against the filtered images
+-- default set to None (every season).
+
+--engine: str
+string object containing the zonal stats engine (auto, rasterstats or sparse), auto chooses the engine of each
+tile from the statistics and the number of images, the site read strategy is always chosen from the site layout
+(sparse falls back to rasterstats with a warning when the product statistics need rasterstats, i.e. min, max,
+median or percentiles) -- default set to 'auto'.
+
 --image_count
 integer object that contains the minimum number of Landsat images (per tile) required for the fractional cover
 zonal stats -- default value set to 800.
 
+--kernel: int
+integer object containing the point sample kernel (1, 3 or 5): the pixel under each site centre or its 3x3 / 5x5
+pixel kernel is sampled in place of the zonal stats over the 1ha site, the output layout is unchanged -- default
+set to None (zonal stats).
+
 --landsat_dir: str
 string object containing the path to the Landsat Directory -- default value set to r'Z:\Landsat\wrs2'.
 
+--memory_budget: str
+string object containing the memory budget of the zonal stats stage (i.e. '4GB' or '512MB'), the read windows are
+sized to stay within the budget and the sites are streamed in blocks when a window does not fit -- default set to None
+(unbounded).
+
 --no_data: int
 ineger object containing the Landsat Fractional Cover no data value -- default set to 0.
 
@@ -115,6 +184,13 @@ import shutil
 import sys
 import warnings
 import glob
+import zonal_memory_budget
+import zonal_output_writer
+import zonal_engine_select
+import image_date_filter
+import landsat_archive_catalog
+import landsat_catalog_snapshot
+import landsat_footprint_index
 import pandas as pd
 import geopandas
 
@@ -154,6 +230,53 @@ def get_cmd_args_fn():
     p.add_argument('-z', '--zone', help="Enter the Landsat tile zone (i.e. 2 or 3)",
                    default=2)
 
+    p.add_argument('-m', '--memory_budget', '--memory-budget',
+                   help="Enter the memory budget for the zonal stats stage (i.e. 4GB or 512MB).",
+                   default=None)
+
+    p.add_argument('-e', '--engine', help="Enter the zonal stats engine (auto, rasterstats or sparse).",
+                   choices=zonal_engine_select.ENGINE_OPTIONS, default='auto')
+
+    p.add_argument('-k', '--kernel', type=int, choices=[1, 3, 5],
+                   help="Enter the point sample kernel size (1, 3 or 5) to sample the site centre only.",
+                   default=None)
+
+    p.add_argument('-b', '--buffers', type=float, nargs='+',
+                   help="Enter the nested square buffer distances in metres (i.e. 50 100 250).",
+                   default=None)
+
+    p.add_argument('-c', '--catalog',
+                   help="Enter the path to the Landsat archive catalog file (i.e. C:\\catalog\\wrs2.sqlite).",
+                   default=None)
+
+    p.add_argument('-g', '--headers', action='store_true',
+                   help="Harvest the image headers during discovery (the zonal stats plan from the headers).")
+
+    p.add_argument('-f', '--footprints', action='store_true',
+                   help="Leave the images without valid data over the sites out of the image lists.")
+
+    p.add_argument('--from', dest='date_from',
+                   help="Enter the first date of the images to process (i.e. 2018 or 2018-12).", default=None)
+
+    p.add_argument('--to', dest='date_to',
+                   help="Enter the last date of the images to process (i.e. 2020 or 2020-02).", default=None)
+
+    p.add_argument('--months', type=int, nargs='+', choices=range(1, 13), metavar='MONTH',
+                   help="Enter the months of the images to process (i.e. 12 1 2).", default=None)
+
+    p.add_argument('--seasons', nargs='+', choices=sorted(image_date_filter.SEASONS), metavar='SEASON',
+                   help="Enter the seasons of the images to process (i.e. summer).", default=None)
+
+    p.add_argument('-q', '--stream', action='store_true',
+                   help="Stream the images from discovery to the zonal stats as they are found.")
+
+    p.add_argument('-s', '--snapshot_dir',
+                   help="Enter the path to the shared catalog snapshot directory (i.e. Z:\\Landsat\\catalog).",
+                   default=None)
+
+    p.add_argument('-a', '--snapshot_age', type=float, default=landsat_catalog_snapshot.MAX_AGE_HOURS,
+                   help="Enter the staleness window of the catalog snapshot in hours (i.e. 24).")
+
     cmd_args = p.parse_args()
 
     if cmd_args.data is None:
@@ -161,6 +284,9 @@ def get_cmd_args_fn():
 
         sys.exit()
 
+    if cmd_args.stream and (cmd_args.headers or cmd_args.footprints):
+        p.error("--stream can not be combined with --headers or --footprints.")
+
     return cmd_args
 
 
@@ -432,6 +558,19 @@ def main_routine():
     row = cmd_args.row
     zone = cmd_args.zone
     image_count = int(cmd_args.image_count)
+    memory_budget = cmd_args.memory_budget
+    engine = cmd_args.engine
+    kernel = cmd_args.kernel
+    buffers = cmd_args.buffers
+    catalog_path = cmd_args.catalog
+    harvest_headers = cmd_args.headers
+    footprints = cmd_args.footprints
+    stream = cmd_args.stream
+    snapshot_dir = cmd_args.snapshot_dir
+    snapshot_age = cmd_args.snapshot_age
+    # date filters applied at discovery (image_date_filter), None when no filter is set.
+    date_filter = image_date_filter.date_filter_fn(cmd_args.date_from, cmd_args.date_to, cmd_args.months,
+                                                   cmd_args.seasons)
 
     # call the temporaryDir function.
     temp_dir_path, final_user = temporary_dir_fn()
@@ -455,11 +594,14 @@ def main_routine():
 
     print("data: ", data)
     import step1_3_project_buffer
-    geo_df2, crs_name = step1_3_project_buffer.main_routine(data, zone, export_dir_path, prime_temp_buffer_dir)
+    geo_df2, crs_name = step1_3_project_buffer.main_routine(
+        data, zone, export_dir_path, prime_temp_buffer_dir, max(buffers) if buffers else 50)
+    zonal_memory_budget.log_peak_rss_fn("project buffer")
 
     import step1_4_landsat_tile_grid_identify2
     comp_geo_df, zonal_stats_ready_dir = step1_4_landsat_tile_grid_identify2.main_routine(
         tile_grid, geo_df2, data, zone, export_dir_path, prime_temp_grid_dir)
+    zonal_memory_budget.log_peak_rss_fn("tile grid identify")
 
     print("zonal_stats_ready_dir: ", zonal_stats_ready_dir)
     comp_geo_df.to_file(os.path.join(export_dir_path, "biomass_1ha.shp"))
@@ -478,447 +620,527 @@ def main_routine():
 
     print("Exported shapefile: ", shapefile_path)
 
-    # ------------------------------------------- H99 ----------------------------------------------------------
-
-    extension = "h99"
-    no_data = 0.0
-
-    print("h99_" * 50)
-
-    # call the step1_5_dil_landsat_list.py script.
-    import step1_5_h99_landsat_list
-    step1_5_h99_landsat_list.main_routine(
-        export_dir_path, geo_df3, image_count, lsat_dir, path, row, zone, extension)
-
-    print("up to here")
-    print("h99_tile_status_dir: ", h99_tile_status_dir)
-    # define the tile for processing directory.
-    h99_tile_for_processing_dir = (h99_tile_status_dir + '\\h99_for_processing')
-    print('-' * 50)
-
-    h99_zonal_stats_output = (export_dir_path + '\\h99_zonal_stats')
-    # print('dil zonal_stats_output: ', dil_zonal_stats_output)
-    h99_list_zonal_tile = []
-
-    for file in glob.glob(h99_tile_for_processing_dir + '\\*.csv'):
-        print(file)
-        # append tile paths to list.
-        h99_list_zonal_tile.append(file)
-
-    print("-" * 50)
-    print("h99: ", h99_list_zonal_tile)
-
-    if len(h99_list_zonal_tile) >= 1:
-        #
-        for csv_file in h99_list_zonal_tile:
-            print("h99_zonal_stats_output: ", h99_zonal_stats_output)
-            # call the step1_6_h99_zonal_stats.py script.
-            import step1_6_h99_zonal_stats_v2
-            h99_output_zonal_stats, h99_complete_tile, h99_tile, h99_temp_dir_bands = step1_6_h99_zonal_stats_v2.main_routine(
-                temp_dir_path, zonal_stats_ready_dir, no_data, csv_file, h99_zonal_stats_output, shapefile_path, "h99")
-
-
+    snapshot = None
+    if snapshot_dir is not None:
+        # load the shared catalog snapshot when it is fresh enough (the archive was scanned by another machine).
+        snapshot = landsat_catalog_snapshot.load_snapshot_fn(snapshot_dir, catalog_path, snapshot_age)
+
+    if catalog_path is not None and snapshot is None:
+        if stream and not landsat_archive_catalog.is_indexed_fn(lsat_dir, lsat_tile, catalog_path):
+            # the tile is walked and indexed by the first product stream (the walk overlaps its zonal stats).
+            print("Catalog: {0} is not indexed, the tile is walked by the image stream.".format(lsat_tile))
+        else:
+            # bring the catalog file up to date (only the modified directories of the tile are listed).
+            landsat_archive_catalog.refresh_fn(catalog_path, [os.path.join(lsat_dir, lsat_tile)])
+
+    if stream:
+        # stream the images of each product (of the date filter) to its zonal stats as they are found, the first
+        # product walks and indexes a tile that is not in the catalog (landsat_archive_catalog).
+        tile_products = {product: landsat_archive_catalog.stream_tile_images_fn(
+            lsat_dir, lsat_tile, sub_dir, "{0}m{1}.img".format(product, zone), catalog_path, date_filter)
+            for product, sub_dir in landsat_archive_catalog.PRODUCT_SUB_DIRS.items()}
     else:
-        print("No h99 images were located")
-
-    # ------------------------------------------- Hcv ----------------------------------------------------------
-
-    extension = "hcv"
-    no_data = 0.0
-
-    print("hcv_" * 50)
-
-    # call the step1_5_dil_landsat_list.py script.
-    import step1_5_hcv_landsat_list
-    step1_5_hcv_landsat_list.main_routine(
-        export_dir_path, geo_df3, image_count, lsat_dir, path, row, zone, extension)
-
-    print("up to here")
-    print("hcv_tile_status_dir: ", hcv_tile_status_dir)
-    # define the tile for processing directory.
-    hcv_tile_for_processing_dir = (hcv_tile_status_dir + '\\hcv_for_processing')
-    print('-' * 50)
-
-    hcv_zonal_stats_output = (export_dir_path + '\\hcv_zonal_stats')
-    # print('dil zonal_stats_output: ', dil_zonal_stats_output)
-    hcv_list_zonal_tile = []
-
-    for file in glob.glob(hcv_tile_for_processing_dir + '\\*.csv'):
-        print(file)
-        # append tile paths to list.
-        hcv_list_zonal_tile.append(file)
-
-    print("-" * 50)
-    print("hcv: ", hcv_list_zonal_tile)
-
-    if len(hcv_list_zonal_tile) >= 1:
-        #
-        for csv_file in hcv_list_zonal_tile:
-            print("hcv_zonal_stats_output: ", hcv_zonal_stats_output)
-            # call the step1_6_hcv_zonal_stats.py script.
-            import step1_6_hcv_zonal_stats_v2
-            hcv_output_zonal_stats, hcv_complete_tile, hcv_tile, hcv_temp_dir_bands = step1_6_hcv_zonal_stats_v2.main_routine(
-                temp_dir_path, zonal_stats_ready_dir, no_data, csv_file, hcv_zonal_stats_output, shapefile_path, "hcv")
-
-
-    else:
-        print("No hcv images were located")
-
-
-    # ------------------------------------------- Hmc ----------------------------------------------------------
-
-    extension = "hmc"
-    no_data = 0.0
-
-    print("hmc_" * 50)
-
-    # call the step1_5_dil_landsat_list.py script.
-    import step1_5_hmc_landsat_list
-    step1_5_hmc_landsat_list.main_routine(
-        export_dir_path, geo_df3, image_count, lsat_dir, path, row, zone, extension)
-
-    print("up to here")
-    print("hmc_tile_status_dir: ", hmc_tile_status_dir)
-    # define the tile for processing directory.
-    hmc_tile_for_processing_dir = (hmc_tile_status_dir + '\\hmc_for_processing')
-    print('-' * 50)
-
-    hmc_zonal_stats_output = (export_dir_path + '\\hmc_zonal_stats')
-    # print('dil zonal_stats_output: ', dil_zonal_stats_output)
-    hmc_list_zonal_tile = []
-
-    for file in glob.glob(hmc_tile_for_processing_dir + '\\*.csv'):
-        print(file)
-        # append tile paths to list.
-        hmc_list_zonal_tile.append(file)
-
-    print("-" * 50)
-    print("hmc: ", hmc_list_zonal_tile)
-
-    if len(hmc_list_zonal_tile) >= 1:
-        #
-        for csv_file in hmc_list_zonal_tile:
-            print("hmc_zonal_stats_output: ", hmc_zonal_stats_output)
-            # call the step1_6_hmc_zonal_stats.py script.
-            import step1_6_hmc_zonal_stats_v2
-            hmc_output_zonal_stats, hmc_complete_tile, hmc_tile, hmc_temp_dir_bands = step1_6_hmc_zonal_stats_v2.main_routine(
-                temp_dir_path, zonal_stats_ready_dir, no_data, csv_file, hmc_zonal_stats_output, shapefile_path, "hmc")
-
-
-    else:
-        print("No hmc images were located")
-
-
-    # ------------------------------------------- hsd ----------------------------------------------------------
-
-    extension = "hsd"
-    no_data = 0.0
-
-    print("hsd_" * 50)
+        # discover the images of every product (of the date filter) in one pass over the tile
+        # (landsat_archive_catalog), one image per acquisition (the dropped variants are reported in
+        # <tile>_duplicate_images.csv), harvesting the image headers for the zonal stats engines when requested.
+        tile_products = landsat_archive_catalog.discover_tile_products_fn(lsat_dir, lsat_tile, zone,
+                                                                          catalog_path=catalog_path,
+                                                                          headers=harvest_headers,
+                                                                          report_dir=export_dir_path,
+                                                                          date_filter=date_filter)
+    if footprints:
+        # leave out the images without valid data over the sites of the tile (landsat_footprint_index).
+        tile_products = landsat_footprint_index.filter_tile_products_fn(tile_products, geo_df4, no_data=0.0,
+                                                                        catalog_path=catalog_path)
+    zonal_memory_budget.log_peak_rss_fn("image discovery")
+
+    # the per site csv files of every product are written by one background writer (zonal_output_writer), so that
+    # the csv files of a product are written while the next product is calculated.
+    output_writer = zonal_output_writer.start_writer_fn()
+    try:
+        # ------------------------------------------- H99 ----------------------------------------------------------
 
-    # call the step1_5_dil_landsat_list.py script.
-    import step1_5_hsd_landsat_list
-    step1_5_hsd_landsat_list.main_routine(
-        export_dir_path, geo_df3, image_count, lsat_dir, path, row, zone, extension)
+        extension = "h99"
+        no_data = 0.0
 
-    print("up to here")
-    print("hsd_tile_status_dir: ", hsd_tile_status_dir)
-    # define the tile for processing directory.
-    hsd_tile_for_processing_dir = (hsd_tile_status_dir + '\\hsd_for_processing')
-    print('-' * 50)
+        print("h99_" * 50)
 
-    hsd_zonal_stats_output = (export_dir_path + '\\hsd_zonal_stats')
-    # print('dil zonal_stats_output: ', dil_zonal_stats_output)
-    hsd_list_zonal_tile = []
+        # call the step1_5_dil_landsat_list.py script.
+        import step1_5_h99_landsat_list
+        step1_5_h99_landsat_list.main_routine(
+            export_dir_path, geo_df3, image_count, lsat_dir, path, row, zone, extension, catalog_path,
+            tile_products[extension])
+        zonal_memory_budget.log_peak_rss_fn("h99 image list")
+
+        print("up to here")
+        print("h99_tile_status_dir: ", h99_tile_status_dir)
+        # define the tile for processing directory.
+        h99_tile_for_processing_dir = (h99_tile_status_dir + '\\h99_for_processing')
+        print('-' * 50)
+
+        h99_zonal_stats_output = (export_dir_path + '\\h99_zonal_stats')
+        # print('dil zonal_stats_output: ', dil_zonal_stats_output)
+        h99_list_zonal_tile = []
+
+        for file in glob.glob(h99_tile_for_processing_dir + '\\*.csv'):
+            print(file)
+            # append tile paths to list.
+            h99_list_zonal_tile.append(file)
+
+        print("-" * 50)
+        print("h99: ", h99_list_zonal_tile)
+
+        if len(h99_list_zonal_tile) >= 1:
+            #
+            for csv_file in h99_list_zonal_tile:
+                print("h99_zonal_stats_output: ", h99_zonal_stats_output)
+                # call the step1_6_h99_zonal_stats.py script.
+                import step1_6_h99_zonal_stats_v2
+                h99_output_zonal_stats, h99_complete_tile, h99_tile, h99_temp_dir_bands = step1_6_h99_zonal_stats_v2.main_routine(
+                    temp_dir_path, zonal_stats_ready_dir, no_data, csv_file, h99_zonal_stats_output, shapefile_path, "h99",
+                    memory_budget, engine, kernel, buffers, output_writer)
+                zonal_memory_budget.log_peak_rss_fn("h99 zonal stats")
 
-    for file in glob.glob(hsd_tile_for_processing_dir + '\\*.csv'):
-        print(file)
-        # append tile paths to list.
-        hsd_list_zonal_tile.append(file)
 
-    print("-" * 50)
-    print("hsd: ", hsd_list_zonal_tile)
+        else:
+            print("No h99 images were located")
+
+        # ------------------------------------------- Hcv ----------------------------------------------------------
 
-    if len(hsd_list_zonal_tile) >= 1:
-        #
-        for csv_file in hsd_list_zonal_tile:
-            print("hsd_zonal_stats_output: ", hsd_zonal_stats_output)
-            # call the step1_6_hsd_zonal_stats.py script.
-            import step1_6_hsd_zonal_stats_v2
-            hsd_output_zonal_stats, hsd_complete_tile, hsd_tile, hsd_temp_dir_bands = step1_6_hsd_zonal_stats_v2.main_routine(
-                temp_dir_path, zonal_stats_ready_dir, no_data, csv_file, hsd_zonal_stats_output, shapefile_path, "hsd")
+        extension = "hcv"
+        no_data = 0.0
 
+        print("hcv_" * 50)
 
-    else:
-        print("No hsd images were located")
+        # call the step1_5_dil_landsat_list.py script.
+        import step1_5_hcv_landsat_list
+        step1_5_hcv_landsat_list.main_routine(
+            export_dir_path, geo_df3, image_count, lsat_dir, path, row, zone, extension, catalog_path,
+            tile_products[extension])
+        zonal_memory_budget.log_peak_rss_fn("hcv image list")
+
+        print("up to here")
+        print("hcv_tile_status_dir: ", hcv_tile_status_dir)
+        # define the tile for processing directory.
+        hcv_tile_for_processing_dir = (hcv_tile_status_dir + '\\hcv_for_processing')
+        print('-' * 50)
+
+        hcv_zonal_stats_output = (export_dir_path + '\\hcv_zonal_stats')
+        # print('dil zonal_stats_output: ', dil_zonal_stats_output)
+        hcv_list_zonal_tile = []
+
+        for file in glob.glob(hcv_tile_for_processing_dir + '\\*.csv'):
+            print(file)
+            # append tile paths to list.
+            hcv_list_zonal_tile.append(file)
+
+        print("-" * 50)
+        print("hcv: ", hcv_list_zonal_tile)
+
+        if len(hcv_list_zonal_tile) >= 1:
+            #
+            for csv_file in hcv_list_zonal_tile:
+                print("hcv_zonal_stats_output: ", hcv_zonal_stats_output)
+                # call the step1_6_hcv_zonal_stats.py script.
+                import step1_6_hcv_zonal_stats_v2
+                hcv_output_zonal_stats, hcv_complete_tile, hcv_tile, hcv_temp_dir_bands = step1_6_hcv_zonal_stats_v2.main_routine(
+                    temp_dir_path, zonal_stats_ready_dir, no_data, csv_file, hcv_zonal_stats_output, shapefile_path, "hcv",
+                    memory_budget, engine, kernel, buffers, output_writer)
+                zonal_memory_budget.log_peak_rss_fn("hcv zonal stats")
 
 
+        else:
+            print("No hcv images were located")
 
-    # # ------------------------------------------- fdc ----------------------------------------------------------
 
-    extension = "fdc"
-    no_data = 0.0
+        # ------------------------------------------- Hmc ----------------------------------------------------------
 
-    print("fdc_" * 50)
+        extension = "hmc"
+        no_data = 0.0
 
-    # call the step1_5_dil_landsat_list.py script.
-    import step1_5_fdc_landsat_list
-    step1_5_fdc_landsat_list.main_routine(
-        export_dir_path, geo_df3, image_count, lsat_dir, path, row, zone, extension)
+        print("hmc_" * 50)
 
-    print("up to here")
-    print("fdc_tile_status_dir: ", fdc_tile_status_dir)
-    # define the tile for processing directory.
-    fdc_tile_for_processing_dir = (fdc_tile_status_dir + '\\fdc_for_processing')
-    print('-' * 50)
+        # call the step1_5_dil_landsat_list.py script.
+        import step1_5_hmc_landsat_list
+        step1_5_hmc_landsat_list.main_routine(
+            export_dir_path, geo_df3, image_count, lsat_dir, path, row, zone, extension, catalog_path,
+            tile_products[extension])
+        zonal_memory_budget.log_peak_rss_fn("hmc image list")
+
+        print("up to here")
+        print("hmc_tile_status_dir: ", hmc_tile_status_dir)
+        # define the tile for processing directory.
+        hmc_tile_for_processing_dir = (hmc_tile_status_dir + '\\hmc_for_processing')
+        print('-' * 50)
+
+        hmc_zonal_stats_output = (export_dir_path + '\\hmc_zonal_stats')
+        # print('dil zonal_stats_output: ', dil_zonal_stats_output)
+        hmc_list_zonal_tile = []
 
-    fdc_zonal_stats_output = (export_dir_path + '\\fdc_zonal_stats')
-    # print('dil zonal_stats_output: ', dil_zonal_stats_output)
-    fdc_list_zonal_tile = []
+        for file in glob.glob(hmc_tile_for_processing_dir + '\\*.csv'):
+            print(file)
+            # append tile paths to list.
+            hmc_list_zonal_tile.append(file)
 
-    for file in glob.glob(fdc_tile_for_processing_dir + '\\*.csv'):
-        print(file)
-        # append tile paths to list.
-        fdc_list_zonal_tile.append(file)
+        print("-" * 50)
+        print("hmc: ", hmc_list_zonal_tile)
 
-    print("-" * 50)
-    print("fdc: ", fdc_list_zonal_tile)
+        if len(hmc_list_zonal_tile) >= 1:
+            #
+            for csv_file in hmc_list_zonal_tile:
+                print("hmc_zonal_stats_output: ", hmc_zonal_stats_output)
+                # call the step1_6_hmc_zonal_stats.py script.
+                import step1_6_hmc_zonal_stats_v2
+                hmc_output_zonal_stats, hmc_complete_tile, hmc_tile, hmc_temp_dir_bands = step1_6_hmc_zonal_stats_v2.main_routine(
+                    temp_dir_path, zonal_stats_ready_dir, no_data, csv_file, hmc_zonal_stats_output, shapefile_path, "hmc",
+                    memory_budget, engine, kernel, buffers, output_writer)
+                zonal_memory_budget.log_peak_rss_fn("hmc zonal stats")
 
-    if len(fdc_list_zonal_tile) >= 1:
-        #
-        for csv_file in fdc_list_zonal_tile:
-            print("fdc_zonal_stats_output: ", fdc_zonal_stats_output)
-            # call the step1_6_fdc_zonal_stats.py script.
-            import step1_6_fdc_zonal_stats_v4
-            fdc_output_zonal_stats, fdc_complete_tile, fdc_tile, fdc_temp_dir_bands = step1_6_fdc_zonal_stats_v4.main_routine(
-                temp_dir_path, zonal_stats_ready_dir, no_data, csv_file, fdc_zonal_stats_output, shapefile_path, "fdc")
 
+        else:
+            print("No hmc images were located")
 
-    else:
-        print("No fdc images were located")
 
+        # ------------------------------------------- hsd ----------------------------------------------------------
 
+        extension = "hsd"
+        no_data = 0.0
 
+        print("hsd_" * 50)
 
-    # ------------------------------------------- wdc ----------------------------------------------------------
+        # call the step1_5_dil_landsat_list.py script.
+        import step1_5_hsd_landsat_list
+        step1_5_hsd_landsat_list.main_routine(
+            export_dir_path, geo_df3, image_count, lsat_dir, path, row, zone, extension, catalog_path,
+            tile_products[extension])
+        zonal_memory_budget.log_peak_rss_fn("hsd image list")
 
-    extension = "wdc"
-    no_data = 0.0
+        print("up to here")
+        print("hsd_tile_status_dir: ", hsd_tile_status_dir)
+        # define the tile for processing directory.
+        hsd_tile_for_processing_dir = (hsd_tile_status_dir + '\\hsd_for_processing')
+        print('-' * 50)
 
-    print("wdc_" * 50)
+        hsd_zonal_stats_output = (export_dir_path + '\\hsd_zonal_stats')
+        # print('dil zonal_stats_output: ', dil_zonal_stats_output)
+        hsd_list_zonal_tile = []
 
-    # call the step1_5_dil_landsat_list.py script.
-    import step1_5_wdc_landsat_list
-    step1_5_wdc_landsat_list.main_routine(
-        export_dir_path, geo_df3, image_count, lsat_dir, path, row, zone, extension)
+        for file in glob.glob(hsd_tile_for_processing_dir + '\\*.csv'):
+            print(file)
+            # append tile paths to list.
+            hsd_list_zonal_tile.append(file)
 
-    print("up to here")
-    print("wdc_tile_status_dir: ", wdc_tile_status_dir)
-    # define the tile for processing directory.
-    wdc_tile_for_processing_dir = (wdc_tile_status_dir + '\\wdc_for_processing')
-    print('-' * 50)
+        print("-" * 50)
+        print("hsd: ", hsd_list_zonal_tile)
 
-    wdc_zonal_stats_output = (export_dir_path + '\\wdc_zonal_stats')
-    # print('dil zonal_stats_output: ', dil_zonal_stats_output)
-    wdc_list_zonal_tile = []
+        if len(hsd_list_zonal_tile) >= 1:
+            #
+            for csv_file in hsd_list_zonal_tile:
+                print("hsd_zonal_stats_output: ", hsd_zonal_stats_output)
+                # call the step1_6_hsd_zonal_stats.py script.
+                import step1_6_hsd_zonal_stats_v2
+                hsd_output_zonal_stats, hsd_complete_tile, hsd_tile, hsd_temp_dir_bands = step1_6_hsd_zonal_stats_v2.main_routine(
+                    temp_dir_path, zonal_stats_ready_dir, no_data, csv_file, hsd_zonal_stats_output, shapefile_path, "hsd",
+                    memory_budget, engine, kernel, buffers, output_writer)
+                zonal_memory_budget.log_peak_rss_fn("hsd zonal stats")
 
-    for file in glob.glob(wdc_tile_for_processing_dir + '\\*.csv'):
-        print(file)
-        # append tile paths to list.
-        wdc_list_zonal_tile.append(file)
 
-    print("-" * 50)
-    print("wdc: ", wdc_list_zonal_tile)
+        else:
+            print("No hsd images were located")
 
-    if len(wdc_list_zonal_tile) >= 1:
-        #
-        for csv_file in wdc_list_zonal_tile:
-            print("wdc_zonal_stats_output: ", wdc_zonal_stats_output)
-            # call the step1_6_wdc_zonal_stats.py script.
-            import step1_6_wdc_zonal_stats_v4
-            wdc_output_zonal_stats, wdc_complete_tile, wdc_tile, wdc_temp_dir_bands = step1_6_wdc_zonal_stats_v4.main_routine(
-                temp_dir_path, zonal_stats_ready_dir, no_data, csv_file, wdc_zonal_stats_output, shapefile_path, "wdc")
 
 
-    else:
-        print("No wdc images were located")
+        # # ------------------------------------------- fdc ----------------------------------------------------------
 
+        extension = "fdc"
+        no_data = 0.0
 
-    # ------------------------------------------- ccw ----------------------------------------------------------
+        print("fdc_" * 50)
 
-    extension = "ccw"
-    no_data = 0.0
+        # call the step1_5_dil_landsat_list.py script.
+        import step1_5_fdc_landsat_list
+        step1_5_fdc_landsat_list.main_routine(
+            export_dir_path, geo_df3, image_count, lsat_dir, path, row, zone, extension, catalog_path,
+            tile_products[extension])
+        zonal_memory_budget.log_peak_rss_fn("fdc image list")
 
-    print("ccw_" * 50)
+        print("up to here")
+        print("fdc_tile_status_dir: ", fdc_tile_status_dir)
+        # define the tile for processing directory.
+        fdc_tile_for_processing_dir = (fdc_tile_status_dir + '\\fdc_for_processing')
+        print('-' * 50)
 
-    # call the step1_5_dil_landsat_list.py script.
-    import step1_5_ccw_landsat_list
-    step1_5_ccw_landsat_list.main_routine(
-        export_dir_path, geo_df3, image_count, lsat_dir, path, row, zone, extension)
+        fdc_zonal_stats_output = (export_dir_path + '\\fdc_zonal_stats')
+        # print('dil zonal_stats_output: ', dil_zonal_stats_output)
+        fdc_list_zonal_tile = []
 
-    print("up to here")
-    print("ccw_tile_status_dir: ", ccw_tile_status_dir)
-    # define the tile for processing directory.
-    ccw_tile_for_processing_dir = (ccw_tile_status_dir + '\\ccw_for_processing')
-    print('-' * 50)
+        for file in glob.glob(fdc_tile_for_processing_dir + '\\*.csv'):
+            print(file)
+            # append tile paths to list.
+            fdc_list_zonal_tile.append(file)
 
-    ccw_zonal_stats_output = (export_dir_path + '\\ccw_zonal_stats')
-    # print('dil zonal_stats_output: ', dil_zonal_stats_output)
-    ccw_list_zonal_tile = []
+        print("-" * 50)
+        print("fdc: ", fdc_list_zonal_tile)
 
-    for file in glob.glob(ccw_tile_for_processing_dir + '\\*.csv'):
-        print(file)
-        # append tile paths to list.
-        ccw_list_zonal_tile.append(file)
+        if len(fdc_list_zonal_tile) >= 1:
+            #
+            for csv_file in fdc_list_zonal_tile:
+                print("fdc_zonal_stats_output: ", fdc_zonal_stats_output)
+                # call the step1_6_fdc_zonal_stats.py script.
+                import step1_6_fdc_zonal_stats_v4
+                fdc_output_zonal_stats, fdc_complete_tile, fdc_tile, fdc_temp_dir_bands = step1_6_fdc_zonal_stats_v4.main_routine(
+                    temp_dir_path, zonal_stats_ready_dir, no_data, csv_file, fdc_zonal_stats_output, shapefile_path, "fdc",
+                    memory_budget, engine, kernel, buffers, output_writer)
+                zonal_memory_budget.log_peak_rss_fn("fdc zonal stats")
 
-    print("-" * 50)
-    print("ccw: ", ccw_list_zonal_tile)
 
-    if len(ccw_list_zonal_tile) >= 1:
-        #
-        for csv_file in ccw_list_zonal_tile:
-            print("ccw_zonal_stats_output: ", ccw_zonal_stats_output)
-            # call the step1_6_ccw_zonal_stats.py script.
-            import step1_6_ccw_zonal_stats_v2
-            ccw_output_zonal_stats, ccw_complete_tile, ccw_tile, ccw_temp_dir_bands = step1_6_ccw_zonal_stats_v2.main_routine(
-                temp_dir_path, zonal_stats_ready_dir, no_data, csv_file, ccw_zonal_stats_output, shapefile_path, "ccw")
+        else:
+            print("No fdc images were located")
 
 
-    else:
-        print("No fdc images were located")
 
-        # ------------------------------------------- n17 ----------------------------------------------------------
 
-    extension = "n17"
-    no_data = 0.0
+        # ------------------------------------------- wdc ----------------------------------------------------------
 
-    print("n17_" * 50)
+        extension = "wdc"
+        no_data = 0.0
 
-    # call the step1_5_dil_landsat_list.py script.
-    import step1_5_n17_landsat_list
-    step1_5_n17_landsat_list.main_routine(
-        export_dir_path, geo_df3, image_count, lsat_dir, path, row, zone, extension)
+        print("wdc_" * 50)
 
-    print("up to here")
-    print("n17_tile_status_dir: ", n17_tile_status_dir)
-    # define the tile for processing directory.
-    n17_tile_for_processing_dir = (n17_tile_status_dir + '\\n17_for_processing')
-    print('-' * 50)
+        # call the step1_5_dil_landsat_list.py script.
+        import step1_5_wdc_landsat_list
+        step1_5_wdc_landsat_list.main_routine(
+            export_dir_path, geo_df3, image_count, lsat_dir, path, row, zone, extension, catalog_path,
+            tile_products[extension])
+        zonal_memory_budget.log_peak_rss_fn("wdc image list")
 
-    n17_zonal_stats_output = (export_dir_path + '\\n17_zonal_stats')
-    # print('dil zonal_stats_output: ', dil_zonal_stats_output)
-    n17_list_zonal_tile = []
+        print("up to here")
+        print("wdc_tile_status_dir: ", wdc_tile_status_dir)
+        # define the tile for processing directory.
+        wdc_tile_for_processing_dir = (wdc_tile_status_dir + '\\wdc_for_processing')
+        print('-' * 50)
 
-    for file in glob.glob(n17_tile_for_processing_dir + '\\*.csv'):
-        print(file)
-        # append tile paths to list.
-        n17_list_zonal_tile.append(file)
+        wdc_zonal_stats_output = (export_dir_path + '\\wdc_zonal_stats')
+        # print('dil zonal_stats_output: ', dil_zonal_stats_output)
+        wdc_list_zonal_tile = []
 
-    print("-" * 50)
-    print("n17: ", n17_list_zonal_tile)
+        for file in glob.glob(wdc_tile_for_processing_dir + '\\*.csv'):
+            print(file)
+            # append tile paths to list.
+            wdc_list_zonal_tile.append(file)
 
-    if len(n17_list_zonal_tile) >= 1:
-        #
-        for csv_file in n17_list_zonal_tile:
-            print("n17_zonal_stats_output: ", n17_zonal_stats_output)
-            # call the step1_6_n17_zonal_stats.py script.
-            import step1_6_n17_zonal_stats_v4
-            n17_output_zonal_stats, n17_complete_tile, n17_tile, n17_temp_dir_bands = step1_6_n17_zonal_stats_v4.main_routine(
-                temp_dir_path, zonal_stats_ready_dir, no_data, csv_file, n17_zonal_stats_output, shapefile_path,
-                "n17")
+        print("-" * 50)
+        print("wdc: ", wdc_list_zonal_tile)
 
+        if len(wdc_list_zonal_tile) >= 1:
+            #
+            for csv_file in wdc_list_zonal_tile:
+                print("wdc_zonal_stats_output: ", wdc_zonal_stats_output)
+                # call the step1_6_wdc_zonal_stats.py script.
+                import step1_6_wdc_zonal_stats_v4
+                wdc_output_zonal_stats, wdc_complete_tile, wdc_tile, wdc_temp_dir_bands = step1_6_wdc_zonal_stats_v4.main_routine(
+                    temp_dir_path, zonal_stats_ready_dir, no_data, csv_file, wdc_zonal_stats_output, shapefile_path, "wdc",
+                    memory_budget, engine, kernel, buffers, output_writer)
+                zonal_memory_budget.log_peak_rss_fn("wdc zonal stats")
 
-    else:
-        print("No n17 images were located")
 
+        else:
+            print("No wdc images were located")
 
-    # ------------------------------------------- wfp ----------------------------------------------------------
 
-    extension = "wfp"
-    no_data = 0.0
+        # ------------------------------------------- ccw ----------------------------------------------------------
 
-    print("wfp_" * 50)
+        extension = "ccw"
+        no_data = 0.0
 
-    # call the step1_5_dil_landsat_list.py script.
-    import step1_5_wfp_landsat_list
-    step1_5_wfp_landsat_list.main_routine(
-        export_dir_path, geo_df3, image_count, lsat_dir, path, row, zone, extension)
+        print("ccw_" * 50)
 
-    print("up to here")
-    print("wfp_tile_status_dir: ", wfp_tile_status_dir)
-    # define the tile for processing directory.
-    wfp_tile_for_processing_dir = (wfp_tile_status_dir + '\\wfp_for_processing')
-    print('-' * 50)
+        # call the step1_5_dil_landsat_list.py script.
+        import step1_5_ccw_landsat_list
+        step1_5_ccw_landsat_list.main_routine(
+            export_dir_path, geo_df3, image_count, lsat_dir, path, row, zone, extension, catalog_path,
+            tile_products[extension])
+        zonal_memory_budget.log_peak_rss_fn("ccw image list")
 
-    wfp_zonal_stats_output = (export_dir_path + '\\wfp_zonal_stats')
-    # print('dil zonal_stats_output: ', dil_zonal_stats_output)
-    wfp_list_zonal_tile = []
+        print("up to here")
+        print("ccw_tile_status_dir: ", ccw_tile_status_dir)
+        # define the tile for processing directory.
+        ccw_tile_for_processing_dir = (ccw_tile_status_dir + '\\ccw_for_processing')
+        print('-' * 50)
 
-    for file in glob.glob(wfp_tile_for_processing_dir + '\\*.csv'):
-        print(file)
-        # append tile paths to list.
-        wfp_list_zonal_tile.append(file)
+        ccw_zonal_stats_output = (export_dir_path + '\\ccw_zonal_stats')
+        # print('dil zonal_stats_output: ', dil_zonal_stats_output)
+        ccw_list_zonal_tile = []
 
-    print("-" * 50)
-    print("wfp: ", wfp_list_zonal_tile)
+        for file in glob.glob(ccw_tile_for_processing_dir + '\\*.csv'):
+            print(file)
+            # append tile paths to list.
+            ccw_list_zonal_tile.append(file)
 
-    if len(wfp_list_zonal_tile) >= 1:
-        #
-        for csv_file in wfp_list_zonal_tile:
-            print("wfp_zonal_stats_output: ", wfp_zonal_stats_output)
-            # call the step1_6_wfp_zonal_stats.py script.
-            import step1_6_wfp_zonal_stats_v2
-            wfp_output_zonal_stats, wfp_complete_tile, wfp_tile, wfp_temp_dir_bands = step1_6_wfp_zonal_stats_v2.main_routine(
-                temp_dir_path, zonal_stats_ready_dir, no_data, csv_file, wfp_zonal_stats_output, shapefile_path, "wfp")
+        print("-" * 50)
+        print("ccw: ", ccw_list_zonal_tile)
 
+        if len(ccw_list_zonal_tile) >= 1:
+            #
+            for csv_file in ccw_list_zonal_tile:
+                print("ccw_zonal_stats_output: ", ccw_zonal_stats_output)
+                # call the step1_6_ccw_zonal_stats.py script.
+                import step1_6_ccw_zonal_stats_v2
+                ccw_output_zonal_stats, ccw_complete_tile, ccw_tile, ccw_temp_dir_bands = step1_6_ccw_zonal_stats_v2.main_routine(
+                    temp_dir_path, zonal_stats_ready_dir, no_data, csv_file, ccw_zonal_stats_output, shapefile_path, "ccw",
+                    memory_budget, engine, kernel, buffers, output_writer)
+                zonal_memory_budget.log_peak_rss_fn("ccw zonal stats")
 
-    else:
-        print("No fdc images were located")
 
-    # ------------------------------------------- H25 ----------------------------------------------------------
+        else:
+            print("No fdc images were located")
 
-    extension = "h25"
-    no_data = 0.0
+            # ------------------------------------------- n17 ----------------------------------------------------------
 
-    print("h25_" * 50)
-    print(image_count, lsat_dir, path, row, zone, extension)
+        extension = "n17"
+        no_data = 0.0
+
+        print("n17_" * 50)
+
+        # call the step1_5_dil_landsat_list.py script.
+        import step1_5_n17_landsat_list
+        step1_5_n17_landsat_list.main_routine(
+            export_dir_path, geo_df3, image_count, lsat_dir, path, row, zone, extension, catalog_path,
+            tile_products[extension])
+        zonal_memory_budget.log_peak_rss_fn("n17 image list")
+
+        print("up to here")
+        print("n17_tile_status_dir: ", n17_tile_status_dir)
+        # define the tile for processing directory.
+        n17_tile_for_processing_dir = (n17_tile_status_dir + '\\n17_for_processing')
+        print('-' * 50)
+
+        n17_zonal_stats_output = (export_dir_path + '\\n17_zonal_stats')
+        # print('dil zonal_stats_output: ', dil_zonal_stats_output)
+        n17_list_zonal_tile = []
+
+        for file in glob.glob(n17_tile_for_processing_dir + '\\*.csv'):
+            print(file)
+            # append tile paths to list.
+            n17_list_zonal_tile.append(file)
+
+        print("-" * 50)
+        print("n17: ", n17_list_zonal_tile)
+
+        if len(n17_list_zonal_tile) >= 1:
+            #
+            for csv_file in n17_list_zonal_tile:
+                print("n17_zonal_stats_output: ", n17_zonal_stats_output)
+                # call the step1_6_n17_zonal_stats.py script.
+                import step1_6_n17_zonal_stats_v4
+                n17_output_zonal_stats, n17_complete_tile, n17_tile, n17_temp_dir_bands = step1_6_n17_zonal_stats_v4.main_routine(
+                    temp_dir_path, zonal_stats_ready_dir, no_data, csv_file, n17_zonal_stats_output, shapefile_path,
+                    "n17", memory_budget, engine, kernel, buffers, output_writer)
+                zonal_memory_budget.log_peak_rss_fn("n17 zonal stats")
+
+
+        else:
+            print("No n17 images were located")
 
-    # call the step1_5_dil_landsat_list.py script.
-    import step1_5_h25_landsat_list_orig
-    step1_5_h25_landsat_list_orig.main_routine(
-        export_dir_path, geo_df3, image_count, lsat_dir, path, row, zone, extension)
-
-    print("up to here")
-    print("h25_tile_status_dir: ", h25_tile_status_dir)
-    # define the tile for processing directory.
-    h25_tile_for_processing_dir = (h25_tile_status_dir + '\\h25_for_processing')
-    print('-' * 50)
 
-    h25_zonal_stats_output = (export_dir_path + '\\h25_zonal_stats')
-    # print('dil zonal_stats_output: ', dil_zonal_stats_output)
-    h25_list_zonal_tile = []
+        # ------------------------------------------- wfp ----------------------------------------------------------
+
+        extension = "wfp"
+        no_data = 0.0
+
+        print("wfp_" * 50)
+
+        # call the step1_5_dil_landsat_list.py script.
+        import step1_5_wfp_landsat_list
+        step1_5_wfp_landsat_list.main_routine(
+            export_dir_path, geo_df3, image_count, lsat_dir, path, row, zone, extension, catalog_path,
+            tile_products[extension])
+        zonal_memory_budget.log_peak_rss_fn("wfp image list")
+
+        print("up to here")
+        print("wfp_tile_status_dir: ", wfp_tile_status_dir)
+        # define the tile for processing directory.
+        wfp_tile_for_processing_dir = (wfp_tile_status_dir + '\\wfp_for_processing')
+        print('-' * 50)
+
+        wfp_zonal_stats_output = (export_dir_path + '\\wfp_zonal_stats')
+        # print('dil zonal_stats_output: ', dil_zonal_stats_output)
+        wfp_list_zonal_tile = []
+
+        for file in glob.glob(wfp_tile_for_processing_dir + '\\*.csv'):
+            print(file)
+            # append tile paths to list.
+            wfp_list_zonal_tile.append(file)
+
+        print("-" * 50)
+        print("wfp: ", wfp_list_zonal_tile)
+
+        if len(wfp_list_zonal_tile) >= 1:
+            #
+            for csv_file in wfp_list_zonal_tile:
+                print("wfp_zonal_stats_output: ", wfp_zonal_stats_output)
+                # call the step1_6_wfp_zonal_stats.py script.
+                import step1_6_wfp_zonal_stats_v2
+                wfp_output_zonal_stats, wfp_complete_tile, wfp_tile, wfp_temp_dir_bands = step1_6_wfp_zonal_stats_v2.main_routine(
+                    temp_dir_path, zonal_stats_ready_dir, no_data, csv_file, wfp_zonal_stats_output, shapefile_path, "wfp",
+                    memory_budget, engine, kernel, buffers, output_writer)
+                zonal_memory_budget.log_peak_rss_fn("wfp zonal stats")
+
+
+        else:
+            print("No fdc images were located")
+
+        # ------------------------------------------- H25 ----------------------------------------------------------
+
+        extension = "h25"
+        no_data = 0.0
+
+        print("h25_" * 50)
+        print(image_count, lsat_dir, path, row, zone, extension)
+
+        # call the step1_5_dil_landsat_list.py script.
+        import step1_5_h25_landsat_list_orig
+        step1_5_h25_landsat_list_orig.main_routine(
+            export_dir_path, geo_df3, image_count, lsat_dir, path, row, zone, extension, catalog_path,
+            tile_products[extension])
+        zonal_memory_budget.log_peak_rss_fn("h25 image list")
+
+        print("up to here")
+        print("h25_tile_status_dir: ", h25_tile_status_dir)
+        # define the tile for processing directory.
+        h25_tile_for_processing_dir = (h25_tile_status_dir + '\\h25_for_processing')
+        print('-' * 50)
+
+        h25_zonal_stats_output = (export_dir_path + '\\h25_zonal_stats')
+        # print('dil zonal_stats_output: ', dil_zonal_stats_output)
+        h25_list_zonal_tile = []
+
+        for file in glob.glob(h25_tile_for_processing_dir + '\\*.csv'):
+            print(file)
+            # append tile paths to list.
+            h25_list_zonal_tile.append(file)
+
+        print("-" * 50)
+        print("h25: ", h25_list_zonal_tile)
+
+        if len(h25_list_zonal_tile) >= 1:
+            #
+            for csv_file in h25_list_zonal_tile:
+                print("h25_zonal_stats_output: ", h25_zonal_stats_output)
+                # call the step1_6_h25_zonal_stats.py script.
+                import step1_6_h25_zonal_stats_v2_orig
+                h25_output_zonal_stats, h25_complete_tile, h25_tile, h25_temp_dir_bands = step1_6_h25_zonal_stats_v2_orig.main_routine(
+                    temp_dir_path, zonal_stats_ready_dir, no_data, csv_file, h25_zonal_stats_output, shapefile_path,
+                    "h25", memory_budget, engine, kernel, buffers, output_writer)
+                zonal_memory_budget.log_peak_rss_fn("h25 zonal stats")
+
 
-    for file in glob.glob(h25_tile_for_processing_dir + '\\*.csv'):
-        print(file)
-        # append tile paths to list.
-        h25_list_zonal_tile.append(file)
+        else:
+            print("No h25 images were located")
 
-    print("-" * 50)
-    print("h25: ", h25_list_zonal_tile)
-
-    if len(h25_list_zonal_tile) >= 1:
-        #
-        for csv_file in h25_list_zonal_tile:
-            print("h25_zonal_stats_output: ", h25_zonal_stats_output)
-            # call the step1_6_h25_zonal_stats.py script.
-            import step1_6_h25_zonal_stats_v2_orig
-            h25_output_zonal_stats, h25_complete_tile, h25_tile, h25_temp_dir_bands = step1_6_h25_zonal_stats_v2_orig.main_routine(
-                temp_dir_path, zonal_stats_ready_dir, no_data, csv_file, h25_zonal_stats_output, shapefile_path,
-                "h25")
-
-
-    else:
-        print("No h25 images were located")
+    finally:
+        # write the remaining per site csv files and stop the writer (re-raises any write error).
+        zonal_output_writer.close_writer_fn(output_writer)
 
     # ---------------------------------------------------- Clean up ----------------------------------------------------
 
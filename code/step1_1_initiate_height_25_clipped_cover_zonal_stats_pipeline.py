@@ -77,13 +77,39 @@ NOTE1: the script will search for a duplicate folder and delete it if found.
 NOTE2: the folder created is titled (YYYYMMDD_TIME) to avoid the accidental deletion of data due to poor naming
 conventions.
 
+--buffers: float
+float objects containing the nested square buffer distances in metres (half the square side, i.e. 50 100 250 for
+1ha, 4ha and 25ha), every scale is calculated from one read window per site and the outputs hold a scale feature
+-- default set to None (1ha sites).
+
+--engine: str
+string object containing the zonal stats engine (auto, rasterstats or sparse), auto chooses the engine of each
+tile from the statistics and the number of images, the site read strategy is always chosen from the site layout
+(sparse falls back to rasterstats with a warning when the product statistics need rasterstats, i.e. min, max,
+median or percentiles) -- default set to 'auto'.
+
 --image_count
 integer object that contains the minimum number of Landsat images (per tile) required for the fractional cover
 zonal stats -- default value set to 800.
 
+--joint: bool
+flag, the unmasked (dbi) and fire masked (dbi_dknmask) images of each site are processed in one pass: the site
+shapefile is located, loaded and written once and both outputs are written side by side -- default set to False (one
+pass per image set).
+
+--kernel: int
+integer object containing the point sample kernel (1, 3 or 5): the pixel under each site centre or its 3x3 / 5x5
+pixel kernel is sampled in place of the zonal stats over the 1ha site, the output layout is unchanged -- default
+set to None (zonal stats).
+
 --landsat_dir: str
 string object containing the path to the Landsat Directory -- default value set to r'Z:\Landsat\wrs2'.
 
+--memory_budget: str
+string object containing the memory budget of the zonal stats stage (i.e. '4GB' or '512MB'), the read windows are
+sized to stay within the budget and the sites are streamed in blocks when a window does not fit -- default set to None
+(unbounded).
+
 --no_data: int
 ineger object containing the Landsat Fractional Cover no data value -- default set to 0.
 
@@ -102,6 +128,10 @@ Landsat images. -- default set to 'dilm3_zstdmask.img'
 string object from the concatenation of the end part of the filename search criteria for the QLD Rainfall images.
 -- default set to '.img'
 
+--workers: int
+integer object containing the number of sites processed in parallel (worker processes), each site task has its own
+temporary directory and the memory budget is shared by the workers -- default set to 1.
+
 ======================================================================================================
 
 """
@@ -115,12 +145,29 @@ import shutil
 import sys
 import warnings
 import glob
+import time
+import traceback
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import archive_walker
+import zonal_memory_budget
+import zonal_output_writer
+import zonal_engine_select
+import image_name_parser
 import pandas as pd
 import geopandas as gpd
 import csv
 
 warnings.filterwarnings("ignore")
 
+# site shapefile directory of each image zone number (zones_dir sub-directories).
+ZONE_DIRS = {'2': 'z52752', '3': 'z52753', '4': 'z52754'}
+
+# one site of one image set (mode: 'dbi', 'dbi_dknmask' or 'joint'), processed by site_task_fn.
+# zonal_options: tuple object (memory_budget, engine, kernel, buffers).
+SiteTask = namedtuple('SiteTask', ['site', 'mode', 'directory_path', 'mask_directory_path', 'zones_dir', 'export_dir',
+                                   'temp_dir_path', 'no_data', 'zonal_options'])
+
 
 def get_cmd_args_fn():
     p = argparse.ArgumentParser(
@@ -155,6 +202,28 @@ def get_cmd_args_fn():
     p.add_argument('-z', '--zone', help="Enter the Landsat tile zone (i.e. 2 or 3)",
                    default=0)
 
+    p.add_argument('-m', '--memory_budget', '--memory-budget',
+                   help="Enter the memory budget for the zonal stats stage (i.e. 4GB or 512MB).",
+                   default=None)
+
+    p.add_argument('-e', '--engine', help="Enter the zonal stats engine (auto, rasterstats or sparse).",
+                   choices=zonal_engine_select.ENGINE_OPTIONS, default='auto')
+
+    p.add_argument('-k', '--kernel', type=int, choices=[1, 3, 5],
+                   help="Enter the point sample kernel size (1, 3 or 5) to sample the site centre only.",
+                   default=None)
+
+    p.add_argument('-j', '--joint', action='store_true',
+                   help="Process the unmasked and fire masked images of each site in one pass.")
+
+    p.add_argument('-b', '--buffers', type=float, nargs='+',
+                   help="Enter the nested square buffer distances in metres (i.e. 50 100 250).",
+                   default=None)
+
+    p.add_argument('-w', '--workers', type=int,
+                   help="Enter the number of sites to process in parallel (i.e. 4).",
+                   default=1)
+
     cmd_args = p.parse_args()
 
     if cmd_args.data is None:
@@ -438,13 +507,251 @@ def check_unique_values(tile_list, lsat_list):
 
 def find_shp_files(starting_directory, prefix):
     shp_files = []
-    for root, dirs, files in os.walk(starting_directory):
+    # the zone directories are listed concurrently, only the shapefiles are returned (archive_walker).
+    for root, dirs, files in archive_walker.walk_fn(starting_directory, suffixes=['.shp']):
         for file in files:
-            if file.endswith('.shp') and file.startswith(prefix):
+            if file.startswith(prefix):
                 shp_files.append(os.path.join(root, file))
     return shp_files
 
 
+def site_images_fn(directory_path, site, pattern):
+    """ Return the images of a site sub-directory (none if the site has no sub-directory).
+
+    @param directory_path: string object containing the path to the image directory (i.e. H:\height25\dbi).
+    @param site: string object containing the site name (sub-directory).
+    @param pattern: string object containing the glob pattern of the images (i.e. '*h25m?.img').
+    @return: list object containing the image paths.
+    """
+    path_ = os.path.join(directory_path, site)
+    if not os.path.isdir(path_):
+        return []
+
+    return sorted(glob.glob(os.path.join(path_, pattern)))
+
+
+def site_shapefile_fn(site, image_s, zones_dir, temp_dir_path):
+    """ Locate the site shapefile in the zone directory of an image, add the uid, site and lsat features and write it
+    to the temporary directory.
+
+    @param site: string object containing the site name.
+    @param image_s: string object containing the path of a site image (zone and tile).
+    @param zones_dir: string object containing the path to the site shapefile directory (one sub-directory per zone).
+    @param temp_dir_path: string object containing the path to the temporary directory of the site.
+    @return shp_path: string object containing the path to the written shapefile, None if no shapefile was located.
+    @return lsat_tile: string object containing the Landsat tile (i.e. '101_073').
+    @return message: string object containing the reason no shapefile was located, None if it was located.
+    """
+    # zone number from the product zone suffix (i.e. 'm3' > '3').
+    image_name = image_name_parser.parse_image_name_fn(image_s)
+    lsat_tile = image_name.tile
+    if image_name.zone is None:
+        return None, lsat_tile, "zone not parsed from {0}".format(image_name.name)
+
+    zone = image_name.zone[1:]
+    if zone not in ZONE_DIRS:
+        return None, lsat_tile, "zone {0} of {1} has no site shapefile directory ({2})".format(
+            zone, image_name.name, ', '.join(sorted(ZONE_DIRS)))
+
+    zone_dir = os.path.join(zones_dir, ZONE_DIRS[zone])
+    print("shp from dir: ", zone_dir)
+    shp_files = find_shp_files(zone_dir, site)
+    if len(shp_files) == 0:
+        return None, lsat_tile, "no site shapefile located"
+
+    gdf = gpd.read_file(shp_files[0])
+    gdf.reset_index(drop=True, inplace=True)
+    gdf['uid'] = gdf.index + 1
+    gdf['site'] = site
+    gdf['lsat'] = lsat_tile
+    shp_path = os.path.join(temp_dir_path, f"{site}_{lsat_tile}.shp")
+    gdf.to_file(shp_path)
+
+    return shp_path, lsat_tile, None
+
+
+def image_list_csv_fn(images, csv_output):
+    """ Write an image list csv (one path per line), None if there are no images.
+
+    @param images: list object containing the image paths.
+    @param csv_output: string object containing the path of the csv file.
+    @return: string object containing the path of the csv file, None if there are no images.
+    """
+    if not images:
+        return None
+
+    with open(csv_output, "w") as output:
+        writer = csv.writer(output, lineterminator='\n')
+        for file in images:
+            writer.writerow([file])
+
+    return csv_output
+
+
+def site_zonal_stats_fn(site, directory_path, mask, zones_dir, export_dir, temp_dir_path, no_data, memory_budget=None,
+                        engine='auto', kernel=None, buffers=None, output_writer=None):
+    """ Calculate the h25 zonal stats of the unmasked (dbi) or fire masked (dbi_dknmask) images of one site.
+
+    @param site: string object containing the site name (sub-directory).
+    @param directory_path: string object containing the path to the image directory (one sub-directory per site).
+    @param mask: boolean object, True for the fire masked images (step1_6_h25_zonal_stats_mask).
+    @param zones_dir: string object containing the path to the site shapefile directory (one sub-directory per zone).
+    @param export_dir: string object containing the path to the export directory.
+    @param temp_dir_path: string object containing the path to the temporary directory of the site.
+    @param no_data: no data value of the imagery.
+    @param output_writer: OutputWriter object of the run (zonal_output_writer), None writes the csv files immediately.
+    @return: string object describing the outcome ('processed' or the reason the site was skipped).
+    """
+    lsat_list = site_images_fn(directory_path, site, "*.img" if mask else "*h25m?.img")
+    if len(lsat_list) == 0:
+        return "no images located"
+
+    shp_path, lsat_tile, message = site_shapefile_fn(site, lsat_list[0], zones_dir, temp_dir_path)
+    if shp_path is None:
+        return message
+
+    ex_dir = os.path.join(export_dir, site)
+    os.makedirs(ex_dir, exist_ok=True)
+
+    csv_output = image_list_csv_fn(lsat_list, os.path.join(
+        temp_dir_path, f'Complete_list_of_{site}_h25_tiles_ready_for_zonal_stats.csv'))
+
+    if mask:
+        import step1_6_h25_zonal_stats_mask
+        step1_6_h25_zonal_stats_mask.main_routine(temp_dir_path, no_data, lsat_tile, ex_dir, shp_path, "h25",
+                                                  csv_output, memory_budget, engine, kernel, buffers, output_writer)
+        zonal_memory_budget.log_peak_rss_fn("{0} h25 mask zonal stats".format(site))
+    else:
+        import step1_6_h25_zonal_stats
+        step1_6_h25_zonal_stats.main_routine(temp_dir_path, no_data, lsat_tile, ex_dir, shp_path, "h25",
+                                             csv_output, memory_budget, engine, kernel, buffers, output_writer)
+        zonal_memory_budget.log_peak_rss_fn("{0} h25 zonal stats".format(site))
+
+    return "processed"
+
+
+def joint_site_fn(site, directory_path, mask_directory_path, zones_dir, export_dir, temp_dir_path, no_data,
+                  memory_budget=None, engine='auto', kernel=None, buffers=None, output_writer=None):
+    """ Calculate the unmasked and fire masked h25 zonal stats of one site in one pass: the site shapefile is located,
+    loaded and written once, and step1_6_h25_zonal_stats.joint_routine pairs each unmasked image with its masked
+    counterpart and writes both outputs side by side.
+
+    @param site: string object containing the site name (sub-directory).
+    @param directory_path: string object containing the path to the unmasked image directory.
+    @param mask_directory_path: string object containing the path to the fire masked image directory.
+    @param zones_dir: string object containing the path to the site shapefile directory (one sub-directory per zone).
+    @param export_dir: string object containing the path to the export directory.
+    @param temp_dir_path: string object containing the path to the temporary directory of the site.
+    @param no_data: no data value of the imagery.
+    @param output_writer: OutputWriter object of the run (zonal_output_writer), None writes the csv files immediately.
+    @return: string object describing the outcome ('processed' or the reason the site was skipped).
+    """
+    import step1_6_h25_zonal_stats
+
+    lsat_list = site_images_fn(directory_path, site, "*h25m?.img")
+    mask_list = site_images_fn(mask_directory_path, site, "*.img")
+    if len(lsat_list) + len(mask_list) == 0:
+        return "no images located"
+
+    shp_path, lsat_tile, message = site_shapefile_fn(site, (lsat_list + mask_list)[0], zones_dir, temp_dir_path)
+    if shp_path is None:
+        return message
+
+    ex_dir = os.path.join(export_dir, site)
+    os.makedirs(ex_dir, exist_ok=True)
+
+    list_csv = [image_list_csv_fn(images, os.path.join(
+        temp_dir_path, f'Complete_list_of_{site}_{name}_tiles_ready_for_zonal_stats.csv'))
+        for name, images in (('h25', lsat_list), ('h25_mask', mask_list))]
+
+    step1_6_h25_zonal_stats.joint_routine(temp_dir_path, no_data, lsat_tile, ex_dir, shp_path, "h25", list_csv[0],
+                                          list_csv[1], memory_budget, engine, kernel, buffers, output_writer)
+    zonal_memory_budget.log_peak_rss_fn("{0} h25 joint zonal stats".format(site))
+
+    return "processed"
+
+
+def site_task_fn(task, output_writer=None):
+    """ Process one site task in its own temporary directory and report the outcome (errors are caught so that the
+    remaining sites are still processed).
+
+    @param task: SiteTask object.
+    @param output_writer: OutputWriter object of the run (zonal_output_writer), None writes the csv files immediately.
+    @return: tuple object (site, mode, status ('ok', 'skipped' or 'failed'), message, seconds).
+    """
+    start_time = time.time()
+    temp_dir_path = os.path.join(task.temp_dir_path, f"{task.mode}_{task.site}")
+    os.makedirs(temp_dir_path, exist_ok=True)
+
+    try:
+        if task.mode == 'joint':
+            message = joint_site_fn(task.site, task.directory_path, task.mask_directory_path, task.zones_dir,
+                                    task.export_dir, temp_dir_path, task.no_data, *task.zonal_options,
+                                    output_writer=output_writer)
+        else:
+            directory_path = task.mask_directory_path if task.mode == 'dbi_dknmask' else task.directory_path
+            message = site_zonal_stats_fn(task.site, directory_path, task.mode == 'dbi_dknmask', task.zones_dir,
+                                          task.export_dir, temp_dir_path, task.no_data, *task.zonal_options,
+                                          output_writer=output_writer)
+        status = 'ok' if message == 'processed' else 'skipped'
+
+    except Exception as err:
+        traceback.print_exc()
+        status, message = 'failed', "{0}: {1}".format(type(err).__name__, err)
+
+    return task.site, task.mode, status, message, round(time.time() - start_time, 1)
+
+
+def run_site_tasks_fn(list_task, workers=1):
+    """ Process the site tasks, in a pool of worker processes when workers > 1 (each site is independent: own
+    shapefile, image lists, temporary and output directories). The sites processed in turn share one background csv
+    writer (zonal_output_writer), so the csv files of a site are written while the next site is calculated, the
+    worker processes write their csv files immediately.
+
+    @param list_task: list object containing the SiteTask objects.
+    @param workers: integer object containing the number of worker processes.
+    @return list_result: list object containing the outcome tuple of each task (task order).
+    """
+    list_result = [None] * len(list_task)
+    if workers > 1 and len(list_task) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(site_task_fn, task): position for position, task in enumerate(list_task)}
+            for future in as_completed(futures):
+                list_result[futures[future]] = result = future.result()
+                print("site {0} ({1}): {2} {3}".format(*result[:4]))
+    else:
+        output_writer = zonal_output_writer.start_writer_fn()
+        try:
+            for position, task in enumerate(list_task):
+                print("=" * 100)
+                print("site: ", task.site, task.mode)
+                list_result[position] = site_task_fn(task, output_writer)
+
+        finally:
+            # write the remaining per site csv files and stop the writer (re-raises any write error).
+            zonal_output_writer.close_writer_fn(output_writer)
+
+    return list_result
+
+
+def site_summary_fn(list_result, export_dir_path):
+    """ Print the per site success/failure summary and export it (h25_site_summary.csv).
+
+    @param list_result: list object containing the outcome tuple of each site task.
+    @param export_dir_path: string object containing the path to the export directory of this run.
+    @return summary_df: dataframe object (site, mode, status, message, seconds).
+    """
+    summary_df = pd.DataFrame(list_result, columns=['site', 'mode', 'status', 'message', 'seconds'])
+    summary_df.to_csv(os.path.join(export_dir_path, 'h25_site_summary.csv'), index=False)
+
+    print("=" * 100)
+    print(summary_df.to_string(index=False))
+    print("sites processed: {0}, skipped: {1}, failed: {2}".format(
+        *[int((summary_df.status == i).sum()) for i in ('ok', 'skipped', 'failed')]))
+
+    return summary_df
+
+
 def main_routine():
     """" Description: This script determines which Landsat tile had the most non null zonal statistics records per site
     and files those plots (bare ground, all bands and interactive) into final output folders. """
@@ -461,6 +768,12 @@ def main_routine():
     row = cmd_args.row
     #zone = cmd_args.zone
     image_count = int(cmd_args.image_count)
+    memory_budget = cmd_args.memory_budget
+    engine = cmd_args.engine
+    kernel = cmd_args.kernel
+    buffers = cmd_args.buffers
+    joint = cmd_args.joint
+    workers = max(int(cmd_args.workers), 1)
 
     # call the temporaryDir function.
     temp_dir_path, final_user = temporary_dir_fn()
@@ -485,186 +798,36 @@ def main_routine():
     #zones_dir = os.listdir(r"H:\height25\shp\zones")
     #print(zones_dir)
 
-    # ------------------------------------- No fire mask img ------------------------------
-    print("-"*100)
-    print("dbi")
     directory_path = r'H:\height25\dbi'
-    #print("Looking in : ", directory_path)
-    list_dir = os.listdir(directory_path)
-    sorted_list_dir = sorted(list_dir)
-    print("sorted_list_dir: ", sorted_list_dir)
+    mask_directory_path = r'H:\height25\dbi_dknmask'
 
-    # import sys
-    # sys.exit()
-
-    for site in sorted_list_dir:
-        print("=" * 100)
-        print("site: ", site)
-        path_ = os.path.join(directory_path, site)
-        list_dir = os.listdir(path_)
-
-        print("list_dir: ", list_dir)
-        # Filter to get only files ending with '.img' and exclude '.img.aux.xml'
-        # Filter to get only files ending with '.img' and exclude '.img.aux' or '.img.aux.xml'
-        img_files = [file for file in list_dir if
-                     file.endswith('.img') and not (file.endswith('.img.aux.xml') or file.endswith('.img.aux'))]
-
-        if len(img_files) > 0:
-            z = img_files[0][-5:-4]
-            print("img_files: ", img_files[0])
-            print("z: ", z)
-            if z == '2':
-                zone_dir = os.path.join(zones_dir, "z52752")
-            elif z == '3':
-                zone_dir = os.path.join(zones_dir, "z52753")
-            elif z == '4':
-                zone_dir = os.path.join(zones_dir, "z52754")
-
-            shp_files = find_shp_files(zone_dir, site)
-
-            if len(shp_files) > 0:
-                shp = shp_files[0]
-                ex_dir = os.path.join(export_dir, site)
-                if not os.path.isdir(ex_dir):
-                    os.mkdir(ex_dir)
-
-                lsat_tile_list = []
-                lsat_list = []
-                for img in glob.glob(os.path.join(path_, "*h25m?.img")):
-                    print("img: ", img)
-                    lsat_list.append(img)
-                    img_split = img.split("_")
-                    path = img_split[1][1:4]
-                    row = img_split[1][5:]
-                    lsat_tile_list.append(f"{img_split[1][1:4]}_{img_split[1][5:]}")
-                    site_status_dir = os.path.join(zonal_stats_ready_dir, site)
-
-                separated_list, unique_values = check_unique_values(lsat_tile_list, lsat_list)
-                print("seperated_list: ", separated_list)
-                gdf = gpd.read_file(shp)
-                gdf.reset_index(drop=True, inplace=True)
-                gdf['uid'] = gdf.index + 1
-                gdf['site'] = site
-
-                for lsat_tile, file_list in separated_list.items():
-
-                    lsat_tile = next(iter(unique_values))
-                    gdf['lsat'] = lsat_tile
-                    shp_path = os.path.join(temp_dir_path, f"{site}_{lsat_tile}.shp")
-                    gdf.to_file(shp_path)
-
-                    csv_output = os.path.join(temp_dir_path,
-                                              f'Complete_list_of_{site}_h25_tiles_ready_for_zonal_stats.csv')
-                    with open(csv_output, "w") as output:
-                        writer = csv.writer(output, lineterminator='\n')
-                        for file in lsat_list:
-                            writer.writerow([file])
-
-                    import step1_6_h25_zonal_stats
-                    step1_6_h25_zonal_stats.main_routine(temp_dir_path, no_data, lsat_tile, ex_dir,
-                                                         shp_path, "h25", csv_output)
-
-            # If shp_files found and processed, continue to next site
-            continue
-        else:
-            print("SITE not located: ", site)
-            # Continue to next site after logging the error
-            continue
-
-    # ------------------------------------- fire mask img ------------------------------
-    print("-"*100)
-    print("dbi fire mask")
-    directory_path = r'H:\height25\dbi_dknmask'
-    #print("Looking in : ", directory_path)
-
-    list_dir = os.listdir(directory_path)
-    sorted_list_dir = sorted(list_dir)
-    for site in sorted_list_dir:
-        print("site: ", site)
-        path_ = os.path.join(directory_path, site)
-        list_dir = os.listdir(path_)
-
-        # Filter to get only files ending with '.img' and exclude '.img.aux' or '.img.aux.xml'
-        img_files = [file for file in list_dir if
-                     file.endswith('.img') and not (file.endswith('.img.aux.xml') or file.endswith('.img.aux'))]
-
-
-        if len(img_files) > 0:
-            z = img_files[0][-14:-13]
-            print("len dir: ", img_files[0])
-            print("z: ", z)
-            if z == '2':
-                zone_dir = os.path.join(zones_dir, "z52752")
-            elif z == '3':
-                zone_dir = os.path.join(zones_dir, "z52753")
-            elif z == '4':
-                zone_dir = os.path.join(zones_dir, "z52754")
-
-            print("shp from dir: ", zone_dir)
-            shp_files = find_shp_files(zone_dir, site)
-
-            if len(shp_files) > 0:
-                shp = shp_files[0]
-                ex_dir = os.path.join(export_dir, site)
-                if not os.path.isdir(ex_dir):
-                    os.mkdir(ex_dir)
-
-                lsat_tile_list = []
-                lsat_list = []
-
-                for img in glob.glob(os.path.join(path_, "*.img")):
-                    lsat_list.append(img)
-                    img_split = img.split("_")
-                    path = img_split[2][1:4]
-                    row = img_split[2][5:]
-                    lsat_tile_list.append(f"{img_split[2][1:4]}_{img_split[2][5:]}")
-                    site_status_dir = os.path.join(zonal_stats_ready_dir, site)
-
-                separated_list, unique_values = check_unique_values(lsat_tile_list, lsat_list)
-
-                gdf = gpd.read_file(shp)
-                gdf.reset_index(drop=True, inplace=True)
-                gdf['uid'] = gdf.index + 1
-                gdf['site'] = site
-
-                # Loop through each key-value pair in the dictionary
-                for lsat_tile, file_list in separated_list.items():
-
-                    lsat_tile = next(iter(unique_values))
-                    gdf['lsat'] = lsat_tile
-                    shp_path = os.path.join(temp_dir_path, f"{site}_{lsat_tile}.shp")
-                    gdf.to_file(shp_path)
-
-                    csv_output = os.path.join(temp_dir_path,
-                                              f'Complete_list_of_{site}_h25_tiles_ready_for_zonal_stats.csv')
-
-                    with open(csv_output, "w") as output:
-                        writer = csv.writer(output, lineterminator='\n')
-                        for file in lsat_list:
-                            writer.writerow([file])
-
-                    # Call external script or function for further processing
-                    import step1_6_h25_zonal_stats_mask
-
-                    step1_6_h25_zonal_stats_mask.main_routine(temp_dir_path, no_data, lsat_tile, ex_dir,
-                                                              shp_path, "h25", csv_output)
-
-            # Ensure moving to the next site after processing is done
-            continue
-
-        else:
-            print("SITE not located: ", site)
-            # If no shape files found, continue to the next site
-            continue
-
-
-# ---------------------------------------------------- Clean up ----------------------------------------------------
-
-#shutil.rmtree(temp_dir_path)
-print('Temporary directory and its contents has been deleted from your working drive.')
-#print(' - ', temp_dir_path)
-print('fractional cover zonal stats pipeline is complete.')
-print('goodbye.')
+    # ------------------------------------- site tasks ------------------------------
+    # one task per site and image set (no fire mask img: dbi, fire mask img: dbi_dknmask) or per site (joint).
+    if joint:
+        list_mode_site = [('joint', site) for site in sorted(set(os.listdir(directory_path)) |
+                                                             set(os.listdir(mask_directory_path)))]
+    else:
+        list_mode_site = [('dbi', site) for site in sorted(os.listdir(directory_path))] + \
+                         [('dbi_dknmask', site) for site in sorted(os.listdir(mask_directory_path))]
+
+    if workers > 1:
+        # the memory budget is shared by the worker processes.
+        memory_budget = zonal_memory_budget.parse_memory_budget_fn(memory_budget)
+        if memory_budget is not None:
+            memory_budget //= workers
+
+    list_task = [SiteTask(site, mode, directory_path, mask_directory_path, zones_dir, export_dir, temp_dir_path,
+                          no_data, (memory_budget, engine, kernel, buffers)) for mode, site in list_mode_site]
+    list_result = run_site_tasks_fn(list_task, workers)
+    site_summary_fn(list_result, export_dir_path)
+
+    # ---------------------------------------------------- Clean up ----------------------------------------------------
+
+    #shutil.rmtree(temp_dir_path)
+    print('Temporary directory and its contents has been deleted from your working drive.')
+    #print(' - ', temp_dir_path)
+    print('fractional cover zonal stats pipeline is complete.')
+    print('goodbye.')
 
 
 if __name__ == '__main__':
@@ -167,12 +167,14 @@ def projection_file_name_fn(epsg, allometry_biomass_gdf):
     return crs_name, crs_output, projected_df
 
 
-def square_buffer_fn(projected_df, prime_temp_buffer_dir, crs_name):
-    """ Separate each point, apply a 1ha square buffer and export shapefiles.
+def square_buffer_fn(projected_df, prime_temp_buffer_dir, crs_name, buffer_size=50):
+    """ Separate each point, apply a square buffer (1ha by default) and export shapefiles.
 
     @param projected_df: Pandas dataframe in the relevant projection (WGSz52 or WGSz53).
     @param prime_temp_buffer_dir: directory to the temporary sub-directory (temp_1ha_buffer).
     @param crs_name: string object containing the crs name for file naming.
+    @param buffer_size: float object containing the buffer distance in metres (half the square side) -- default 50
+    (1ha), the largest nested buffer when several scales are calculated so that the tile identification covers it.
     @return buffer_temp_dir: string object containing the path to the final output subdirectory titled after the crs name.
     """
 
@@ -194,7 +196,7 @@ def square_buffer_fn(projected_df, prime_temp_buffer_dir, crs_name):
         #     single_site = projected_df2.head(1)
         #     # print("single_site: ", single_site)
 
-        projected_df3 = single_site.buffer(50, cap_style=3)
+        projected_df3 = single_site.buffer(buffer_size, cap_style=3)
 
         export_file = os.path.join(buffer_temp_dir, "{0}_1ha_{1}.shp".format(i, crs_name))
         # print("1ha buffer: ", export_file)
@@ -301,7 +303,7 @@ def prop_code_extraction_fn(prop, pastoral_estate):
     return prop_code
 
 
-def main_routine(data, zone, export_dir_path, prime_temp_buffer_dir):
+def main_routine(data, zone, export_dir_path, prime_temp_buffer_dir, buffer_size=50):
     df = pd.read_csv(data)
 
     # remove underscore from site name
@@ -347,7 +349,7 @@ def main_routine(data, zone, export_dir_path, prime_temp_buffer_dir):
         crs_name, crs_output, projected_df = projection_file_name_fn(epsg, geo_df2)
         # print(projected_df)
         # Apply a 1ha square buffer to each point.
-        buffer_temp_dir = square_buffer_fn(projected_df, prime_temp_buffer_dir, crs_name)
+        buffer_temp_dir = square_buffer_fn(projected_df, prime_temp_buffer_dir, crs_name, buffer_size)
         # print(buffer_temp_dir)
         # Add attributes (SITE_NAME and PROP_CODE) to geo-DataFrame.
         prime_temp_buffer_dir = add_site_attribute_fn(prime_temp_buffer_dir, buffer_temp_dir, crs_name)
@@ -368,7 +370,7 @@ def main_routine(data, zone, export_dir_path, prime_temp_buffer_dir):
         crs_name, crs_output, projected_df = projection_file_name_fn(epsg, geo_df2)
 
         # Apply a 1ha square buffer to each point.
-        buffer_temp_dir = square_buffer_fn(projected_df, prime_temp_buffer_dir, crs_name)
+        buffer_temp_dir = square_buffer_fn(projected_df, prime_temp_buffer_dir, crs_name, buffer_size)
 
         # Add attributes (SITE_NAME and PROP_CODE) to geo-DataFrame.
         prime_temp_buffer_dir = add_site_attribute_fn(prime_temp_buffer_dir, buffer_temp_dir, crs_name)
@@ -389,7 +391,7 @@ def main_routine(data, zone, export_dir_path, prime_temp_buffer_dir):
         crs_name, crs_output, projected_df = projection_file_name_fn(epsg, geo_df2)
 
         # Apply a 1ha square buffer to each point.
-        buffer_temp_dir = square_buffer_fn(projected_df, prime_temp_buffer_dir, crs_name)
+        buffer_temp_dir = square_buffer_fn(projected_df, prime_temp_buffer_dir, crs_name, buffer_size)
 
         # Add attributes (SITE_NAME and PROP_CODE) to geo-DataFrame.
         prime_temp_buffer_dir = add_site_attribute_fn(prime_temp_buffer_dir, buffer_temp_dir, crs_name)
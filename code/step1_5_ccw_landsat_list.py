@@ -51,6 +51,8 @@ import csv
 import sys
 from glob import glob
 import warnings
+import landsat_archive_catalog
+import zonal_image_stream
 
 warnings.filterwarnings("ignore")
 
@@ -123,43 +125,35 @@ def unique_values_fn(geo_df):
     return list_tile_unique
 
 
-def list_file_directory_fn(landsat_tile_dir, extension, zone):
-    """ Create an empty list to store the Landsat image file path for images that meet the search criteria
-    (image_search_criteria1 and image_search_criteria2).
-    @param landsat_tile_dir:
-    @param image_search_criteria1: string object containing the end part of the required file name (--search_criteria1)
-    @param image_search_criteria2: string object containing the end part of the required file name (--search_criteria2)
-    @return list_landsat_tile_path: list object containing the path to all matching either search criteria.
-    """
-
-    print("Landsat tile dir: ", landsat_tile_dir)
-    list_landsat_tile_path = []
+def list_file_directory_fn(lsat_dir, lsat_tile, sub_dir, extension, zone, catalog_path=None):
+    """ Return the Landsat image file paths of a tile that meet the search criteria (extension and zone) from the
+    Landsat archive catalog (the tile directory is walked once per catalog, see landsat_archive_catalog).
 
-    # Navigate and loop through the folders within the Landsat Tile Directory stored in the 'landsat_tile_dir'
-    # object variable.
+    @param lsat_dir: string object containing the path to the Landsat directory.
+    @param lsat_tile: string object containing the Landsat tile (i.e. '101_073').
+    @param sub_dir: string object containing the tile sub-directory to search, None for the whole tile directory.
+    @param extension: string object containing the product code (i.e. 'h99').
+    @param zone: string object containing the zone number (i.e. '2').
+    @param catalog_path: string object containing the path to the catalog file, None for the in memory catalog.
+    @return list_landsat_tile_path: list object containing the path to all images matching the search criteria.
+    """
 
     print("extension: ", extension)
     print("{0}m{1}.img".format(extension, str(zone)))
-    print("landsat_tile_dir: ", landsat_tile_dir)
-
-    for root, dirs, files in os.walk(landsat_tile_dir):
-        for file in files:
-            #print('file: ', file)
-            # Search for files ending with the string value stored in the object variable: imageSearchCriteria.
-            if file.endswith("{0}m{1}.img".format(extension, str(zone))):
-                # Concatenate the root and file names to create a file path.
-                image_path = (os.path.join(root, file))
-                #print('LOCATED - image_path: ', image_path)
-                # Append the image_path variable to the empty list 'list_landsat_tile_path'.
-                list_landsat_tile_path.append(image_path)
-                # print("list_landsat: ", list_landsat_tile_path)
+
+    list_landsat_tile_path = landsat_archive_catalog.tile_images_fn(
+        lsat_dir, lsat_tile, sub_dir, "{0}m{1}.img".format(extension, str(zone)), catalog_path)
+    print("list_landsat: ", len(list_landsat_tile_path))
 
     return list_landsat_tile_path
 
 
-def create_csv_list_of_paths_fn(lsat_tile, lsat_dir, extension, image_count, tile_status_dir, path, row, zone):
+def create_csv_list_of_paths_fn(lsat_tile, lsat_dir, extension, image_count, tile_status_dir, path, row, zone,
+                                catalog_path=None, tile_image_list=None):
     """ Determine which Landsat Tiles have a sufficient amount of images to process.
 
+    :param catalog_path: string object containing the path to the Landsat archive catalog file (None: in memory).
+    :param tile_image_list: list object containing the discovered tile images, None to query the catalog.
     :param zone:
     :param image_count:
     :param extension:
@@ -182,8 +176,18 @@ def create_csv_list_of_paths_fn(lsat_tile, lsat_dir, extension, image_count, til
     print('=' * 50)
     print('Confirm that there are sufficient seasonal fractional cover tiles ccw for processing')
     print('landsat_tile_dir: ', landsat_tile_dir)
+    image_stream = None
     # Run the list_file_directory_fn function.
-    list_landsat_tile_path = list_file_directory_fn(landsat_tile_dir, extension, zone)
+    if tile_image_list is None:
+        list_landsat_tile_path = list_file_directory_fn(lsat_dir, lsat_tile, 'density', extension, zone,
+                                                        catalog_path)
+    elif isinstance(tile_image_list, list):
+        # images discovered for every product in one pass (landsat_archive_catalog.discover_tile_products_fn).
+        list_landsat_tile_path = list(tile_image_list)
+    else:
+        # images streamed from discovery (landsat_archive_catalog.stream_tile_images_fn): read only until the
+        # threshold is crossed, the rest of the stream is handed to the zonal stage through the tile csv.
+        list_landsat_tile_path, image_stream = zonal_image_stream.threshold_fn(tile_image_list, image_count)
 
     print("list_landsat_tile_path: ", list_landsat_tile_path)
     # Calculate the number of image pathways stored in the list_landsat_tile_path variable.
@@ -202,11 +206,15 @@ def create_csv_list_of_paths_fn(lsat_tile, lsat_dir, extension, image_count, til
         # Assumes that file_list is 1D, it writes each path to a new line in the first 'column' of a .csv
         csv_output = tile_status_dir + '\\ccw_for_processing\\' + str(lsat_tile) + '_ccw_landsat_tile_list.csv'
 
-        # Creates a csv list of the Landsat fractional cover image paths if the minimum fc_count threshold was met.
-        with open(csv_output, "w") as output:
-            writer = csv.writer(output, lineterminator='\n')
-            for file in list_landsat_tile_path:
-                writer.writerow([file])
+        if image_stream is not None:
+            # the tile csv is written as the images pass to the zonal stage (step1_6, zonal_image_stream).
+            zonal_image_stream.register_stream_fn(csv_output, zonal_image_stream.tee_csv_fn(image_stream, csv_output))
+        else:
+            # Creates a csv list of the Landsat fractional cover image paths if the minimum fc_count threshold was met.
+            with open(csv_output, "w") as output:
+                writer = csv.writer(output, lineterminator='\n')
+                for file in list_landsat_tile_path:
+                    writer.writerow([file])
     else:
         list_insufficient.append(lsat_tile)
         print('There are insufficient seasonal fractional cover ccw tiles for processing: ', str(lsat_tile))
@@ -232,7 +240,8 @@ def create_csv_list_of_paths_fn(lsat_tile, lsat_dir, extension, image_count, til
     return list_sufficient, list_landsat_tile_path
 
 
-def main_routine(export_dir_path, geo_df2, image_count, lsat_dir, path, row, zone, extension):
+def main_routine(export_dir_path, geo_df2, image_count, lsat_dir, path, row, zone, extension, catalog_path=None,
+                 tile_image_list=None):
     # define the tile_status_dir path
     tile_status_dir = (export_dir_path + '\\ccw_tile_status')
     # print("tile_status_dir:", tile_status_dir)
@@ -252,7 +261,8 @@ def main_routine(export_dir_path, geo_df2, image_count, lsat_dir, path, row, zon
     # call the create_csv_list_of_paths_fn function to determine which Landsat Tiles have a sufficient amount of
     # images to process.
     list_sufficient, list_landsat_tile_path = create_csv_list_of_paths_fn(lsat_tile, lsat_dir, extension,
-                                                                          image_count, tile_status_dir, path, row, zone)
+                                                                          image_count, tile_status_dir, path, row, zone,
+                                                                          catalog_path, tile_image_list)
 
     # print(list_sufficient, geo_df)
 
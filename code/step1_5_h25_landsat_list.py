@@ -51,6 +51,7 @@ import csv
 import sys
 from glob import glob
 import warnings
+import landsat_archive_catalog
 
 warnings.filterwarnings("ignore")
 
@@ -123,43 +124,35 @@ def unique_values_fn(geo_df):
     return list_tile_unique
 
 
-def list_file_directory_fn(landsat_tile_dir, extension, zone):
-    """ Create an empty list to store the Landsat image file path for images that meet the search criteria
-    (image_search_criteria1 and image_search_criteria2).
-    @param landsat_tile_dir:
-    @param image_search_criteria1: string object containing the end part of the required file name (--search_criteria1)
-    @param image_search_criteria2: string object containing the end part of the required file name (--search_criteria2)
-    @return list_landsat_tile_path: list object containing the path to all matching either search criteria.
-    """
-
-    print("Landsat tile dir: ", landsat_tile_dir)
-    list_landsat_tile_path = []
+def list_file_directory_fn(lsat_dir, lsat_tile, sub_dir, extension, zone, catalog_path=None):
+    """ Return the Landsat image file paths of a tile that meet the search criteria (extension and zone) from the
+    Landsat archive catalog (the tile directory is walked once per catalog, see landsat_archive_catalog).
 
-    # Navigate and loop through the folders within the Landsat Tile Directory stored in the 'landsat_tile_dir'
-    # object variable.
+    @param lsat_dir: string object containing the path to the Landsat directory.
+    @param lsat_tile: string object containing the Landsat tile (i.e. '101_073').
+    @param sub_dir: string object containing the tile sub-directory to search, None for the whole tile directory.
+    @param extension: string object containing the product code (i.e. 'h99').
+    @param zone: string object containing the zone number (i.e. '2').
+    @param catalog_path: string object containing the path to the catalog file, None for the in memory catalog.
+    @return list_landsat_tile_path: list object containing the path to all images matching the search criteria.
+    """
 
     print("extension: ", extension)
     print("{0}m{1}.img".format(extension, str(zone)))
-    print("landsat_tile_dir: ", landsat_tile_dir)
-
-    for root, dirs, files in os.walk(landsat_tile_dir):
-        for file in files:
-            print('file: ', file)
-            # Search for files ending with the string value stored in the object variable: imageSearchCriteria.
-            if file.endswith("{0}m{1}.img".format(extension, str(zone))):
-                # Concatenate the root and file names to create a file path.
-                image_path = (os.path.join(root, file))
-                #print('LOCATED - image_path: ', image_path)
-                # Append the image_path variable to the empty list 'list_landsat_tile_path'.
-                list_landsat_tile_path.append(image_path)
-    print("list_landsat: ", list_landsat_tile_path)
+
+    list_landsat_tile_path = landsat_archive_catalog.tile_images_fn(
+        lsat_dir, lsat_tile, sub_dir, "{0}m{1}.img".format(extension, str(zone)), catalog_path)
+    print("list_landsat: ", len(list_landsat_tile_path))
 
     return list_landsat_tile_path
 
 
-def create_csv_list_of_paths_fn(lsat_tile, lsat_dir, extension, image_count, tile_status_dir, zone):
+def create_csv_list_of_paths_fn(lsat_tile, lsat_dir, extension, image_count, tile_status_dir, zone, catalog_path=None,
+                                tile_image_list=None):
     """ Determine which Landsat Tiles have a sufficient amount of images to process.
 
+    :param catalog_path: string object containing the path to the Landsat archive catalog file (None: in memory).
+    :param tile_image_list: list object containing the discovered tile images, None to query the catalog.
     :param zone:
     :param image_count:
     :param extension:
@@ -183,7 +176,12 @@ def create_csv_list_of_paths_fn(lsat_tile, lsat_dir, extension, image_count, til
     print('Confirm that there are sufficient seasonal fractional cover tiles h25 for processing')
     print('landsat_tile_dir: ', landsat_tile_dir)
     # Run the list_file_directory_fn function.
-    list_landsat_tile_path = list_file_directory_fn(landsat_tile_dir, extension, zone)
+    if tile_image_list is None:
+        list_landsat_tile_path = list_file_directory_fn(lsat_dir, lsat_tile, 'height', extension, zone,
+                                                        catalog_path)
+    else:
+        # images discovered for every product in one pass (landsat_archive_catalog.discover_tile_products_fn).
+        list_landsat_tile_path = list(tile_image_list)
 
     print("list_landsat_tile_path: ", list_landsat_tile_path)
     # Calculate the number of image pathways stored in the list_landsat_tile_path variable.
@@ -232,7 +230,8 @@ def create_csv_list_of_paths_fn(lsat_tile, lsat_dir, extension, image_count, til
     return list_sufficient, list_landsat_tile_path
 
 
-def main_routine(export_dir_path, gdf, image_count, lsat_dir, zone, extension, lsat_tile):
+def main_routine(export_dir_path, gdf, image_count, lsat_dir, zone, extension, lsat_tile, catalog_path=None,
+                 tile_image_list=None):
     # define the tile_status_dir path
     tile_status_dir = (export_dir_path + '\\h25_tile_status')
     # print("tile_status_dir:", tile_status_dir)
@@ -255,7 +254,7 @@ def main_routine(export_dir_path, gdf, image_count, lsat_dir, zone, extension, l
                                                                           image_count, tile_status_dir,
                                                                           #lsat_tile[:3],
                                                                           #lsat_tile[-3:],
-                                                                          zone)
+                                                                          zone, catalog_path, tile_image_list)
 
     # print(list_sufficient, geo_df)
 
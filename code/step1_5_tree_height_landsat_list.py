@@ -50,6 +50,8 @@ import os
 import csv
 import sys
 import warnings
+import archive_walker
+import landsat_image_variants
 
 warnings.filterwarnings("ignore")
 
@@ -111,15 +113,16 @@ def list_file_directory_fn(landsat_tile_dir, image_search_criteria1, image_searc
     @param landsat_tile_dir:
     @param image_search_criteria1: string object containing the end part of the required file name (--search_criteria1)
     @param image_search_criteria2: string object containing the end part of the required file name (--search_criteria2)
-    @return list_landsat_tile_path: list object containing the path to all matching either search criteria.
+    @return list_landsat_tile_path: list object containing the path to all matching either search criteria (one image
+    per acquisition).
     """
     # Create an empty list to store file paths.
     list_landsat_tile_path = []
     #print('image_search_criteria1: ', image_search_criteria1)
     #print('image_search_criteria2: ', image_search_criteria2)
     # Navigate and loop through the folders within the Landsat Tile Directory stored in the 'landsat_tile_dir'
-    # object variable.
-    for root, dirs, files in os.walk(landsat_tile_dir):
+    # object variable (the folders are listed concurrently, see archive_walker).
+    for root, dirs, files in archive_walker.walk_fn(landsat_tile_dir):
         for file in files:
             #print('file: ', file)
             # Search for files ending with the string value stored in the object variable: imageSearchCriteria.
@@ -130,6 +133,13 @@ def list_file_directory_fn(landsat_tile_dir, image_search_criteria1, image_searc
                 # Append the image_path variable to the empty list 'list_landsat_tile_path'.
                 list_landsat_tile_path.append(image_path)
                 #print("list_landsat: ", list_landsat_tile_path)
+
+    # keep one image per acquisition (landsat_image_variants), the zone of image_search_criteria1 is preferred when
+    # both zone variants of an acquisition are found, then the newest version.
+    zones = [landsat_image_variants.search_zone_fn(image_search_criteria1),
+             landsat_image_variants.search_zone_fn(image_search_criteria2)]
+    list_landsat_tile_path, _ = landsat_image_variants.resolve_variants_fn(list_landsat_tile_path, zones)
+
     return list_landsat_tile_path
 
 
@@ -3,16 +3,10 @@
 # import modules
 from __future__ import print_function, division
 
-import fiona
-import rasterio
-import pandas as pd
-from rasterstats import zonal_stats
-import os
-import shutil
-import glob
-import numpy as np
-import geopandas as gpd
 import warnings
+import zonal_image_precheck
+import zonal_stats_api
+import step1_6_h25_zonal_stats
 
 warnings.filterwarnings("ignore")
 
@@ -61,205 +55,8 @@ SOFTWARE.
 ========================================================================================================================
 '''
 
-def apply_zonal_stats_fn(image_s, no_data, band, shape, uid):
-    """ Collect the zonal statistical information fom a raster file contained within a polygon extend outputting a
-    list of results (final_results).
-
-        @param image_s: string object containing an individual path for each rainfall image as it loops through the
-        cleaned imagery_list_image_results.
-        @param no_data: integer object containing the raster no data value.
-        @param band: string object containing the current band number being processed.
-        @param shape: open odk shapefile containing the 1ha site polygons.
-        @param uid: unique identifier number.
-        @return final_results: list object containing all of the zonal stats, image and shapefile polygon/site
-        information. """
-
-    # create empty lists to append values
-    zone_stats = []
-    list_site = []
-    list_uid = []
-    list_prop = []
-    list_prop_code = []
-    list_site_date = []
-    list_image_name = []
-    image_date = []
-    list_band = []
-
-    with rasterio.open(image_s, nodata=no_data) as srci:
-        affine = srci.transform
-        array = srci.read(band)
-        #print("array: ", array)
-
-        #print("shape: ", shape)
-
-        with fiona.open(shape) as src:
-            # using 'all_touched=True' will increase the number of pixels used to produce the stats 'False'
-            # reduces the number define the zonal stats being calculated
-            zs = zonal_stats(src, array, affine=affine, nodata=no_data,
-                             stats=['count', 'min', 'max', 'mean', 'median', 'std', 'percentile_25', 'percentile_50',
-                                    'percentile_75', 'percentile_95', 'percentile_99', 'range'], all_touched=False)
-
-            #print("h25: ", zs)
-            # extract image name and append to list
-            img_name = str(srci)[-54:-11]
-            list_image_name.append(img_name)
-            # extract image date and append to list
-            img_date = str(srci)[-38:-30]
-            image_date.append(img_date)
-
-            for zone in zs:
-                bands = 'b' + str(band)
-                list_band.append(bands)
-                # extract 'values' as a tuple from a dictionary
-                keys, values = zip(*zone.items())
-                # convert tuple to a list and append to zone_stats
-                result = list(values)
-                zone_stats.append(result)
-
-            for i in src:
-                # extract shapefile records
-                table_attributes = i['properties']
-
-                uid_ = table_attributes[uid]
-                details = [uid_]
-                list_uid.append(details)
-
-                site = table_attributes['site_name']
-                site_ = [site]
-                list_site.append(site_)
-
-        # join the elements in each of the lists row by row
-        final_results = [list_uid + list_site + zone_stats for
-                         list_uid, list_site, zone_stats in
-                         zip(list_uid, list_site, zone_stats)]
-
-        # close the vector and raster file 
-        src.close()
-        srci.close()
-
-    return final_results, str(site_[0])
-
-
-def time_stamp_fn(output_zonal_stats):
-    """Insert a timestamp into feature position 4, convert timestamp into year, month and day strings and append to
-    dataframe.
-
-    @param output_zonal_stats: dataframe object containing the Landsat tile Fractional Cover zonal stats
-    @return output_zonal_stats: processed dataframe object containing the Landsat tile Fractional Cover zonal stats and
-    updated features.
-    """
-
-    #print(output_zonal_stats.date[:6])
-    #print(output_zonal_stats.date[6:])
-    # Convert the date to a time stamp
-    time_stamp_st = pd.to_datetime(output_zonal_stats.date[:6], format='%Y%m')
-    time_stamp_end = pd.to_datetime(output_zonal_stats.date[6:], format='%Y%m')
-    output_zonal_stats.insert(4, 'date_st', time_stamp_st)
-    output_zonal_stats.insert(5, 'date_end', time_stamp_end)
-    output_zonal_stats['year'] = output_zonal_stats['date'].map(lambda x: str(x)[:4])
-    output_zonal_stats['month'] = output_zonal_stats['date'].map(lambda x: str(x)[4:6])
-    output_zonal_stats['day'] = output_zonal_stats['date'].map(lambda x: str(x)[6:])
-
-    return output_zonal_stats
-
-
-def landsat_correction_fn(output_zonal_stats, num_bands, var_):
-    """ Replace specific 0 values with Null values and correct b1, b2 and b3 calculations
-    (refer to Fractional Cover metadata)
-
-    @param output_zonal_stats: dataframe object containing the Landsat tile Fractional Cover zonal stats.
-    @return: processed dataframe object containing the Landsat tile Fractional Cover zonal stats and
-    updated values.
-    """
-    #print("var_: ", var_)
-    for n in num_bands:
-        i = str(n)
-        output_zonal_stats['b{0}_{1}_min'.format(str(i), var_)] = \
-            output_zonal_stats['b{0}_{1}_min'.format(str(i), var_)].replace(0, np.nan)
-
-        # output_zonal_stats['b{0}_{1}_min'.format(i, var_)] = output_zonal_stats['b{0}_{1}_min'.format(i, var_)] - 100
-        # output_zonal_stats['b{0}_{1}_max'.format(i, var_)] = output_zonal_stats['b{0}_{1}_max'.format(i, var_)] - 100
-        # output_zonal_stats['b{0}_{1}_mean'.format(i, var_)] = output_zonal_stats['b{0}_{1}_mean'.format(i, var_)] - 100
-        # output_zonal_stats['b{0}_{1}_med'.format(i, var_)] = output_zonal_stats['b{0}_{1}_med'.format(i, var_)] - 100
-        # output_zonal_stats['b{0}_{1}_p25'.format(i, var_)] = output_zonal_stats['b{0}_{1}_p25'.format(i, var_)] - 100
-        # output_zonal_stats['b{0}_{1}_p50'.format(i, var_)] = output_zonal_stats['b{0}_{1}_p50'.format(i, var_)] - 100
-        # output_zonal_stats['b{0}_{1}_p75'.format(i, var_)] = output_zonal_stats['b{0}_{1}_p75'.format(i, var_)] - 100
-        # output_zonal_stats['b{0}_{1}_p95'.format(i, var_)] = output_zonal_stats['b{0}_{1}_p95'.format(i, var_)] - 100
-        # output_zonal_stats['b{0}_{1}_p99'.format(i, var_)] = output_zonal_stats['b{0}_{1}_p99'.format(i, var_)] - 100
-        ## output_zonal_stats['b{0}_{1}_range'.format(i, var_)] = output_zonal_stats['b{0}_{1}_range'.format(i, var_)] - 100
-        #
-
-    return output_zonal_stats
-
-def time_stamp_fn(output_zonal_stats):
-    """Insert a timestamp into feature position 4, convert timestamp into year, month and day strings and append to
-    dataframe.
-
-    @param output_zonal_stats: dataframe object containing the Landsat tile Fractional Cover zonal stats
-    @return output_zonal_stats: processed dataframe object containing the Landsat tile Fractional Cover zonal stats and
-    updated features.
-    """
-
-    s_year_ = []
-    s_month_ = []
-    s_day_ = []
-    s_date_ = []
-    e_year_ = []
-    e_month_ = []
-    e_day_ = []
-    e_date_ = []
-
-    import calendar
-    #print("init time stamp")
-    # Convert the date to a time stamp
-    for n in output_zonal_stats.date:
-        i = str(n)
-        #print(i)
-        s_year = i[:4]
-        s_month = i[4:6]
-        s_day = "01"
-        s_date = str(s_year) + str(s_month) + str(s_day)
-
-        s_year_.append(s_year)
-        s_month_.append(s_month)
-        s_day_.append(s_day)
-        s_date_.append(s_date)
-
-        e_year = i[6:10]
-        e_month = i[10:12]
-        m, d = calendar.monthrange(int(e_year), int(e_month))
-        e_day = str(d)
-        if len(e_day) < 1:
-            d_ = "0" + str(d)
-        else:
-            d_ = str(d)
-
-        e_date = str(e_year) + str(e_month) + str(d_)
-
-        e_year_.append(e_year)
-        e_month_.append(e_month)
-        e_day_.append(e_day)
-        e_date_.append(e_date)
-
-    output_zonal_stats.insert(4, 'e_date', e_date_)
-    output_zonal_stats.insert(4, 'e_year', e_year_)
-    output_zonal_stats.insert(4, 'e_month', e_month_)
-    output_zonal_stats.insert(4, 'e_day', e_day_)
-
-    output_zonal_stats.insert(4, 's_date', s_date_)
-    output_zonal_stats.insert(4, 's_year', s_year_)
-    output_zonal_stats.insert(4, 's_month', s_month_)
-    output_zonal_stats.insert(4, 's_day', s_day_)
-
-    pd.to_datetime(output_zonal_stats.s_date, format='%Y%m%d')
-
-    pd.to_datetime(output_zonal_stats.e_date, format='%Y%m%d')
-
-    return output_zonal_stats
-
-
-
-def main_routine(temp_dir_path, no_data, tile, zonal_stats_output, shape, var_, lsat_list):
+def main_routine(temp_dir_path, no_data, tile, zonal_stats_output, shape, var_, lsat_list, memory_budget=None,
+                 engine='auto', kernel=None, buffers=None, output_writer=None):
 
     """Restructure ODK 1ha geo-DataFrame to calculate the zonal statistics for each 1ha site per Landsat Fractional
     Cover image, per band (b1, b2 and b3). Concatenate and clean final output DataFrame and export to the Export
@@ -267,193 +64,38 @@ def main_routine(temp_dir_path, no_data, tile, zonal_stats_output, shape, var_,
 
     #print('step1_6_h25_zonal_stats.py INITIATED.')
 
-    #print("tile: ", tile)
-    _, f = os.path.split(tile)
-    #print("f: ", f)
-
-    tile_begin = f[:3]
-    #print("tile_begin: ", tile_begin)
-    tile_end = f[4:7]
-    #print("tile end: ", tile_end)
-    complete_tile = tile_begin + tile_end
-    #print('='*50)
-    #print('Working on tile: ', complete_tile)
-    #print('=' * 50)
-    #print('......')
+    # the tile name, statistics, cleaning and per site export are shared with step1_6_h25_zonal_stats.
+    complete_tile = step1_6_h25_zonal_stats.complete_tile_fn(tile)
 
-    # shapefile = os.path.join(zonal_stats_ready_dir, "{0}_by_tile.shp".format(complete_tile))
-    # df = gpd.read_file("Z:\\Scratch\\Rob\\test2.shp")
-
-    # shape = shapefile
-    #shape = geo_df3
-    # nodata = int(0)
     uid = 'uid'
+    # the per site csv files are queued on the output writer of the pipeline run (zonal_output_writer) so that they
+    # are written while the next product is calculated, None writes them immediately.
+    # images without valid data over the sites are skipped (NaN rows) and counted.
+    precheck_counts = zonal_image_precheck.new_precheck_counts_fn()
     im_list = lsat_list
 
-    # create temporary folders
-    h25_temp_dir_bands = os.path.join(temp_dir_path, 'h25_temp_individual_bands')
-    os.makedirs(h25_temp_dir_bands)
-    #
-    # import sys
-    # sys.exit()
-
-    num_bands = [1]#, 2, 3]
-    for i in num_bands:
-
-        band_dir = os.path.join(h25_temp_dir_bands, 'band{0}'.format(str(i)))
-        os.makedirs(band_dir)
-
-
-    for band in num_bands:
-        # open the list of imagery and read it into memory and call the apply_zonal_stats_fn function
-        with open(im_list, 'r') as imagery_list:
-
-            # Extract each image path from the image list
-            for image in imagery_list:
-                #print(image)
-
-                # cleans the file pathway (Windows)
-                image_s = image.rstrip()
-                path_, im_name = os.path.split(image_s) #[
-                #            -43:]  # May need to change these values depending on whether there is a 2 or 3 in the
-                # # name.
-
-                #print("im_name_s: ", image_s)
-                #im_name = im_name_s + 'g'
-                # print('Image name: ', im_name)
-
-                image_name_split = im_name.split("_")
-                #print("image_name_split: ", image_name_split)
-                im_date = image_name_split[-3][1:]
-                #print("im_date: ", im_date)
-                # im_date = image_s[
-                #           -27:-19]  # May need to change these values depending on whether there is a 2 or 3 in the
-                # # name.
-                #print("im_date: ", im_date)
-                # loops through each image
-
-                # import sys
-
-
-                # sys.exit()
-                with rasterio.open(image_s, nodata=no_data) as srci:
-                    image_results = 'image_' + im_name[:-4] + '.csv'
-                    #print("image_results: ", image_results)
-
-                    # runs the zonal stats function and outputs a csv in a band specific folder
-                    final_results, site_name = apply_zonal_stats_fn(image_s, no_data, band, shape, uid)
-                    #print(final_results)
-
-                    # header = [str(band) + '_number', str(band) + '_site', str(band) + '_min', str(band) + '_max',
-                    #           str(band) + '_mean', str(band) + '_count', str(band) + '_std', str(band) + '_median']
-                    #
-
-                    header = ["b" + str(band) + '_uid', "b" + str(band) + '_site', "b" + str(band) + '_min',
-                              "b" + str(band) + '_max',  "b" + str(band) + '_mean',  "b" + str(band) + '_count',
-                              "b" + str(band) + '_std', "b" + str(band) + '_median', "b" + str(band) + '_range',
-                              "b" + str(band) + '_p25', "b" + str(band) + '_p50', "b" + str(band) + '_p75',
-                              "b" + str(band) + '_p95', "b" + str(band) + '_p99']
-
-                    if band == 1:
-
-                        df1 = pd.DataFrame.from_records(final_results)
-                        #print(df1)
-                        df = pd.DataFrame.from_records(final_results, columns=header)
-                        df['band'] = band
-                        df['image'] = im_name
-                        df['date'] = im_date
-                        #print(df)
-                        df.to_csv(h25_temp_dir_bands + '//band1//' + image_results, index=False)
-                    # elif band == 2:
-                    #     df = pd.DataFrame.from_records(final_results, columns=header)
-                    #     df['band'] = band
-                    #     df['image'] = im_name
-                    #     df['date'] = im_date
-                    #     df.to_csv(h25_temp_dir_bands + '//band2//' + image_results, index=False)
-                    # elif band == 3:
-                    #     df = pd.DataFrame.from_records(final_results, columns=header)
-                    #     df['band'] = band
-                    #     df['image'] = im_name
-                    #     df['date'] = im_date
-                    #     df.to_csv(h25_temp_dir_bands + '//band3//' + image_results, index=False)
-                    else:
-                        print('There is an error.')
-
-    # -------------------------------------------------- Concatenate csv -----------------------------------------------
-
-    # for loops through the band folders and concatenates zonal stat outputs into a complete band specific csv
-    for x in num_bands:
-        location_output = h25_temp_dir_bands + '//band' + str(x)
-        band_files = glob.glob(os.path.join(location_output,
-                                            '*.csv'))
-
-        # advisable to use os.path.join as this makes concatenation OS independent
-        df_from_each_band_file = (pd.read_csv(f) for f in band_files)
-        concat_band_df = pd.concat(df_from_each_band_file, ignore_index=False, axis=0, sort=False)
-        # export the band specific results to a csv file (i.e. three outputs)
-        concat_band_df.to_csv(h25_temp_dir_bands + '//' + 'Band' + str(x) + '_test.csv', index=False)
-
-    # ----------------------------------------- Concatenate three bands together ---------------------------------------
-
-    # Concatenate Three bands
-    header_all = ['uid', 'site', 'b1_h25_min', 'b1_h25_max', 'b1_h25_mean', 'b1_h25_count',
-                  'b1_h25_std', 'b1_h25_med', 'b1_h25_range', 'b1_h25_p25', 'b1_h25_p50', 'b1_h25_p75',
-                              'b1_h25_p95', 'b1_h25_p99',  'band', 'image', 'date']
-    # print("h25_temp_dir_bands: ", h25_temp_dir_bands)
-
-    all_files = glob.glob(os.path.join(h25_temp_dir_bands,
-                                       '*.csv'))
-    # advisable to use os.path.join as this makes concatenation OS independent
-    df_from_each_file = (pd.read_csv(f) for f in all_files)
-    output_zonal_stats = pd.concat(df_from_each_file, ignore_index=False, axis=1, sort=False)
-
-    # print(output_zonal_stats)
-    # for i in output_zonal_stats.columns:
-    #     print(i)
-    output_zonal_stats.columns = header_all
-
-    # -------------------------------------------------- Clean dataframe -----------------------------------------------
-
-    # Convert the date to a time stamp
-    output_zonal_stats = time_stamp_fn(output_zonal_stats)
-
-    # remove 100 from zone_stats
-    output_zonal_stats = landsat_correction_fn(output_zonal_stats, num_bands, var_)
-
-    # reshape the final dataframe
-    output_zonal_stats = output_zonal_stats[
-        ['uid', 'site', 'image', 's_day', 's_month', 's_year', 's_date', 'e_day', 'e_month', 'e_year', 'e_date', 'b1_h25_min',
-         'b1_h25_max', 'b1_h25_mean', 'b1_h25_count', 'b1_h25_std', 'b1_h25_med', 'b1_h25_p25', 'b1_h25_p50', 'b1_h25_p75',
-                                  'b1_h25_p95', 'b1_h25_p99', 'b1_h25_range']]
-
-    site_list = output_zonal_stats.site.unique().tolist()
-    #print("length of site list: ", len(site_list))
-    if len(site_list) >= 1:
-        for i in site_list:
-            out_df = output_zonal_stats[output_zonal_stats['site'] == i]
-
-            out_path = os.path.join(zonal_stats_output, "{0}_{1}_mask_h25_zonal_stats_mask.csv".format(str(i), complete_tile))
-            # export the pandas df to a csv file
-            out_df.to_csv(out_path, index=False)
-            print(out_path)
-            print("output df: ", out_df)
-
+    num_bands = [1]
+    # calculate the zonal stats of every image in memory (zonal_stats_api). Same date images of adjacent tiles are
+    # combined so that sites straddling a tile edge are complete, and images without valid data over the sites are
+    # skipped (NaN rows).
+    with open(im_list, 'r') as imagery_list:
+        output_zonal_stats = zonal_stats_api.compute_zonal_stats(
+            imagery_list, shape,
+            stats=step1_6_h25_zonal_stats.H25_STATS,
+            band=num_bands[0], no_data=no_data, uid=uid, memory_budget=memory_budget, engine=engine, kernel=kernel,
+            buffers=buffers, precheck_counts=precheck_counts)
 
-    else:
-        out_path = os.path.join(zonal_stats_output, "{0}_{1}_h25_zonal_stats_mask.csv".format(str(site_list[0]), complete_tile))
-        # export the pandas df to a csv file
-        output_zonal_stats.to_csv(out_path, index=False)
-        print(out_path)
-        print("output zonal stats: ", output_zonal_stats)
+    zonal_image_precheck.report_precheck_fn(precheck_counts, var_)
 
+    output_zonal_stats = step1_6_h25_zonal_stats.clean_zonal_stats_fn(output_zonal_stats, var_, num_bands)
 
-    # ----------------------------------------------- Delete temporary files -------------------------------------------
-    # remove the temp dir and single band csv files
-    shutil.rmtree(h25_temp_dir_bands)
+    step1_6_h25_zonal_stats.export_site_csv_fn(output_writer, output_zonal_stats, zonal_stats_output, complete_tile,
+                                               "{0}_{1}_mask_h25_zonal_stats_mask.csv")
 
     #print('=' * 50)
 
-    return output_zonal_stats, complete_tile, tile, h25_temp_dir_bands
+    # no temporary directory is created any more (None is returned in its place).
+    return output_zonal_stats, complete_tile, tile, None
 
 
 if __name__ == '__main__':
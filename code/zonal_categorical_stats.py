@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+"""
+zonal_categorical_stats.py
+==========================
+
+Description: This script calculates categorical zonal statistics (i.e. the month of burn in the dka fire scar
+imagery) for every site from a single np.bincount over (zone x n_classes + class). The count, min, max, mean, sum,
+std, median, majority and minority statistics and the per class pixel counts are all derived from the same
+(zone x class) count table and returned as a fixed width float32 matrix.
+
+The results match rasterstats zonal_stats(categorical=True): zones without valid pixels return a count of 0 and
+NaN for every other statistic, and classes that are not present within a zone are NaN.
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# import modules
+from __future__ import print_function, division
+import numpy as np
+import zonal_zone_index
+
+NUMERIC_STATS = ['count', 'min', 'max', 'mean', 'sum', 'std', 'median', 'majority', 'minority']
+
+# dka month of burn classes and their feature names.
+MONTH_MAP = {1: 'jan', 2: 'feb', 3: 'mar', 4: 'april', 5: 'may', 6: 'june',
+             7: 'july', 8: 'aug', 9: 'sep', 10: 'oct', 11: 'nov', 12: 'dec'}
+
+
+def category_header_fn(category_map=None):
+    """ Create the column names of the categorical stats matrix.
+
+    @param category_map: dictionary object (class value: feature name) -- default MONTH_MAP.
+    @return: list object containing the numeric stat names followed by the class names (class order).
+    """
+    if category_map is None:
+        category_map = MONTH_MAP
+
+    return NUMERIC_STATS + [category_map[k] for k in sorted(category_map)]
+
+
+def class_counts_fn(zone_ids, values, n_zones):
+    """ Count the pixels of every class within every zone using a single bincount.
+
+    @param zone_ids: integer numpy array containing the zone number of each valid pixel.
+    @param values: numpy array containing the class value of each valid pixel (non-negative integers).
+    @param n_zones: integer object containing the number of zones.
+    @return counts: integer numpy array (n_zones x n_classes).
+    """
+    if values.dtype.kind == 'f':
+        if values.size and not np.all(values == np.floor(values)):
+            raise ValueError('categorical zonal stats require integer class values')
+    elif values.dtype.kind not in 'iub':
+        raise ValueError('categorical zonal stats require integer class values')
+
+    values = values.astype(np.int64)
+    if values.size and values.min() < 0:
+        raise ValueError('categorical zonal stats require non-negative class values')
+
+    n_classes = int(values.max()) + 1 if values.size else 1
+    counts = np.bincount(zone_ids * n_classes + values, minlength=n_zones * n_classes)
+
+    return counts.reshape(n_zones, n_classes)
+
+
+def counts_to_stats_fn(counts, category_values):
+    """ Derive the numeric and per class statistics from a (zone x class) count table.
+
+    @param counts: integer numpy array (n_zones x n_classes).
+    @param category_values: sorted list object containing the class values reported as individual features.
+    @return result: float32 numpy array (n_zones x (len(NUMERIC_STATS) + len(category_values))).
+    """
+    n_zones, n_classes = counts.shape
+    class_values = np.arange(n_classes, dtype=np.float64)
+
+    count = counts.sum(axis=1)
+    has_data = count > 0
+    safe_count = np.where(has_data, count, 1)
+
+    total = counts.dot(class_values)
+    mean = total / safe_count
+    variance = counts.dot(class_values ** 2) / safe_count - mean ** 2
+    std = np.sqrt(np.clip(variance, 0, None))
+
+    present = counts > 0
+    minimum = np.argmax(present, axis=1)
+    maximum = n_classes - 1 - np.argmax(present[:, ::-1], axis=1)
+
+    # median of the sorted pixel values (average of the two middle values for an even count).
+    cumulative = np.cumsum(counts, axis=1)
+    low = np.argmax(cumulative > ((count - 1) // 2)[:, None], axis=1)
+    high = np.argmax(cumulative > (count // 2)[:, None], axis=1)
+    median = (low + high) / 2.0
+
+    # ties resolve to the lowest class value (rasterstats behaviour).
+    majority = np.argmax(counts, axis=1)
+    minority = np.argmin(np.where(present, counts, np.iinfo(np.int64).max), axis=1)
+
+    result = np.full((n_zones, len(NUMERIC_STATS) + len(category_values)), np.nan, dtype=np.float32)
+    result[:, 0] = count
+    numeric = np.column_stack([minimum, maximum, mean, total, std, median, majority, minority])
+    result[has_data, 1:len(NUMERIC_STATS)] = numeric[has_data]
+
+    for n, value in enumerate(category_values):
+        if 0 <= value < n_classes:
+            column = counts[:, value].astype(np.float32)
+            column[column == 0] = np.nan
+            result[:, len(NUMERIC_STATS) + n] = column
+
+    return result
+
+
+def categorical_zonal_stats_fn(array, zone_index, no_data, category_map=None):
+    """ Calculate the categorical zonal statistics for every zone from a window array.
+
+    @param array: numpy array object returned by zonal_zone_index.read_zone_window_fn.
+    @param zone_index: ZoneIndex object used to read the array.
+    @param no_data: no data value of the raster.
+    @param category_map: dictionary object (class value: feature name) -- default MONTH_MAP.
+    @return result: float32 numpy array (n_zones x len(category_header_fn(category_map))).
+    """
+    if category_map is None:
+        category_map = MONTH_MAP
+
+    zone_ids, values = zonal_zone_index.zone_values_fn(array, zone_index, no_data)
+    counts = class_counts_fn(zone_ids, values, zone_index.n_zones)
+
+    return counts_to_stats_fn(counts, sorted(category_map))
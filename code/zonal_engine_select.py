@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+
+"""
+zonal_engine_select.py
+======================
+
+Description: This script picks the zonal stats strategy of a tile from cheap inputs (the site bounding boxes, the
+raster block size of the first image and the number of images), so that a batch of tiles with 3 sites and tiles
+with 400 sites each get their fast path without manual tuning:
+
+engine:
+    sparse      - the requested statistics are moment statistics (count, sum, mean, std) and there are at least
+                  SPARSE_MIN_IMAGES images: a few sparse matrix products over the image stack (zonal_sparse_engine).
+    rasterstats - otherwise (one rasterstats call per image).
+
+read:
+    single window - the sites are close together: one window covering every site is read per image.
+    site blocks   - the union window of the sites touches SPREAD_RATIO times more raster blocks than the sites
+                    themselves: the sites are grouped into blocks of nearby sites and each block reads its own window
+                    (block planning), so the raster blocks between the sites are not read.
+
+The engine can be fixed with the --engine command argument (rasterstats or sparse, default auto), the read
+strategy is always chosen from the site layout. The chosen strategy is logged for each tile.
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# import modules
+from __future__ import print_function, division
+from collections import namedtuple
+import math
+import zonal_geometry_cache
+import zonal_image_header
+import zonal_image_precheck
+import zonal_virtual_mosaic
+import zonal_sparse_engine
+
+# engine options of the --engine command argument.
+ENGINE_OPTIONS = ('auto', 'rasterstats', 'sparse')
+
+# smallest number of images for which the sparse engine is chosen.
+SPARSE_MIN_IMAGES = 4
+
+# union window raster blocks / site raster blocks ratio from which the sites are read in blocks.
+SPREAD_RATIO = 4
+
+# raster blocks (and site windows) per site block window.
+CLUSTER_BLOCKS = 4
+
+# engine: name of the zonal stats engine (zonal_stats_api.ENGINES).
+# block_pixels: largest site block window in pixels, None to read a single window covering every site.
+# reason: string object describing the inputs of the decision (logged).
+EnginePlan = namedtuple('EnginePlan', ['engine', 'block_pixels', 'reason'])
+
+
+def raster_block_range_fn(bounds, transform, block_shape):
+    """ Return the range of raster blocks covered by bounds.
+
+    @param bounds: tuple object (minx, miny, maxx, maxy) in the raster crs.
+    @param transform: affine object containing the raster transform.
+    @param block_shape: tuple object (block height, block width) of the raster.
+    @return: tuple object (first block row, last block row, first block column, last block column).
+    """
+    minx, miny, maxx, maxy = bounds
+    col_a, row_a = ~transform * (minx, maxy)
+    col_b, row_b = ~transform * (maxx, miny)
+    block_height, block_width = block_shape
+
+    return (int(math.floor(min(row_a, row_b))) // block_height, int(math.floor(max(row_a, row_b))) // block_height,
+            int(math.floor(min(col_a, col_b))) // block_width, int(math.floor(max(col_a, col_b))) // block_width)
+
+
+def site_layout_fn(sites, transform, block_shape):
+    """ Count the raster blocks covered by the sites and by the union window of the sites.
+
+    @param sites: geo-dataframe object containing the sites in the raster crs.
+    @param transform: affine object containing the raster transform.
+    @param block_shape: tuple object (block height, block width) of the raster.
+    @return site_blocks: integer object containing the number of raster blocks covered by at least one site.
+    @return union_blocks: integer object containing the number of raster blocks in the union window.
+    @return site_pixels: integer object containing the largest site window in pixels.
+    """
+    covered = set()
+    site_pixels = 0
+    for bounds in sites.bounds.values:
+        if not all(math.isfinite(i) for i in bounds):
+            continue
+
+        row_st, row_end, col_st, col_end = raster_block_range_fn(bounds, transform, block_shape)
+        covered.update((row, col) for row in range(row_st, row_end + 1) for col in range(col_st, col_end + 1))
+        site_pixels = max(site_pixels, zonal_virtual_mosaic.window_pixels_fn(
+            zonal_virtual_mosaic.snap_bounds_fn(*bounds, transform=transform), transform))
+
+    row_st, row_end, col_st, col_end = raster_block_range_fn(sites.total_bounds, transform, block_shape)
+
+    return len(covered), (row_end - row_st + 1) * (col_end - col_st + 1), site_pixels
+
+
+def select_engine_fn(list_group, site_cache, stats, band=1, engine='auto'):
+    """ Choose the zonal stats engine and read strategy of a tile and log the decision.
+
+    @param list_group: list object containing a list of same date image paths for each date.
+    @param site_cache: SiteCache object.
+    @param stats: list object containing the requested statistics.
+    @param band: integer object containing the band number.
+    @param engine: string object, 'auto' or the name of the engine to use (override, a sparse override falls back
+    to rasterstats when the sparse engine can not calculate the requested statistics).
+    @return engine_plan: EnginePlan object.
+    """
+    n_images = len(list_group)
+    n_sites = len(site_cache.source)
+    supported = zonal_sparse_engine.supported_stats_fn(stats)
+    if engine == 'auto':
+        engine = 'sparse' if supported and n_images >= SPARSE_MIN_IMAGES else 'rasterstats'
+    elif engine == 'sparse' and not supported:
+        print("WARNING: the sparse engine calculates {0} only, using the rasterstats engine for: {1}".format(
+            ', '.join(zonal_sparse_engine.MOMENT_STATS), ', '.join(
+                i for i in zonal_image_precheck.stat_names_fn(stats) if i not in zonal_sparse_engine.MOMENT_STATS)))
+        engine = 'rasterstats'
+
+    block_pixels = None
+    reason = "{0} images, {1} sites".format(n_images, n_sites)
+    if n_images and n_sites:
+        # the registered header of the first image (zonal_image_header), the image is opened when not harvested.
+        header = zonal_image_header.image_header_fn(list_group[0][0])
+        sites = zonal_geometry_cache.sites_in_crs_fn(site_cache, header.crs)
+        transform = header.transform
+        block_shape = header.block_shapes[band - 1]
+
+        site_blocks, union_blocks, site_pixels = site_layout_fn(sites, transform, block_shape)
+        if n_sites > 1 and union_blocks >= SPREAD_RATIO * max(site_blocks, 1):
+            block_pixels = CLUSTER_BLOCKS * max(block_shape[0] * block_shape[1], site_pixels)
+
+        reason += " over {0} of {1} raster blocks ({2}x{3})".format(site_blocks, union_blocks, block_shape[0],
+                                                                     block_shape[1])
+
+    print("Zonal stats strategy: {0} engine, {1} ({2})".format(engine, 'site blocks' if block_pixels else
+                                                               'single window', reason))
+
+    return EnginePlan(engine, block_pixels, reason)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+"""
+zonal_geometry_cache.py
+=======================
+
+Description: This script holds the 1ha site polygons in memory and returns them in the crs of the raster being
+processed. Each distinct crs is re-projected at most once per run (cache keyed by EPSG code), so image lists that
+mix utm zones (i.e. tile 100_074, WGS84z54) are handled without writing re-projected shapefiles to disk.
+
+nested_site_cache_fn stacks square buffers of several sizes around each site centre (i.e. 1ha, 4ha and 25ha) into one
+set of sites with a scale feature, so every scale is calculated from the same read window of each site.
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# import modules
+from __future__ import print_function, division
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+
+# source: geo-dataframe object as read (or passed) in.
+# projected: dictionary object (crs key: geo-dataframe) holding each re-projection made so far.
+# zone_indexes: dictionary object holding the zone indexes / membership matrices built for these sites (pixel grid
+# key: index), so that they are only kept while the sites are.
+SiteCache = namedtuple('SiteCache', ['source', 'projected', 'zone_indexes'])
+
+# feature holding the source site position of each nested buffer (the site blocks keep the scales of a site together).
+SITE_GROUP = 'site_group'
+
+
+def crs_key_fn(crs):
+    """ Create the cache key for a crs: the EPSG code where one exists, otherwise the WKT string.
+
+    @param crs: crs object (rasterio CRS, pyproj CRS, EPSG integer or string).
+    @return: integer or string object, None if the crs is undefined.
+    """
+    if crs is None:
+        return None
+
+    if isinstance(crs, int):
+        return crs
+
+    to_epsg = getattr(crs, 'to_epsg', None)
+    if to_epsg is not None:
+        epsg = to_epsg()
+        if epsg is not None:
+            return int(epsg)
+        return crs.to_wkt()
+
+    crs_string = str(crs)
+    if crs_string.upper().startswith('EPSG:') and crs_string[5:].isdigit():
+        return int(crs_string[5:])
+
+    return crs_string
+
+
+def site_cache_fn(sites):
+    """ Create a site geometry cache from a shapefile path or a geo-dataframe (read once).
+
+    @param sites: string object containing the path to the site shapefile, a geo-dataframe or an existing SiteCache.
+    @return site_cache: SiteCache object.
+    """
+    if isinstance(sites, SiteCache):
+        return sites
+
+    if not isinstance(sites, gpd.GeoDataFrame):
+        sites = gpd.read_file(sites)
+
+    site_cache = SiteCache(sites, {}, {})
+    source_key = crs_key_fn(sites.crs)
+    if source_key is not None:
+        site_cache.projected[source_key] = sites
+
+    return site_cache
+
+
+def sites_in_crs_fn(site_cache, crs):
+    """ Return the site geo-dataframe in the requested crs, re-projecting on the first request only.
+
+    @param site_cache: SiteCache object.
+    @param crs: crs object of the raster (i.e. srci.crs).
+    @return sites: geo-dataframe object in the requested crs (same row order as the source).
+    """
+    key = crs_key_fn(crs)
+    if key is None or site_cache.source.crs is None:
+        # nothing to project to/from, assume the sites match the raster (previous behaviour).
+        return site_cache.source
+
+    sites = site_cache.projected.get(key)
+    if sites is None:
+        print("Re-projecting sites to: ", key)
+        if isinstance(key, int):
+            sites = site_cache.source.to_crs(epsg=key)
+        else:
+            sites = site_cache.source.to_crs(key)
+        site_cache.projected[key] = sites
+
+    return sites
+
+
+def scale_label_fn(buffer_size):
+    """ Return the scale label of a square buffer (area in hectares, i.e. 50 > '1ha').
+
+    @param buffer_size: float object containing the buffer distance (half the square side) in metres.
+    @return: string object.
+    """
+    return '{0:g}ha'.format((2 * float(buffer_size)) ** 2 / 10000)
+
+
+def nested_site_cache_fn(site_cache, buffers):
+    """ Return the SiteCache of the nested square buffers around each site centre, building it on the first request
+    only (kept in the zone indexes of the source SiteCache, so the zone indexes of the nested sites are kept as well).
+
+    @param site_cache: SiteCache object (projected crs, metres).
+    @param buffers: list object containing the buffer distances (half the square side) in metres (i.e. [50, 100, 250]).
+    @return nested_cache: SiteCache object, one site per source site and buffer (site order, then buffer order) with
+    the features scale (i.e. '1ha') and site_group (source site position).
+    """
+    buffers = sorted(set(float(i) for i in buffers))
+    key = ('nested',) + tuple(buffers)
+    nested_cache = site_cache.zone_indexes.get(key)
+    if nested_cache is None:
+        sites = site_cache.source
+        if sites.crs is not None and sites.crs.is_geographic:
+            raise ValueError("Nested buffers are in metres, project the sites first (crs: {0})".format(sites.crs))
+
+        centres = sites.geometry.centroid
+        list_df = []
+        for buffer_size in buffers:
+            df = pd.DataFrame(sites.drop(columns=sites.geometry.name))
+            df['scale'] = scale_label_fn(buffer_size)
+            df[SITE_GROUP] = np.arange(len(sites))
+            df['geometry'] = centres.buffer(buffer_size, cap_style=3).values
+            list_df.append(df)
+
+        nested = pd.concat(list_df, ignore_index=True).sort_values(SITE_GROUP, kind='mergesort')
+        nested = gpd.GeoDataFrame(nested.reset_index(drop=True), geometry='geometry', crs=sites.crs)
+        nested_cache = site_cache_fn(nested)
+        site_cache.zone_indexes[key] = nested_cache
+
+    return nested_cache
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+
+"""
+zonal_image_header.py
+=====================
+
+Description: This script reads the header metadata of the Landsat images (dimensions, band count, data types, no data
+value, crs, transform, raster block shapes and the STATISTICS_VALID_PERCENT tag of each band) so that the zonal stats
+engines can plan their reads without opening every image.
+
+harvest_headers_fn reads the headers of an image list in a thread pool (an image open on a network drive is mostly
+waiting on the share) and registers them for the lifetime of the process. The headers are harvested by the discovery
+stage (landsat_archive_catalog, where they are stored with the image records and only read again when an image is
+modified), and are then used by the zonal stage:
+
+    zonal_engine_select  - the raster block shape and site layout of a tile are read from the header.
+    zonal_sparse_engine  - the images are batched by pixel grid (crs and transform) from the headers.
+    footprint precheck   - images without valid data over the sites (zonal_image_precheck) are skipped without being
+                           opened (rasterstats and point sample engines).
+
+image_header_fn returns the registered header of an image, reading it from the image when it was not harvested, so
+every engine behaves as before when no headers are harvested.
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# import modules
+from __future__ import print_function, division
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import time
+import rasterio
+from rasterio.crs import CRS
+from rasterio.errors import RasterioIOError
+from rasterio.transform import array_bounds
+import zonal_geometry_cache
+
+# number of image headers read concurrently.
+WORKERS = 16
+
+# tag holding the percentage of valid pixels of a band (written by gdalinfo -stats).
+VALID_PERCENT_TAG = 'STATISTICS_VALID_PERCENT'
+
+# the attribute names follow the rasterio dataset, so a header and an open dataset are interchangeable for planning.
+# dtypes, block_shapes and valid_percent hold one value per band (valid_percent: float or None without the tag).
+ImageHeader = namedtuple('ImageHeader', ['width', 'height', 'count', 'dtypes', 'nodata', 'crs', 'transform',
+                                         'block_shapes', 'bounds', 'valid_percent'])
+
+# registered image headers (normalised image path: ImageHeader).
+HEADERS = {}
+
+
+def valid_percent_fn(tags):
+    """ Return the valid pixel percentage of a band from its tags.
+
+    @param tags: dictionary object containing the band tags (i.e. srci.tags(1)).
+    @return: float object, None if the tag is missing or not a number.
+    """
+    try:
+        return float(tags[VALID_PERCENT_TAG])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def dataset_header_fn(srci):
+    """ Create the header of an open image.
+
+    @param srci: open rasterio dataset.
+    @return: ImageHeader object.
+    """
+    crs = srci.crs if srci.crs else None
+
+    return ImageHeader(srci.width, srci.height, srci.count, tuple(srci.dtypes), srci.nodata, crs, srci.transform,
+                       tuple(tuple(i) for i in srci.block_shapes), tuple(srci.bounds),
+                       tuple(valid_percent_fn(srci.tags(band)) for band in range(1, srci.count + 1)))
+
+
+def header_record_fn(header):
+    """ Convert a header to plain values (i.e. a catalog record): the crs as WKT, the transform coefficients, and the
+    no data value (may be NaN) and per band values as JSON.
+
+    @param header: ImageHeader object.
+    @return: tuple object (width, height, count, dtypes, nodata, crs, a, b, c, d, e, f, block_shapes, valid_percent).
+    """
+    return ((header.width, header.height, header.count, json.dumps(header.dtypes), json.dumps(header.nodata),
+             None if header.crs is None else header.crs.to_wkt()) + tuple(header.transform)[:6] +
+            (json.dumps(header.block_shapes), json.dumps(header.valid_percent)))
+
+
+def record_header_fn(record):
+    """ Convert a record created by header_record_fn back to a header.
+
+    @param record: tuple object (header_record_fn order).
+    @return: ImageHeader object.
+    """
+    width, height, count, dtypes, nodata, crs, a, b, c, d, e, f, block_shapes, valid_percent = record
+    transform = rasterio.Affine(a, b, c, d, e, f)
+    # bounds as the rasterio dataset calculates them (left, bottom, right, top).
+    if b == d == 0:
+        bounds = (c, f + e * height, c + a * width, f)
+    else:
+        bounds = array_bounds(height, width, transform)
+
+    return ImageHeader(width, height, count, tuple(json.loads(dtypes)), json.loads(nodata),
+                       None if crs is None else CRS.from_wkt(crs), transform,
+                       tuple(tuple(i) for i in json.loads(block_shapes)), tuple(bounds),
+                       tuple(json.loads(valid_percent)))
+
+
+def read_header_fn(image):
+    """ Open an image and read its header.
+
+    @param image: string object containing the path to the image.
+    @return: ImageHeader object.
+    """
+    with rasterio.open(image) as srci:
+        return dataset_header_fn(srci)
+
+
+def harvest_header_fn(image):
+    """ Read the header of an image, reporting an image that can not be opened.
+
+    @param image: string object containing the path to the image.
+    @return: ImageHeader object, None if the image can not be opened.
+    """
+    try:
+        return read_header_fn(image)
+    except (RasterioIOError, OSError) as error:
+        print("Header: unable to read {0}: {1}".format(image, error))
+        return None
+
+
+def register_headers_fn(headers):
+    """ Register image headers for the zonal stats engines.
+
+    @param headers: dictionary object (image path: ImageHeader).
+    """
+    HEADERS.update((os.path.normpath(image), header) for image, header in headers.items() if header is not None)
+
+
+def clear_headers_fn():
+    """ Release the registered image headers.
+    """
+    HEADERS.clear()
+
+
+def harvest_headers_fn(images, workers=WORKERS, register=True):
+    """ Read the headers of an image list in a thread pool.
+
+    @param images: list object containing the image paths.
+    @param workers: integer object containing the number of headers read concurrently.
+    @param register: boolean object, True to register the headers for the zonal stats engines.
+    @return headers: dictionary object (image path: ImageHeader), images that can not be opened are left out.
+    """
+    images = list(images)
+    if not images:
+        return {}
+
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=max(min(int(workers), len(images)), 1)) as executor:
+        headers = {image: header for image, header in zip(images, executor.map(harvest_header_fn, images))
+                   if header is not None}
+
+    if register:
+        register_headers_fn(headers)
+
+    print("Header: read {0} of {1} image headers in {2:.2f} seconds.".format(
+        len(headers), len(images), time.time() - start_time))
+
+    return headers
+
+
+def image_header_fn(image, read=True):
+    """ Return the header of an image, the registered header when it was harvested.
+
+    @param image: string object containing the path to the image.
+    @param read: boolean object, True to read the header from the image when it was not harvested.
+    @return: ImageHeader object, None if it was not harvested (read=False).
+    """
+    header = HEADERS.get(os.path.normpath(image))
+    if header is None and read:
+        header = read_header_fn(image)
+
+    return header
+
+
+def grid_key_fn(header):
+    """ Create the key of the pixel grid of an image (crs and transform), images of a tile share a pixel grid.
+
+    @param header: ImageHeader object (or an open rasterio dataset).
+    @return: tuple object (crs key, transform coefficients).
+    """
+    return zonal_geometry_cache.crs_key_fn(header.crs), tuple(header.transform)[:6]
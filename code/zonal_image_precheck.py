@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+
+"""
+zonal_image_precheck.py
+=======================
+
+Description: This script decides whether an image (or a group of same date images) can contain valid pixels over
+the sites before the zonal stats are calculated. Partial acquisitions, SLC-off stripes and cloud masked scenes
+often have no valid data over any site, and those images are skipped using:
+
+1. the image footprint: no site intersects the image bounds (no read).
+2. the image statistics (GDAL STATISTICS_VALID_PERCENT of 0 in the .img/.aux.xml metadata, no read).
+3. the site window: every pixel in the (small) window read for the sites is no data.
+
+Skipped images still return a row for every site (count of 0 and NaN statistics) so the row counts stay
+consistent, and the number of processed and skipped images is recorded for the report at the end of each
+step1_6 script.
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# import modules
+from __future__ import print_function, division
+from collections import OrderedDict
+import numpy as np
+from shapely.geometry import box
+
+# rasterstats default statistics.
+DEFAULT_STATS = ['count', 'min', 'max', 'mean']
+
+# order of the statistics in a rasterstats result for a zone with valid pixels (percentiles follow in request
+# order, then the STAT_ORDER_LAST statistics). Zones without valid pixels are returned in request order, so every
+# result is re-ordered to this order before the step1_6 scripts unpack the values by position.
+STAT_ORDER = ['min', 'max', 'mean', 'count', 'sum', 'std', 'median', 'majority', 'minority', 'unique', 'range']
+
+# statistics calculated by rasterstats after the percentiles.
+STAT_ORDER_LAST = ['nodata', 'nan']
+
+
+def new_precheck_counts_fn():
+    """ Create the dictionary used to count the processed and skipped images.
+
+    @return: dictionary object (processed: 0, skipped: 0).
+    """
+    return {'processed': 0, 'skipped': 0}
+
+
+def record_precheck_fn(precheck_counts, skipped):
+    """ Count an image as processed or skipped.
+
+    @param precheck_counts: dictionary object created by new_precheck_counts_fn (None: not counted).
+    @param skipped: boolean object, True if the image was skipped.
+    """
+    if precheck_counts is not None:
+        precheck_counts['skipped' if skipped else 'processed'] += 1
+
+
+def report_precheck_fn(precheck_counts, var_):
+    """ Print the number of processed and skipped images.
+
+    @param precheck_counts: dictionary object created by new_precheck_counts_fn.
+    @param var_: string object containing the product extension (i.e. 'h99').
+    """
+    print("{0} images processed: {1}, skipped (no valid data over the sites): {2}".format(
+        var_, precheck_counts['processed'], precheck_counts['skipped']))
+
+
+def stat_names_fn(stats):
+    """ Return the statistic names in rasterstats result order.
+
+    @param stats: list object containing the requested statistics (None: rasterstats defaults).
+    @return: list object.
+    """
+    if stats is None:
+        stats = DEFAULT_STATS
+    elif isinstance(stats, str):
+        stats = stats.split()
+
+    ordered = [i for i in STAT_ORDER if i in stats]
+    ordered.extend(i for i in stats if i.startswith('percentile_'))
+
+    return ordered + [i for i in STAT_ORDER_LAST if i in stats]
+
+
+def ordered_zone_stats_fn(zone, stats):
+    """ Re-order a rasterstats zone result to the order used for zones with valid pixels.
+
+    @param zone: dictionary object returned by rasterstats for a zone.
+    @param stats: list object containing the requested statistics.
+    @return: OrderedDict object.
+    """
+    return OrderedDict((i, zone.get(i)) for i in stat_names_fn(stats))
+
+
+def empty_zone_stats_fn(stats):
+    """ Create the result of a zone without valid pixels (count of 0, every other statistic None/NaN).
+
+    @param stats: list object containing the requested statistics.
+    @return: OrderedDict object.
+    """
+    return OrderedDict((i, 0 if i == 'count' else None) for i in stat_names_fn(stats))
+
+
+def footprint_precheck_fn(bounds, valid_percent, other_images, sites):
+    """ Check the image footprint and valid pixel percentage for possible valid data over the sites.
+
+    @param bounds: tuple object (left, bottom, right, top) of the reference image.
+    @param valid_percent: float or string object containing the STATISTICS_VALID_PERCENT tag of the band, None if
+    the tag is missing.
+    @param other_images: list object containing the paths of the other same date images (may be empty).
+    @param sites: geo-dataframe object containing the sites in the reference crs.
+    @return: boolean object, False if the image can not contain valid data over the sites.
+    """
+    if other_images:
+        # the other images extend the footprint, leave the decision to the site window check.
+        return True
+
+    if not sites.intersects(box(*bounds)).any():
+        return False
+
+    if valid_percent is not None:
+        try:
+            if float(valid_percent) == 0:
+                return False
+        except ValueError:
+            pass
+
+    return True
+
+
+def metadata_precheck_fn(srci, other_images, band, sites):
+    """ Check the image footprint and statistics for possible valid data over the sites without reading pixels.
+
+    @param srci: open rasterio dataset (reference image).
+    @param other_images: list object containing the paths of the other same date images (may be empty).
+    @param band: integer object containing the band number.
+    @param sites: geo-dataframe object containing the sites in the reference crs.
+    @return: boolean object, False if the image can not contain valid data over the sites.
+    """
+    return footprint_precheck_fn(srci.bounds, srci.tags(band).get('STATISTICS_VALID_PERCENT'), other_images, sites)
+
+
+def header_precheck_fn(header, other_images, band, sites):
+    """ Check the image footprint and statistics for possible valid data over the sites from the image header
+    (zonal_image_header), without opening the image.
+
+    @param header: ImageHeader object of the reference image.
+    @param other_images: list object containing the paths of the other same date images (may be empty).
+    @param band: integer object containing the band number.
+    @param sites: geo-dataframe object containing the sites in the reference crs.
+    @return: boolean object, False if the image can not contain valid data over the sites.
+    """
+    return footprint_precheck_fn(header.bounds, header.valid_percent[band - 1], other_images, sites)
+
+
+def window_has_data_fn(array, no_data):
+    """ Check whether a site window contains any valid pixel.
+
+    @param array: numpy array object containing the window values.
+    @param no_data: no data value (NaN values are also treated as no data).
+    @return: boolean object.
+    """
+    valid = np.ones(array.shape, dtype=bool) if no_data is None else array != no_data
+    if array.dtype.kind == 'f':
+        valid &= ~np.isnan(array)
+
+    return bool(valid.any())
@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+
+"""
+zonal_image_stream.py
+=====================
+
+Description: This script hands the images of a Landsat tile from the discovery stage to the zonal stats stage as
+they are found, so that the walk of a tile directory and the zonal stats overlap instead of running one after the
+other.
+
+    start_stream_fn / stream_items_fn - a producer thread (i.e. the tile directory walk, landsat_archive_catalog)
+                                        passes its items to the consumer through a bounded queue, the producer only
+                                        blocks when it is max_queue items ahead. A producer error is re-raised on the
+                                        consumer thread, and a consumer that stops early stops the producer.
+    threshold_fn                      - the image count check of the step1_5 scripts reads the stream only until the
+                                        threshold is crossed (or the stream ends).
+    tee_csv_fn / register_stream_fn   - the tile csv (<tile>_<product>_landsat_tile_list.csv) is created at once and
+                                        written as the images pass to the zonal stage, and the stream is registered
+                                        under the csv path.
+    open_images_fn                    - the step1_6 scripts open the image list of a tile csv: the registered stream
+                                        (calculated in batches of BATCH_IMAGES images as they arrive, zonal_stats_api)
+                                        or the csv file.
+    joins_groups_fn / add_groups_fn   - a batch holding a same date image of another tile directory than an earlier
+                                        (calculated) batch is detected, so that zonal_stats_api calculates the whole
+                                        image list and the same date images of adjacent tiles are still combined.
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# import modules
+from __future__ import print_function, division
+from collections import namedtuple
+from contextlib import contextmanager
+import csv
+import itertools
+import os
+import threading
+import zonal_virtual_mosaic
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# default number of items the producer may be ahead of the consumer before it blocks.
+MAX_QUEUE = 64
+
+# number of streamed images calculated per zonal stats call (at least zonal_engine_select.SPARSE_MIN_IMAGES).
+BATCH_IMAGES = 32
+
+# seconds between the checks of the stop flag by a blocked producer.
+PUT_TIMEOUT = 0.5
+
+# item_queue: bounded queue object holding the produced items (None marks the end of the stream).
+# thread: producer thread object.
+# errors: list object holding the producer error (re-raised on the consumer thread).
+# stop: threading event object, set when the consumer stops reading.
+ItemStream = namedtuple('ItemStream', ['item_queue', 'thread', 'errors', 'stop'])
+
+# registered image streams of the tile csv files (normalised csv path: iterator object).
+STREAMS = {}
+
+
+def put_item_fn(item_stream, item):
+    """ Queue an item, waiting while the queue is full unless the consumer has stopped reading.
+
+    @param item_stream: ItemStream object.
+    @param item: item to queue.
+    @return: boolean object, False if the consumer has stopped reading.
+    """
+    while not item_stream.stop.is_set():
+        try:
+            item_stream.item_queue.put(item, timeout=PUT_TIMEOUT)
+            return True
+        except queue.Full:
+            continue
+
+    return False
+
+
+def producer_loop_fn(item_stream, items):
+    """ Queue the items of an iterable, then the end of stream item (None), recording any producer error.
+
+    @param item_stream: ItemStream object.
+    @param items: iterable object producing the items.
+    """
+    try:
+        for item in items:
+            if not put_item_fn(item_stream, item):
+                return
+
+    except Exception as err:
+        item_stream.errors.append(err)
+
+    finally:
+        put_item_fn(item_stream, None)
+
+
+def start_stream_fn(items, max_queue=MAX_QUEUE, name='zonal_image_stream'):
+    """ Start a producer thread reading an iterable (i.e. a directory walk generator) into a bounded queue.
+
+    @param items: iterable object producing the items (never None).
+    @param max_queue: integer object containing the number of items the producer may be ahead of the consumer.
+    @param name: string object containing the name of the producer thread.
+    @return item_stream: ItemStream object.
+    """
+    item_stream = ItemStream(queue.Queue(maxsize=max_queue), None, [], threading.Event())
+    thread = threading.Thread(target=producer_loop_fn, args=(item_stream, items), name=name)
+    thread.daemon = True
+    item_stream = item_stream._replace(thread=thread)
+    thread.start()
+
+    return item_stream
+
+
+def stream_items_fn(item_stream):
+    """ Yield the items of a stream as they are produced, re-raising a producer error at the end of the stream.
+
+    @param item_stream: ItemStream object.
+    @return: generator object yielding the items in production order.
+    """
+    try:
+        while True:
+            item = item_stream.item_queue.get()
+            if item is None:
+                break
+            yield item
+
+    finally:
+        # a consumer that stops early (error or close) stops the producer.
+        item_stream.stop.set()
+        item_stream.thread.join()
+
+    if item_stream.errors:
+        raise item_stream.errors[0]
+
+
+def threshold_fn(images, image_count):
+    """ Read a stream until the image count threshold is crossed (or the stream ends).
+
+    @param images: iterable object containing the image paths.
+    @param image_count: integer object containing the minimum number of images.
+    @return list_head: list object containing the images read (image_count images when the threshold is crossed).
+    @return images: iterator object containing every image of the stream (list_head followed by the unread images).
+    """
+    images = iter(images)
+    list_head = list(itertools.islice(images, max(int(image_count), 0)))
+
+    return list_head, itertools.chain(list_head, images)
+
+
+def batches_fn(images, batch_images=BATCH_IMAGES):
+    """ Group a stream of image paths into batches (blank lines are left out, as an image list csv file).
+
+    @param images: string object containing an image path, or an iterable object containing image paths.
+    @param batch_images: integer object containing the number of images per batch.
+    @return: generator object yielding a list of image paths per batch.
+    """
+    if isinstance(images, str):
+        images = [images]
+
+    batch = []
+    for image in images:
+        image_s = image.rstrip()
+        if not image_s:
+            continue
+
+        batch.append(image_s)
+        if len(batch) >= batch_images:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+def joins_groups_fn(batch, calculated):
+    """ Check whether an image of a batch would be combined with a same date image group of an earlier batch (a
+    group without an image of its directory, zonal_virtual_mosaic.group_same_date_images_fn).
+
+    @param batch: list object containing the image paths of the batch.
+    @param calculated: dictionary object (same date key: list object containing a set of image directories per
+    calculated group).
+    @return: boolean object.
+    """
+    for image_s in batch:
+        list_dirs = calculated.get(zonal_virtual_mosaic.image_group_key_fn(image_s), [])
+        if any(os.path.dirname(image_s) not in dirs for dirs in list_dirs):
+            return True
+
+    return False
+
+
+def add_groups_fn(batch, calculated):
+    """ Record the same date image groups of a calculated batch (joins_groups_fn).
+
+    @param batch: list object containing the image paths of the batch.
+    @param calculated: dictionary object (same date key: list object containing a set of image directories per
+    calculated group), updated.
+    """
+    for image_group in zonal_virtual_mosaic.group_same_date_images_fn(batch):
+        calculated.setdefault(zonal_virtual_mosaic.image_group_key_fn(image_group[0]), []).append(
+            set(os.path.dirname(i) for i in image_group))
+
+
+def tee_csv_fn(images, csv_path):
+    """ Create an image list csv file at once and write each image to it as it passes (one path per line).
+
+    @param images: iterable object containing the image paths.
+    @param csv_path: string object containing the path to the csv file.
+    @return: generator object yielding the image paths.
+    """
+    output = open(csv_path, "w")
+
+    def tee_fn():
+        with output:
+            writer = csv.writer(output, lineterminator='\n')
+            for image in images:
+                writer.writerow([image])
+                yield image
+
+    return tee_fn()
+
+
+def register_stream_fn(csv_path, images):
+    """ Register the image stream of a tile csv for the step1_6 scripts.
+
+    @param csv_path: string object containing the path to the tile csv file.
+    @param images: iterator object containing the image paths.
+    """
+    STREAMS[os.path.normpath(csv_path)] = images
+
+
+@contextmanager
+def open_images_fn(csv_path):
+    """ Open the image list of a tile csv: the registered stream (released on exit), or the csv file.
+
+    @param csv_path: string object containing the path to the tile csv file.
+    @return: tuple object (iterable object containing the image paths, batch_images for zonal_stats_api, None for
+    the csv file).
+    """
+    images = STREAMS.pop(os.path.normpath(csv_path), None)
+    if images is None:
+        with open(csv_path, 'r') as imagery_list:
+            yield imagery_list, None
+        return
+
+    try:
+        yield images, BATCH_IMAGES
+    finally:
+        # a stream that was not read to the end stops its producer.
+        close = getattr(images, 'close', None)
+        if close is not None:
+            close()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+
+"""
+zonal_memory_budget.py
+======================
+
+Description: This script converts the --memory_budget command argument into a memory plan for the zonal stats stage
+(read window size) and logs the resident memory (RSS) of the process after each stage so that the budget can be
+tuned.
+
+The budget sizes the read windows only (images are not read ahead). It is shared between the workers requested by
+compute_zonal_stats, so the window size of a single read is: (budget - current RSS) / (workers x READ_OVERHEAD).
+When a window no longer fits, the worker count is reduced before the read falls back to streaming the sites in
+blocks.
+
+Peak RSS is read from psutil where installed, from /proc or the resource module on Linux and from the Windows
+process memory counters otherwise.
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# import modules
+from __future__ import print_function, division
+from collections import namedtuple
+import os
+import sys
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# number of copies of a read window held at once (mosaic array, masked source read and rasterstats arrays).
+READ_OVERHEAD = 4
+
+# smallest read window (bytes) worth keeping workers for, below this they are reduced first.
+MIN_WINDOW_BYTES = 16 * 1024 ** 2
+
+UNITS = {'': 1, 'B': 1, 'K': 1024, 'KB': 1024, 'M': 1024 ** 2, 'MB': 1024 ** 2, 'G': 1024 ** 3, 'GB': 1024 ** 3,
+         'T': 1024 ** 4, 'TB': 1024 ** 4}
+
+# budget: memory budget in bytes (None: unbounded).
+# workers: number of concurrent workers that fit the budget.
+# window_bytes: largest single read window in bytes (None: unbounded).
+MemoryPlan = namedtuple('MemoryPlan', ['budget', 'workers', 'window_bytes'])
+
+
+def parse_memory_budget_fn(memory_budget):
+    """ Convert a memory budget (i.e. '4GB', '512MB', '2g' or a number of bytes) into bytes.
+
+    @param memory_budget: string or integer object containing the memory budget, None for unbounded.
+    @return: integer object containing the memory budget in bytes, None for unbounded.
+    """
+    if memory_budget is None:
+        return None
+
+    if isinstance(memory_budget, (int, float)):
+        return int(memory_budget)
+
+    value = str(memory_budget).strip().upper().replace(' ', '')
+    if value in ('', 'NONE', '0'):
+        return None
+
+    number = value.rstrip('KMGTB')
+    unit = value[len(number):]
+    if unit not in UNITS or not number:
+        raise ValueError("Unable to read the memory budget: {0} (i.e. 4GB or 512MB)".format(memory_budget))
+
+    return int(float(number) * UNITS[unit])
+
+
+def current_rss_fn():
+    """ Return the current resident memory (bytes) of this process, None if it can not be determined.
+    """
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+
+    if sys.platform.startswith('linux'):
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+    if sys.platform == 'win32':
+        return windows_memory_counters_fn()[1]
+
+    return None
+
+
+def peak_rss_fn():
+    """ Return the peak resident memory (bytes) of this process (since the last reset_peak_rss_fn call on Linux),
+    None if it can not be determined.
+    """
+    if sys.platform.startswith('linux'):
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+
+    if sys.platform == 'win32':
+        return windows_memory_counters_fn()[0]
+
+    if psutil is not None:
+        memory_info = psutil.Process().memory_info()
+        return getattr(memory_info, 'peak_wset', memory_info.rss)
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    # ru_maxrss is reported in bytes on macOS.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def reset_peak_rss_fn():
+    """ Reset the peak resident memory so that the next stage reports its own peak (Linux only, otherwise the peak
+    is reported since the start of the process).
+    """
+    if sys.platform.startswith('linux'):
+        try:
+            with open('/proc/self/clear_refs', 'w') as clear_refs:
+                clear_refs.write('5')
+        except (IOError, OSError):
+            pass
+
+
+def windows_memory_counters_fn():
+    """ Read the peak and current working set (bytes) of this process from the Windows process memory counters.
+
+    @return: tuple object (peak working set, working set).
+    """
+    import ctypes
+    from ctypes import wintypes
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                    ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                    ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                    ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+    counters = ProcessMemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+    ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(counters),
+                                             counters.cb)
+
+    return counters.PeakWorkingSetSize, counters.WorkingSetSize
+
+
+def memory_plan_fn(memory_budget, workers=1):
+    """ Size the read window and worker count so that their sum stays under the memory budget.
+
+    @param memory_budget: string or integer object containing the memory budget (see parse_memory_budget_fn).
+    @param workers: integer object containing the requested number of workers.
+    @return memory_plan: MemoryPlan object.
+    """
+    budget = parse_memory_budget_fn(memory_budget)
+    if budget is None:
+        return MemoryPlan(None, workers, None)
+
+    available = budget - (current_rss_fn() or 0)
+    if available <= 0:
+        print("WARNING: the process already uses more than the memory budget, streaming with the smallest windows.")
+        available = MIN_WINDOW_BYTES * READ_OVERHEAD
+
+    def window_fn(n_workers):
+        return available // (n_workers * READ_OVERHEAD)
+
+    while window_fn(workers) < MIN_WINDOW_BYTES and workers > 1:
+        workers -= 1
+
+    memory_plan = MemoryPlan(budget, workers, int(window_fn(workers)))
+    print("Memory plan: budget {0:.0f} MB, workers {1}, read window {2:.1f} MB".format(
+        budget / 1024 ** 2, workers, memory_plan.window_bytes / 1024 ** 2))
+
+    return memory_plan
+
+
+def log_peak_rss_fn(stage):
+    """ Print the peak and current resident memory of the process for a stage, then reset the peak (Linux).
+
+    @param stage: string object containing the name of the stage (i.e. 'h99 zonal stats').
+    """
+    peak = peak_rss_fn()
+    current = current_rss_fn()
+
+    if peak is None:
+        print("{0}: peak RSS not available on this platform".format(stage))
+    else:
+        print("{0}: peak RSS {1:.1f} MB (current {2:.1f} MB)".format(stage, peak / 1024 ** 2,
+                                                                     (current or 0) / 1024 ** 2))
+
+    reset_peak_rss_fn()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+
+"""
+zonal_output_writer.py
+======================
+
+Description: This script writes the zonal stats csv outputs (per site csv files) from a background thread so that a
+slow network share (i.e. U:\\scratch) does not stall the zonal stats. One writer is started per pipeline run and
+passed to the step1_6 scripts, so the csv files of a product are written while the next product is calculated, and
+the writer is closed when the run ends (or fails).
+
+Dataframes are passed to the writer through a bounded queue (the loop only blocks when the writer falls
+max_queue outputs behind). flush_writer_fn waits until every queued output has been written, and close_writer_fn
+also stops the thread. Both re-raise the first write error on the main thread. A failed write is also reported by
+the next submit_csv_fn call.
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# import modules
+from __future__ import print_function, division
+from collections import namedtuple
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# default number of outputs that may be waiting to be written before the zonal stats loop blocks.
+MAX_QUEUE = 16
+
+# output_queue: bounded queue object holding (dataframe, path, to_csv keyword arguments) items.
+# thread: background thread object writing the queued outputs.
+# errors: list object holding the write errors (the first one is re-raised on the main thread).
+OutputWriter = namedtuple('OutputWriter', ['output_queue', 'thread', 'errors'])
+
+
+def writer_loop_fn(output_writer):
+    """ Write the queued outputs until the stop item (None) is received, recording any write error.
+
+    @param output_writer: OutputWriter object.
+    """
+    while True:
+        item = output_writer.output_queue.get()
+        try:
+            if item is None:
+                return
+
+            df, path, kwargs = item
+            if not output_writer.errors:
+                df.to_csv(path, **kwargs)
+
+        except Exception as err:
+            output_writer.errors.append((path, err))
+
+        finally:
+            output_writer.output_queue.task_done()
+
+
+def start_writer_fn(max_queue=MAX_QUEUE):
+    """ Start the background csv writer.
+
+    @param max_queue: integer object containing the number of outputs that may be waiting to be written.
+    @return output_writer: OutputWriter object.
+    """
+    output_writer = OutputWriter(queue.Queue(maxsize=max_queue), None, [])
+    thread = threading.Thread(target=writer_loop_fn, args=(output_writer,), name='zonal_output_writer')
+    thread.daemon = True
+    output_writer = output_writer._replace(thread=thread)
+    thread.start()
+
+    return output_writer
+
+
+def raise_writer_error_fn(output_writer):
+    """ Re-raise the first write error on the main thread.
+
+    @param output_writer: OutputWriter object.
+    """
+    if output_writer.errors:
+        path, err = output_writer.errors[0]
+        raise IOError("Unable to write {0}: {1}".format(path, err))
+
+
+def submit_csv_fn(output_writer, df, path, index=False, **kwargs):
+    """ Queue a dataframe to be written to a csv file (blocks only while the queue is full). The dataframe must not
+    be modified after it has been submitted.
+
+    @param output_writer: OutputWriter object, None writes the csv immediately (previous behaviour).
+    @param df: dataframe object to export.
+    @param path: string object containing the output csv file path.
+    @param index: boolean object passed to to_csv -- default False.
+    """
+    if output_writer is None:
+        df.to_csv(path, index=index, **kwargs)
+        return
+
+    raise_writer_error_fn(output_writer)
+    kwargs['index'] = index
+    output_writer.output_queue.put((df, path, kwargs))
+
+
+def flush_writer_fn(output_writer):
+    """ Wait until every queued output has been written (i.e. before the csv files are read back).
+
+    @param output_writer: OutputWriter object.
+    """
+    output_writer.output_queue.join()
+    raise_writer_error_fn(output_writer)
+
+
+def close_writer_fn(output_writer):
+    """ Write the remaining outputs and stop the background thread.
+
+    @param output_writer: OutputWriter object.
+    """
+    output_writer.output_queue.put(None)
+    output_writer.thread.join()
+    raise_writer_error_fn(output_writer)
@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+
+"""
+zonal_point_sample.py
+=====================
+
+Description: This script samples the pixel value under the centre of each site (or a 3x3 / 5x5 pixel kernel around
+it) in place of the zonal stats over the full site geometry, for the models that only use the site centre.
+
+The site centres (the site points, or the centroid of each site polygon -- the 1ha squares of step1_3 are centred on
+the site csv points) are converted to raster row/col offsets once per pixel grid and kept in the SiteCache, so each
+image only reads the kernel window of each site. Pixels outside the image are treated as no data, and same date
+images of adjacent tiles fill the kernel pixels that the first image does not cover.
+
+The statistics are calculated over the valid kernel pixels with the rasterstats definitions and returned in the
+rasterstats result order, so the outputs have the same layout as the zonal stats outputs.
+
+Kernels:
+    1 - the pixel under the site centre.
+    3 - the 3x3 pixel neighbourhood of the site centre.
+    5 - the 5x5 pixel neighbourhood of the site centre.
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# import modules
+from __future__ import print_function, division
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import warnings
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+import zonal_geometry_cache
+import zonal_image_header
+import zonal_image_precheck
+
+# kernel options of the point sample mode (option: pixels per side).
+KERNELS = {'1': 1, '1x1': 1, '3': 3, '3x3': 3, '5': 5, '5x5': 5}
+
+# rows, cols: int arrays, raster row and column of each site centre.
+# valid: boolean array, False where the site has no centre (empty geometry).
+PointOffsets = namedtuple('PointOffsets', ['rows', 'cols', 'valid'])
+
+
+def kernel_size_fn(kernel):
+    """ Convert a kernel option (i.e. 3, '3' or '3x3') into the kernel size.
+
+    @param kernel: integer or string object containing the kernel option.
+    @return: integer object (1, 3 or 5).
+    """
+    size = KERNELS.get(str(kernel).lower())
+    if size is None:
+        raise ValueError("Unknown point sample kernel: {0} (options: 1, 3x3, 5x5)".format(kernel))
+
+    return size
+
+
+def point_offsets_fn(site_cache, crs, transform):
+    """ Return the raster row/col of every site centre for a pixel grid, converting them on the first request only.
+
+    @param site_cache: SiteCache object.
+    @param crs: crs object of the raster.
+    @param transform: affine object containing the raster transform.
+    @return offsets: PointOffsets object (site order).
+    """
+    key = ('point', zonal_geometry_cache.crs_key_fn(crs)) + tuple(round(float(i), 6) for i in tuple(transform)[:6])
+    offsets = site_cache.zone_indexes.get(key)
+    if offsets is None:
+        sites = zonal_geometry_cache.sites_in_crs_fn(site_cache, crs)
+        centres = sites.geometry.centroid
+        cols, rows = ~transform * (centres.x.values, centres.y.values)
+        valid = np.isfinite(rows) & np.isfinite(cols)
+        offsets = PointOffsets(np.floor(np.where(valid, rows, 0)).astype('int64'),
+                               np.floor(np.where(valid, cols, 0)).astype('int64'), valid)
+        site_cache.zone_indexes[key] = offsets
+
+    return offsets
+
+
+def read_kernels_fn(src, band, offsets, size, no_data):
+    """ Read the kernel window of every site centre (pixels outside the image are filled with no data).
+
+    @param src: open rasterio dataset.
+    @param band: integer object containing the band number.
+    @param offsets: PointOffsets object of the dataset pixel grid.
+    @param size: integer object containing the kernel size.
+    @param no_data: no data value of the imagery.
+    @return values: numpy array object (sites x kernel pixels, float64).
+    """
+    half = size // 2
+    values = np.full((offsets.rows.size, size, size), np.nan if no_data is None else no_data, dtype='float64')
+
+    for position in np.flatnonzero(offsets.valid):
+        row_st = offsets.rows[position] - half
+        col_st = offsets.cols[position] - half
+        row_a, row_b = max(row_st, 0), min(row_st + size, src.height)
+        col_a, col_b = max(col_st, 0), min(col_st + size, src.width)
+        if row_a >= row_b or col_a >= col_b:
+            continue
+
+        values[position, row_a - row_st:row_b - row_st, col_a - col_st:col_b - col_st] = src.read(
+            band, window=Window(col_a, row_a, col_b - col_a, row_b - row_a))
+
+    return values.reshape(offsets.rows.size, size * size)
+
+
+def valid_pixels_fn(values, no_data):
+    """ Return the valid (not no data / NaN) kernel pixels.
+
+    @param values: numpy array object (sites x kernel pixels).
+    @param no_data: no data value of the imagery.
+    @return: boolean numpy array object.
+    """
+    valid = ~np.isnan(values)
+    if no_data is not None:
+        valid &= values != no_data
+
+    return valid
+
+
+def kernel_stats_fn(values, no_data, stat_names):
+    """ Calculate the statistics of the valid kernel pixels of every site (rasterstats definitions).
+
+    @param values: numpy array object (sites x kernel pixels).
+    @param no_data: no data value of the imagery.
+    @param stat_names: list object containing the statistic names (rasterstats result order).
+    @return results: numpy array object (sites x statistics), NaN (count 0) for sites without valid pixels.
+    """
+    valid = valid_pixels_fn(values, no_data)
+    masked = np.where(valid, values, np.nan)
+    count = valid.sum(axis=1)
+
+    results = np.full((values.shape[0], len(stat_names)), np.nan)
+    with warnings.catch_warnings():
+        # sites without valid pixels (All-NaN slice) are set to NaN below.
+        warnings.simplefilter('ignore', RuntimeWarning)
+        for column, stat in enumerate(stat_names):
+            if stat == 'count':
+                results[:, column] = count
+            elif stat == 'min':
+                results[:, column] = np.nanmin(masked, axis=1)
+            elif stat == 'max':
+                results[:, column] = np.nanmax(masked, axis=1)
+            elif stat == 'mean':
+                results[:, column] = np.nanmean(masked, axis=1)
+            elif stat == 'sum':
+                results[:, column] = np.nansum(masked, axis=1)
+            elif stat == 'std':
+                results[:, column] = np.nanstd(masked, axis=1)
+            elif stat == 'median':
+                results[:, column] = np.nanmedian(masked, axis=1)
+            elif stat == 'range':
+                results[:, column] = np.nanmax(masked, axis=1) - np.nanmin(masked, axis=1)
+            elif stat.startswith('percentile_'):
+                results[:, column] = np.nanpercentile(masked, float(stat[len('percentile_'):]), axis=1)
+            elif stat in ('majority', 'minority', 'unique'):
+                for position in np.flatnonzero(count):
+                    keys, counts = np.unique(masked[position][valid[position]], return_counts=True)
+                    if stat == 'unique':
+                        results[position, column] = keys.size
+                    else:
+                        # first (lowest) value of the highest / lowest count, as rasterstats.
+                        results[position, column] = keys[np.argmax(counts) if stat == 'majority' else
+                                                         np.argmin(counts)]
+            elif stat == 'nodata':
+                results[:, column] = (values == no_data).sum(axis=1)
+            elif stat == 'nan':
+                results[:, column] = np.isnan(values).sum(axis=1)
+
+    empty = count == 0
+    for column, stat in enumerate(stat_names):
+        if stat not in ('count', 'nodata', 'nan'):
+            results[empty, column] = np.nan
+
+    return results
+
+
+def point_sample_group_fn(image_group, site_cache, stat_names, band, no_data, size):
+    """ Sample the kernel of every site centre for one image group.
+
+    @param image_group: list object containing the same date image paths (the first image sets the pixel grid).
+    @param site_cache: SiteCache object.
+    @param stat_names: list object containing the statistic names (rasterstats result order).
+    @param band: integer object containing the band number.
+    @param no_data: no data value of the imagery.
+    @param size: integer object containing the kernel size.
+    @return results: numpy array object (sites x statistics).
+    @return precheck_counts: dictionary object counting the processed and skipped images of this group.
+    """
+    precheck_counts = zonal_image_precheck.new_precheck_counts_fn()
+
+    # an image without valid data over the sites is skipped from its registered header without being opened.
+    header = zonal_image_header.image_header_fn(image_group[0], read=False)
+    if header is not None:
+        sites = zonal_geometry_cache.sites_in_crs_fn(site_cache, header.crs)
+        if not zonal_image_precheck.header_precheck_fn(header, image_group[1:], band, sites):
+            zonal_image_precheck.record_precheck_fn(precheck_counts, True)
+            return kernel_stats_fn(np.full((len(sites), size * size), np.nan), no_data, stat_names), precheck_counts
+
+    with rasterio.open(image_group[0], nodata=no_data) as srci:
+        sites = zonal_geometry_cache.sites_in_crs_fn(site_cache, srci.crs)
+        if not zonal_image_precheck.metadata_precheck_fn(srci, image_group[1:], band, sites):
+            zonal_image_precheck.record_precheck_fn(precheck_counts, True)
+            return kernel_stats_fn(np.full((len(sites), size * size), np.nan), no_data, stat_names), precheck_counts
+
+        values = read_kernels_fn(srci, band, point_offsets_fn(site_cache, srci.crs, srci.transform), size, no_data)
+
+    for image in image_group[1:]:
+        # same date images of adjacent tiles fill the kernel pixels without valid data (nearest pixel of their grid).
+        missing = ~valid_pixels_fn(values, no_data)
+        if not missing.any():
+            break
+
+        with rasterio.open(image, nodata=no_data) as src_other:
+            other = read_kernels_fn(src_other, band, point_offsets_fn(site_cache, src_other.crs, src_other.transform),
+                                    size, no_data)
+        fill = missing & valid_pixels_fn(other, no_data)
+        values[fill] = other[fill]
+
+    zonal_image_precheck.record_precheck_fn(precheck_counts, not valid_pixels_fn(values, no_data).any())
+
+    return kernel_stats_fn(values, no_data, stat_names), precheck_counts
+
+
+def point_sample_engine_fn(list_group, site_cache, stats, band, no_data, kernel=1, memory_plan=None):
+    """ Sample the kernel of every site centre for every image group, the image groups are processed by a thread
+    pool when the memory plan allows workers.
+
+    @param list_group: list object containing a list of same date image paths for each date.
+    @param site_cache: SiteCache object.
+    @param stats: list object containing the statistics to calculate.
+    @param band: integer object containing the band number.
+    @param no_data: no data value of the imagery.
+    @param kernel: integer or string object containing the kernel option (1, 3x3 or 5x5) -- default 1.
+    @param memory_plan: MemoryPlan object (zonal_memory_budget), None for a single worker.
+    @return: list object containing a tuple (numpy array (sites x statistics, rasterstats result order), precheck
+    counts dictionary) for each image group.
+    """
+    size = kernel_size_fn(kernel)
+    stat_names = zonal_image_precheck.stat_names_fn(stats)
+    workers = 1 if memory_plan is None else memory_plan.workers
+
+    def group_fn(image_group):
+        return point_sample_group_fn(image_group, site_cache, stat_names, band, no_data, size)
+
+    if workers > 1 and len(list_group) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(group_fn, list_group))
+
+    return [group_fn(image_group) for image_group in list_group]
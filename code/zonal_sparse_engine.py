@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+
+"""
+zonal_sparse_engine.py
+======================
+
+Description: This script calculates the moment statistics (count, sum, mean and std) of every site for a stack of
+images as sparse matrix products, in place of a rasterstats call per image.
+
+For a pixel grid the sites are rasterised once into a membership matrix A (sites x pixels, scipy.sparse CSR, only the
+pixels covered by a site are kept). The site pixels of a batch of images are stacked into a value matrix X
+(pixels x images) with its validity matrix V (pixels that are not no data/NaN), and a single product
+
+    A . [V, X, X^2]
+
+returns the valid pixel count, the sum and the sum of squares of every site for every image of the batch. The values
+are shifted by the mean of each image before the product so that the variance (sum of squares / count - mean^2) does
+not lose precision. A is kept in the SiteCache (one per pixel grid and site block), so a tile is only rasterised once.
+
+Images are batched by pixel grid (same crs and transform, i.e. the images of one tile) and the batch size is limited
+by the memory plan. Same date images of adjacent tiles are combined and sites are streamed in blocks exactly as for
+the rasterstats engine (zonal_virtual_mosaic), so both engines read the same pixels.
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# import modules
+from __future__ import print_function, division
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from scipy import sparse
+import zonal_geometry_cache
+import zonal_virtual_mosaic
+import zonal_image_precheck
+import zonal_image_header
+import zonal_zone_index
+
+# statistics calculated by this engine.
+MOMENT_STATS = ('count', 'sum', 'mean', 'std')
+
+# largest number of images stacked into one value matrix (further limited by the memory plan).
+BATCH_SIZE = 256
+
+# matrix: scipy.sparse CSR matrix object (sites in the block x site pixels), 1 where a pixel is covered by a site.
+# pixels: int array, flat position of each column of the matrix within the block window.
+# shape: tuple object (height, width) of the block window.
+Membership = namedtuple('Membership', ['matrix', 'pixels', 'shape'])
+
+
+def supported_stats_fn(stats):
+    """ Check whether every requested statistic can be calculated by this engine.
+
+    @param stats: list object containing the requested statistics (None: rasterstats defaults).
+    @return: boolean object.
+    """
+    return all(i in MOMENT_STATS for i in zonal_image_precheck.stat_names_fn(stats))
+
+
+def membership_fn(site_cache, block_sites, block, transform, crs, all_touched):
+    """ Return the membership matrix of a site block for a pixel grid, rasterising the sites on the first request only.
+
+    @param site_cache: SiteCache object (the matrices are kept in site_cache.zone_indexes).
+    @param block_sites: geo-dataframe object containing the sites of the block in the grid crs.
+    @param block: integer numpy array object containing the positions of the block sites.
+    @param transform: affine object containing the reference image transform.
+    @param crs: crs object of the reference image.
+    @param all_touched: boolean object passed to the rasteriser.
+    @return membership: Membership object.
+    """
+    west, south, east, north = zonal_virtual_mosaic.snap_bounds_fn(*block_sites.total_bounds, transform=transform)
+    width = int(round((east - west) / transform.a))
+    height = int(round((north - south) / -transform.e))
+    window_transform = from_origin(west, north, transform.a, -transform.e)
+
+    key = ('sparse',) + zonal_zone_index.grid_key_fn(window_transform, width, height) + (
+        bool(all_touched), zonal_geometry_cache.crs_key_fn(crs), block.tobytes())
+    membership = site_cache.zone_indexes.get(key)
+    if membership is None:
+        zone_index = zonal_zone_index.build_zone_index_fn(block_sites.geometry.values, window_transform, width, height,
+                                                          all_touched)
+        # pixel positions within the block window (the zone index is relative to the window covering the sites).
+        window_width = int(zone_index.window.width) or 1
+        rows = zone_index.pixel_index // window_width + int(zone_index.window.row_off)
+        cols = zone_index.pixel_index % window_width + int(zone_index.window.col_off)
+        pixels, columns = np.unique(rows * width + cols, return_inverse=True)
+        matrix = sparse.csr_matrix((np.ones(columns.size), (zone_index.zone_ids, columns)),
+                                   shape=(len(block), pixels.size))
+        membership = Membership(matrix, pixels, (height, width))
+        site_cache.zone_indexes[key] = membership
+
+    return membership
+
+
+def read_site_pixels_fn(image_group, band, no_data, list_block):
+    """ Read the block windows of an image group (opened once) and return the values of the site pixels.
+
+    @param image_group: list object containing the same date image paths (the first image sets the pixel grid).
+    @param band: integer object containing the band number.
+    @param no_data: no data value of the imagery.
+    @param list_block: list object containing a tuple (block sites geo-dataframe, Membership object) for each block.
+    @return list_values: list object containing the site pixel values of each block (membership column order).
+    @return has_data: boolean object, True if a block window holds a valid pixel.
+    """
+    list_values = []
+    has_data = False
+    with rasterio.open(image_group[0], nodata=no_data) as srci:
+        for block_sites, membership in list_block:
+            array, _ = zonal_virtual_mosaic.read_sites_window_fn(srci, image_group[1:], band, no_data, block_sites)
+            if array.shape != membership.shape:
+                raise ValueError("Unexpected window shape {0} for {1} (expected {2})".format(
+                    array.shape, image_group[0], membership.shape))
+
+            list_values.append(array.ravel()[membership.pixels])
+            has_data = has_data or zonal_image_precheck.window_has_data_fn(array, no_data)
+
+    return list_values, has_data
+
+
+def moment_stats_fn(matrix, values, no_data):
+    """ Calculate the count, sum, mean and std of every site for a stack of images with one sparse matrix product.
+
+    @param matrix: scipy.sparse matrix object (sites x site pixels).
+    @param values: numpy array object (site pixels x images) containing the pixel values.
+    @param no_data: no data value (pixels equal to no_data or NaN are excluded).
+    @return: dictionary object (statistic: numpy array (sites x images)), NaN where a site has no valid pixel.
+    """
+    values = values.astype(np.float64)
+    valid = ~np.isnan(values)
+    if no_data is not None:
+        valid &= values != no_data
+
+    # shift each image by its valid pixel mean so that the sum of squares does not lose precision.
+    n_valid = valid.sum(axis=0)
+    shift = np.where(n_valid > 0, np.where(valid, values, 0).sum(axis=0) / np.maximum(n_valid, 1), 0)
+    shifted = np.where(valid, values - shift, 0)
+
+    n_images = values.shape[1]
+    product = matrix.dot(np.hstack([valid.astype(np.float64), shifted, shifted * shifted]))
+    count = product[:, :n_images]
+    shifted_sum = product[:, n_images:2 * n_images]
+    shifted_squares = product[:, 2 * n_images:]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        shifted_mean = np.where(count > 0, shifted_sum / count, np.nan)
+        variance = np.maximum(shifted_squares / count - shifted_mean * shifted_mean, 0)
+
+    return {'count': count,
+            'sum': np.where(count > 0, shifted_sum + shift * count, np.nan),
+            'mean': shifted_mean + shift,
+            'std': np.sqrt(variance)}
+
+
+def sparse_engine_fn(list_group, site_cache, stats, band, no_data, all_touched=False, memory_plan=None,
+                     block_pixels=None):
+    """ Calculate the moment statistics of every site for every image group with sparse matrix products.
+
+    @param list_group: list object containing a list of same date image paths for each date.
+    @param site_cache: SiteCache object.
+    @param stats: list object containing the statistics (count, sum, mean and/or std).
+    @param band: integer object containing the band number.
+    @param no_data: no data value of the imagery.
+    @param all_touched: boolean object, True includes every pixel touched by a site.
+    @param memory_plan: MemoryPlan object (zonal_memory_budget) limiting the window and batch sizes, None unbounded.
+    @param block_pixels: integer object containing the largest site block window in pixels (zonal_engine_select),
+    None for a single window.
+    @return list_result: list object containing a tuple (numpy array (sites x statistics, rasterstats result order),
+    precheck counts dictionary) for each image group.
+    """
+    if not supported_stats_fn(stats):
+        raise ValueError("The sparse engine calculates {0} only, use the rasterstats engine for: {1}".format(
+            ', '.join(MOMENT_STATS), ', '.join(i for i in zonal_image_precheck.stat_names_fn(stats)
+                                               if i not in MOMENT_STATS)))
+
+    stat_names = zonal_image_precheck.stat_names_fn(stats)
+    window_bytes = None if memory_plan is None else memory_plan.window_bytes
+    workers = 1 if memory_plan is None else memory_plan.workers
+    n_sites = len(site_cache.source)
+    if n_sites == 0:
+        return [(np.empty((0, len(stat_names))), zonal_image_precheck.new_precheck_counts_fn()) for _ in list_group]
+
+    list_result = [None] * len(list_group)
+
+    # batch the image groups by pixel grid (crs and transform of the reference image), skipping the images that can
+    # not hold valid data over the sites. The registered headers (zonal_image_header) are used when harvested, so the
+    # images are only opened to read the site windows.
+    grids = OrderedDict()
+    for position, image_group in enumerate(list_group):
+        header = zonal_image_header.image_header_fn(image_group[0])
+        sites = zonal_geometry_cache.sites_in_crs_fn(site_cache, header.crs)
+        if not zonal_image_precheck.header_precheck_fn(header, image_group[1:], band, sites):
+            values = np.full((n_sites, len(stat_names)), np.nan)
+            if 'count' in stat_names:
+                values[:, stat_names.index('count')] = 0
+            precheck_counts = zonal_image_precheck.new_precheck_counts_fn()
+            zonal_image_precheck.record_precheck_fn(precheck_counts, True)
+            list_result[position] = (values, precheck_counts)
+            continue
+
+        grid = grids.setdefault(zonal_image_header.grid_key_fn(header), {
+            'crs': header.crs, 'transform': header.transform, 'sites': sites,
+            'itemsize': np.dtype(header.dtypes[band - 1]).itemsize, 'positions': []})
+        grid['positions'].append(position)
+
+    for grid in grids.values():
+        positions = grid['positions']
+        sites = grid['sites']
+        results = np.full((n_sites, len(positions), len(stat_names)), np.nan)
+        has_data = np.zeros(len(positions), dtype=bool)
+
+        max_pixels = zonal_virtual_mosaic.max_block_pixels_fn(window_bytes, grid['itemsize'], block_pixels)
+        blocks = zonal_virtual_mosaic.site_blocks_fn(sites, grid['transform'], max_pixels)
+        list_block = []
+        for block in blocks:
+            block_sites = sites.iloc[block]
+            list_block.append((block_sites, membership_fn(site_cache, block_sites, block, grid['transform'],
+                                                          grid['crs'], all_touched)))
+
+        # images per value matrix: the stacked site pixels (values, validity and squares) within the read window.
+        n_pixels = sum(membership.pixels.size for _, membership in list_block)
+        batch_size = BATCH_SIZE
+        if window_bytes is not None and n_pixels:
+            batch_size = int(min(BATCH_SIZE, max(1, window_bytes // (n_pixels * 8 * 4))))
+
+        def read_fn(position):
+            return read_site_pixels_fn(list_group[position], band, no_data, list_block)
+
+        for start in range(0, len(positions), batch_size):
+            batch = positions[start:start + batch_size]
+            columns = np.arange(start, start + len(batch))
+
+            if workers > 1 and len(batch) > 1:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    list_read = list(executor.map(read_fn, batch))
+            else:
+                list_read = [read_fn(position) for position in batch]
+
+            has_data[columns] = [i[1] for i in list_read]
+
+            for block_position, (block, (_, membership)) in enumerate(zip(blocks, list_block)):
+                if membership.pixels.size:
+                    values = np.column_stack([i[0][block_position] for i in list_read])
+                else:
+                    values = np.empty((0, len(batch)))
+
+                moments = moment_stats_fn(membership.matrix, values, no_data)
+                for column, stat in enumerate(stat_names):
+                    results[block[:, None], columns[None, :], column] = moments[stat]
+
+        for column, position in enumerate(positions):
+            precheck_counts = zonal_image_precheck.new_precheck_counts_fn()
+            zonal_image_precheck.record_precheck_fn(precheck_counts, not has_data[column])
+            list_result[position] = (results[:, column, :], precheck_counts)
+
+    return list_result
@@ -0,0 +1,358 @@
+#!/usr/bin/env python
+
+"""
+zonal_stats_api.py
+==================
+
+Description: This script exposes the zonal stats engine as a library function so that it can be called from a
+notebook or a scheduler without the directory setup and temporary csv files of the step1_6 scripts:
+
+    import zonal_stats_api
+    df = zonal_stats_api.compute_zonal_stats(image_list, 'sites.shp', ['count', 'mean', 'std'], workers=4)
+
+The results are returned in memory (pandas dataframe, or a pyarrow table where pyarrow is installed). The site
+geometries, their re-projections and the zone indexes / membership matrices built by the engines are kept between
+calls: a shapefile path is read once per modification time, and a SiteCache returned by load_sites_fn can be passed
+to every call. clear_caches_fn releases the shapefile caches and the image headers.
+
+Engines (engine='auto' chooses one per call from the statistics, site layout and image count, zonal_engine_select):
+    rasterstats - every rasterstats statistic, one rasterstats call per image (zonal_virtual_mosaic).
+    sparse      - count, sum, mean and std only, sparse matrix products over a stack of images (zonal_sparse_engine).
+
+Point sample mode (kernel=1, 3 or 5): the statistics of the pixel under each site centre or of its 3x3 / 5x5 pixel
+kernel, only the kernel windows are read (zonal_point_sample). The output layout is unchanged.
+
+Nested buffers (buffers=[50, 100, 250]): the 1ha, 4ha and 25ha squares around each site centre are stacked into one
+set of sites (zonal_geometry_cache), so every scale is calculated from the read window of the largest buffer and the
+output holds a scale feature (one row per site, image and scale).
+
+Streamed images (batch_images=32): the images streamed from the discovery stage (zonal_image_stream) are calculated in
+batches as they arrive, so the zonal stats overlap the walk of the tile directory. When a same date image of another
+tile directory arrives after its group was calculated, the whole image list is calculated at the end of the stream
+(same date images of adjacent tiles are always combined).
+
+The step1_6 scripts are thin wrappers around compute_zonal_stats (cleaning and per site csv outputs).
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# import modules
+from __future__ import print_function, division
+from concurrent.futures import ThreadPoolExecutor
+import os
+import time
+import pandas as pd
+import rasterio
+import zonal_geometry_cache
+import zonal_virtual_mosaic
+import zonal_memory_budget
+import zonal_image_precheck
+import zonal_image_header
+import zonal_sparse_engine
+import zonal_engine_select
+import zonal_point_sample
+import zonal_image_stream
+import image_name_parser
+
+# site caches of the shapefiles read so far (absolute path: (modification time, SiteCache)).
+SITE_CACHES = {}
+
+
+def rasterstats_group_fn(image_group, site_cache, stats, band, no_data, all_touched, window_bytes, block_pixels):
+    """ Calculate the zonal stats of every site for one image group with rasterstats.
+
+    @param image_group: list object containing the same date image paths (the first image sets the pixel grid).
+    @param site_cache: SiteCache object.
+    @return records: list object containing the statistic values of each site (rasterstats result order).
+    @return precheck_counts: dictionary object counting the processed and skipped images of this group.
+    """
+    precheck_counts = zonal_image_precheck.new_precheck_counts_fn()
+
+    # an image without valid data over the sites is skipped from its registered header without being opened.
+    header = zonal_image_header.image_header_fn(image_group[0], read=False)
+    if header is not None:
+        sites = zonal_geometry_cache.sites_in_crs_fn(site_cache, header.crs)
+        if not zonal_image_precheck.header_precheck_fn(header, image_group[1:], band, sites):
+            zonal_image_precheck.record_precheck_fn(precheck_counts, True)
+            empty = list(zonal_image_precheck.empty_zone_stats_fn(stats).values())
+            return [list(empty) for _ in range(len(sites))], precheck_counts
+
+    with rasterio.open(image_group[0], nodata=no_data) as srci:
+        sites = zonal_geometry_cache.sites_in_crs_fn(site_cache, srci.crs)
+        zs = zonal_virtual_mosaic.site_zonal_stats_fn(srci, image_group[1:], band, no_data, sites, window_bytes,
+                                                      precheck_counts, block_pixels, stats=stats,
+                                                      all_touched=all_touched)
+
+    return [list(zone.values()) for zone in zs], precheck_counts
+
+
+def rasterstats_engine_fn(list_group, site_cache, stats, band, no_data, all_touched=False, memory_plan=None,
+                          block_pixels=None):
+    """ Calculate the zonal stats of every site for every image group with rasterstats (windowed reads, see
+    zonal_virtual_mosaic), the image groups are processed by a thread pool when the memory plan allows workers.
+
+    @param list_group: list object containing a list of same date image paths for each date.
+    @param site_cache: SiteCache object.
+    @param stats: list object containing the statistics to calculate.
+    @param band: integer object containing the band number.
+    @param no_data: no data value of the imagery.
+    @param all_touched: boolean object, True includes every pixel touched by a site.
+    @param memory_plan: MemoryPlan object (zonal_memory_budget), None for unbounded.
+    @param block_pixels: integer object containing the largest site block window in pixels (zonal_engine_select),
+    None for a single window.
+    @return: list object containing a tuple (site records, precheck counts dictionary) for each image group.
+    """
+    window_bytes = None if memory_plan is None else memory_plan.window_bytes
+    workers = 1 if memory_plan is None else memory_plan.workers
+
+    def group_fn(image_group):
+        return rasterstats_group_fn(image_group, site_cache, stats, band, no_data, all_touched, window_bytes,
+                                    block_pixels)
+
+    if workers > 1 and len(list_group) > 1:
+        # rasterio releases the GIL while reading, so the image groups are processed by a thread pool (result order
+        # follows the image list).
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(group_fn, list_group))
+
+    return [group_fn(image_group) for image_group in list_group]
+
+
+# zonal stats engines (name: function with the rasterstats_engine_fn signature).
+ENGINES = {'rasterstats': rasterstats_engine_fn,
+           'sparse': zonal_sparse_engine.sparse_engine_fn}
+
+
+def load_sites_fn(sites):
+    """ Return the SiteCache of the sites, re-using the cache of a shapefile path read by a previous call (unless the
+    file has been modified since).
+
+    @param sites: string object containing the path to the site shapefile, a geo-dataframe or a SiteCache.
+    @return: SiteCache object.
+    """
+    if not isinstance(sites, str):
+        return zonal_geometry_cache.site_cache_fn(sites)
+
+    key = os.path.abspath(sites)
+    modified = os.path.getmtime(sites)
+    cached = SITE_CACHES.get(key)
+    if cached is None or cached[0] != modified:
+        cached = (modified, zonal_geometry_cache.site_cache_fn(sites))
+        SITE_CACHES[key] = cached
+
+    return cached[1]
+
+
+def clear_caches_fn():
+    """ Release the site caches (and their zone indexes) of the shapefiles read so far, and the registered image
+    headers.
+    """
+    SITE_CACHES.clear()
+    zonal_image_header.clear_headers_fn()
+
+
+def image_groups_fn(images):
+    """ Return the same date image groups of an image path or image list.
+
+    @param images: string object containing an image path, or an iterable object containing image paths (i.e. an open
+    csv file, one path per line).
+    @return: list object containing a list of image paths for each date.
+    """
+    if isinstance(images, str):
+        images = [images]
+
+    return zonal_virtual_mosaic.group_same_date_images_fn(images)
+
+
+def group_frame_fn(image_group, records, site_cache, stat_names, band, uid):
+    """ Create the dataframe of one image group (one row per site).
+
+    @param image_group: list object containing the same date image paths.
+    @param records: list or numpy array object containing the statistic values of each site (stat_names order).
+    @param site_cache: SiteCache object.
+    @param stat_names: list object containing the statistic names (rasterstats result order).
+    @param band: integer object containing the band number.
+    @param uid: string object containing the site unique identifier feature.
+    @return df: dataframe object (uid, site, statistics, band, image and date features, and scale for nested buffers).
+    """
+    image_name = image_name_parser.parse_image_name_fn(image_group[0])
+    df = pd.DataFrame(records, columns=stat_names)
+    df.insert(0, 'uid', site_cache.source[uid].values)
+    df.insert(1, 'site', site_cache.source['site_name'].values)
+    df['band'] = band
+    df['image'] = image_name.name
+    df['date'] = image_name.date
+    if 'scale' in site_cache.source.columns:
+        df['scale'] = site_cache.source['scale'].values
+
+    return df
+
+
+def compute_zonal_stats(images, sites, stats=None, band=1, no_data=0, uid='uid', engine='auto', workers=1,
+                        memory_budget=None, all_touched=False, output='pandas', precheck_counts=None, kernel=None,
+                        buffers=None, headers=None, batch_images=None):
+    """ Calculate the zonal stats of every site for every image (same date images of adjacent tiles are combined) and
+    return them in memory.
+
+    @param images: string object containing an image path, or an iterable object containing image paths (i.e. an open
+    csv file, one path per line).
+    @param sites: string object containing the path to the site shapefile, a geo-dataframe or a SiteCache (features
+    uid and site_name).
+    @param stats: list object containing the rasterstats statistics -- default ['count', 'min', 'max', 'mean'].
+    @param band: integer object containing the band number -- default 1.
+    @param no_data: no data value of the imagery -- default 0.
+    @param uid: string object containing the site unique identifier feature -- default 'uid'.
+    @param engine: string object containing the name of the zonal stats engine (ENGINES), or 'auto' to choose the
+    engine from the statistics and image count (zonal_engine_select) -- default 'auto'.
+    @param workers: integer object containing the number of images read concurrently -- default 1.
+    @param memory_budget: string or integer object containing the memory budget (i.e. '4GB'), None for unbounded.
+    @param all_touched: boolean object, True includes every pixel touched by a site -- default False.
+    @param output: string object, 'pandas' for a dataframe or 'arrow' for a pyarrow table -- default 'pandas'.
+    @param precheck_counts: dictionary object (zonal_image_precheck) updated with the processed and skipped images.
+    @param kernel: integer or string object containing the point sample kernel (1, 3x3 or 5x5, zonal_point_sample) in
+    place of the zonal stats over the site geometries (engine is ignored), None for zonal stats -- default None.
+    @param buffers: list object containing the nested square buffer distances in metres (half the square side, i.e.
+    [50, 100, 250] for 1ha, 4ha and 25ha) around each site centre in place of the site geometries, None for the site
+    geometries -- default None.
+    @param headers: dictionary object (image path: ImageHeader, zonal_image_header) registered before the images are
+    planned, in addition to the headers harvested by the discovery stage -- default None.
+    @param batch_images: integer object containing the number of images per batch when the images are streamed from
+    the discovery stage (zonal_image_stream): each batch is calculated as soon as it is received, unless a same
+    date image of another tile directory arrives after its group was calculated (the whole image list is then
+    calculated, so the same date images are combined), None to read every image before the calculation -- default
+    None.
+    @return: dataframe (or pyarrow table) object with one row per site and image: uid, site, the statistics (in
+    rasterstats result order), band, image, date (and scale for nested buffers).
+    """
+    if stats is None:
+        stats = list(zonal_image_precheck.DEFAULT_STATS)
+
+    if engine != 'auto' and engine not in ENGINES:
+        raise ValueError("Unknown zonal stats engine: {0} (options: auto, {1})".format(engine,
+                                                                                     ', '.join(sorted(ENGINES))))
+
+    if output not in ('pandas', 'arrow'):
+        raise ValueError("Unknown output: {0} (options: pandas, arrow)".format(output))
+
+    if kernel is not None and buffers:
+        raise ValueError("The point sample kernel and the nested buffers can not be combined.")
+
+    if headers:
+        zonal_image_header.register_headers_fn(headers)
+
+    site_cache = load_sites_fn(sites)
+    if batch_images:
+        list_image = []
+        list_df = []
+        calculated = {}
+        batch_counts = zonal_image_precheck.new_precheck_counts_fn()
+        for batch in zonal_image_stream.batches_fn(images, batch_images):
+            if list_df is not None and zonal_image_stream.joins_groups_fn(batch, calculated):
+                # a same date image of another tile directory arrived after its group was calculated: the stream
+                # is read to the end and calculated as one list, so the sites over the tile edge are complete.
+                print("Zonal stats: same date images of another tile directory in the stream, calculating the "
+                      "whole image list.")
+                list_df = None
+            list_image.extend(batch)
+            if list_df is not None:
+                list_df.append(compute_zonal_stats(batch, site_cache, stats, band, no_data, uid, engine, workers,
+                                                   memory_budget, all_touched, 'pandas', batch_counts, kernel,
+                                                   buffers))
+                zonal_image_stream.add_groups_fn(batch, calculated)
+
+        if list_df is None or not list_df:
+            return compute_zonal_stats(list_image, site_cache, stats, band, no_data, uid, engine, workers,
+                                       memory_budget, all_touched, output, precheck_counts, kernel, buffers)
+
+        if precheck_counts is not None:
+            for key, value in batch_counts.items():
+                precheck_counts[key] += value
+
+        return output_table_fn(pd.concat(list_df, ignore_index=True, sort=False), output)
+
+    if buffers:
+        site_cache = zonal_geometry_cache.nested_site_cache_fn(site_cache, buffers)
+    memory_plan = zonal_memory_budget.memory_plan_fn(memory_budget, workers)
+    list_group = image_groups_fn(images)
+    stat_names = zonal_image_precheck.stat_names_fn(stats)
+
+    engine_plan = None
+    if kernel is not None:
+        engine = 'point sample {0}x{0}'.format(zonal_point_sample.kernel_size_fn(kernel))
+    else:
+        # choose the engine and read strategy of this tile (site layout, raster block size and image count).
+        engine_plan = zonal_engine_select.select_engine_fn(list_group, site_cache, stats, band, engine)
+        engine = engine_plan.engine
+
+    # the logged time covers the engine only (not the engine selection).
+    start_time = time.time()
+    if engine_plan is None:
+        list_result = zonal_point_sample.point_sample_engine_fn(list_group, site_cache, stats, band, no_data, kernel,
+                                                                memory_plan)
+    else:
+        list_result = ENGINES[engine](list_group, site_cache, stats, band, no_data, all_touched, memory_plan,
+                                      engine_plan.block_pixels)
+    print("Zonal stats ({0} engine): {1} images x {2} sites in {3:.1f} s".format(
+        engine, len(list_group), len(site_cache.source), time.time() - start_time))
+
+    if list_result:
+        df = pd.concat([group_frame_fn(image_group, records, site_cache, stat_names, band, uid)
+                        for image_group, (records, _) in zip(list_group, list_result)], ignore_index=True, sort=False)
+        # skipped images hold None statistics, convert them to NaN (numeric features, as read back from a csv).
+        df[stat_names] = df[stat_names].apply(pd.to_numeric)
+        if 'count' in stat_names:
+            df['count'] = df['count'].astype('int64')
+    else:
+        df = pd.DataFrame(columns=['uid', 'site'] + stat_names + ['band', 'image', 'date'] +
+                          (['scale'] if buffers else []))
+
+    if precheck_counts is not None:
+        for _, group_counts in list_result:
+            for key, value in group_counts.items():
+                precheck_counts[key] += value
+
+    return output_table_fn(df, output)
+
+
+def output_table_fn(df, output):
+    """ Return the zonal stats in the requested output type.
+
+    @param df: dataframe object.
+    @param output: string object, 'pandas' for a dataframe or 'arrow' for a pyarrow table.
+    @return: dataframe (or pyarrow table) object.
+    """
+    if output == 'arrow':
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError("pyarrow is required for output='arrow', install it or use output='pandas'.")
+
+        return pyarrow.Table.from_pandas(df, preserve_index=False)
+
+    return df
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+"""
+zonal_stats_clean.py
+====================
+
+Description: This script contains the shared dataframe cleaning functions used by the step1_6 zonal stats scripts
+and the step1_10 seasonal dka zonal stats script once the per image outputs have been concatenated.
+All functions operate on whole columns, so the cost is driven by the number of unique season codes rather than by
+the number of rows (sites x images).
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# import modules
+from __future__ import print_function, division
+import pandas as pd
+
+
+def season_date_fn(season_codes):
+    """ Convert seasonal date codes (YYYYMMYYYYMM) into start and end day, month, year and date strings.
+
+    Each unique code is parsed once and the results are broadcast back to every row, the end of season day is
+    derived from the number of days in the end month (period arithmetic).
+
+    @param season_codes: series object containing the seasonal date codes (int or str).
+    @return stamp: dataframe object (same index as season_codes) with the features s_day, s_month, s_year, s_date,
+    e_day, e_month, e_year and e_date (all strings).
+    """
+
+    # factorize so that the date parsing is applied to the unique codes only.
+    codes, unique_codes = pd.factorize(season_codes.astype(str).str[:12])
+    unique_codes = pd.Index(unique_codes)
+
+    st = unique_codes.str[:6]
+    end = unique_codes.str[6:12]
+
+    # validate the start date and determine the last day of the end month.
+    pd.to_datetime(st, format='%Y%m')
+    end_period = pd.to_datetime(end, format='%Y%m').to_period('M')
+    e_day = pd.Index(end_period.days_in_month).astype(str).str.zfill(2)
+
+    unique_stamp = pd.DataFrame({'s_day': '01',
+                                 's_month': st.str[4:6],
+                                 's_year': st.str[:4],
+                                 's_date': st + '01',
+                                 'e_day': e_day,
+                                 'e_month': end.str[4:6],
+                                 'e_year': end.str[:4],
+                                 'e_date': end + e_day})
+
+    stamp = unique_stamp.take(codes)
+    stamp.index = season_codes.index
+
+    return stamp
+
+
+def time_stamp_fn(output_zonal_stats):
+    """Insert the start and end date features into feature position 4, derived from the seasonal date code.
+
+    @param output_zonal_stats: dataframe object containing the Landsat tile zonal stats
+    @return output_zonal_stats: processed dataframe object containing the Landsat tile zonal stats and
+    updated features.
+    """
+
+    stamp = season_date_fn(output_zonal_stats['date'])
+
+    # one concatenation in place of eight single column inserts.
+    output_zonal_stats = pd.concat([output_zonal_stats.iloc[:, :4], stamp, output_zonal_stats.iloc[:, 4:]],
+                                   axis=1, sort=False)
+
+    return output_zonal_stats
+
+
+def landsat_correction_fn(output_zonal_stats, num_bands, var_, stats):
+    """ Replace 0 values with Null values for the selected statistics of every band in one masked assignment.
+
+    @param output_zonal_stats: dataframe object containing the Landsat tile zonal stats.
+    @param num_bands: list object containing the band numbers processed (i.e. [1]).
+    @param var_: string object containing the product extension (i.e. 'h99').
+    @param stats: tuple object containing the statistic suffixes to correct (i.e. ('min',)).
+    @return: processed dataframe object containing the Landsat tile zonal stats and updated values.
+    """
+
+    stat_columns = ['b{0}_{1}_{2}'.format(str(band), var_, stat) for band in num_bands for stat in stats]
+
+    values = output_zonal_stats[stat_columns]
+    output_zonal_stats[stat_columns] = values.mask(values == 0)
+
+    return output_zonal_stats
@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+
+"""
+zonal_virtual_mosaic.py
+=======================
+
+Description: This script allows the zonal stats to be calculated from several same date images (i.e. adjacent
+Landsat path/rows) for sites that straddle a tile boundary. Same date images from different tile directories are
+grouped, and only the window covering the sites is read from each image and combined in memory (first image wins
+where the images overlap). Images in a different crs are wrapped in a WarpedVRT, so no mosaic is written to disk.
+
+A single image is handled by the same windowed read, so the full image is no longer read for every band. When a
+read window would exceed the memory budget (zonal_memory_budget), or the sites are spread across the image
+(zonal_engine_select), the sites are streamed in blocks, each block reading its own smaller window.
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# import modules
+from __future__ import print_function, division
+import math
+import os
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.merge import merge
+from rasterio.vrt import WarpedVRT
+from rasterstats import zonal_stats
+import zonal_geometry_cache
+import zonal_image_precheck
+import image_name_parser
+
+# site block plans already reported (number of sites, number of blocks, transform, max_pixels), so that the plan of
+# a tile grid is printed once instead of for every image.
+REPORTED_BLOCKS = set()
+
+
+def image_list_fn(image_s):
+    """ Return a list of image paths from a single image path or an image group.
+
+    @param image_s: string object containing the image path, or a list object containing same date image paths.
+    @return: list object containing the image paths.
+    """
+    if isinstance(image_s, (list, tuple)):
+        return list(image_s)
+
+    return [image_s]
+
+
+def image_group_key_fn(image_s):
+    """ Create the grouping key of an image from its file name (date code, product, zone and mask suffixes).
+
+    @param image_s: string object containing the image path.
+    @return: tuple object (date, product, zone, masks), or (file name,) when the date can not be parsed.
+    """
+    image_name = image_name_parser.parse_image_name_fn(image_s)
+    if image_name.date is None:
+        return (image_name.name,)
+
+    return image_name.date, image_name.product, image_name.zone, image_name.masks
+
+
+def group_same_date_images_fn(imagery_list):
+    """ Group the same date images located in different tile directories (adjacent path/rows), preserving the order
+    of the image list. Images from the same directory are never grouped (i.e. reprocessed versions of an image).
+
+    @param imagery_list: iterable object containing the image paths (i.e. an open csv file, one path per line).
+    @return list_group: list object containing a list of image paths for each date.
+    """
+    list_group = []
+    open_groups = {}
+
+    for image in imagery_list:
+        image_s = image.rstrip()
+        if not image_s:
+            continue
+
+        key = image_group_key_fn(image_s)
+        image_dir = os.path.dirname(image_s)
+
+        group = None
+        for candidate in open_groups.get(key, []):
+            if image_dir not in [os.path.dirname(i) for i in candidate]:
+                group = candidate
+                break
+
+        if group is None:
+            group = []
+            list_group.append(group)
+            open_groups.setdefault(key, []).append(group)
+
+        group.append(image_s)
+
+    return list_group
+
+
+def snap_bounds_fn(minx, miny, maxx, maxy, transform):
+    """ Snap bounds outwards to the reference pixel grid and pad them by one pixel.
+
+    @param minx, miny, maxx, maxy: float objects containing the bounds in the reference crs.
+    @param transform: affine object containing the reference image transform.
+    @return: tuple object (west, south, east, north).
+    """
+    res_x = transform.a
+    res_y = -transform.e
+
+    west = transform.c + (math.floor((minx - transform.c) / res_x) - 1) * res_x
+    east = transform.c + (math.ceil((maxx - transform.c) / res_x) + 1) * res_x
+    north = transform.f - (math.floor((transform.f - maxy) / res_y) - 1) * res_y
+    south = transform.f - (math.ceil((transform.f - miny) / res_y) + 1) * res_y
+
+    return west, south, east, north
+
+
+def window_pixels_fn(bounds, transform):
+    """ Return the number of pixels in a (snapped) window.
+
+    @param bounds: tuple object (west, south, east, north).
+    @param transform: affine object containing the reference image transform.
+    @return: integer object.
+    """
+    west, south, east, north = bounds
+
+    return int(round((east - west) / transform.a)) * int(round((north - south) / -transform.e))
+
+
+def max_block_pixels_fn(window_bytes, itemsize, block_pixels=None):
+    """ Return the largest site block window in pixels allowed by the memory budget and the block plan.
+
+    @param window_bytes: integer object containing the largest read window in bytes (MemoryPlan), None for unbounded.
+    @param itemsize: integer object containing the number of bytes per pixel.
+    @param block_pixels: integer object containing the largest block window in pixels (zonal_engine_select), None
+    for a single window.
+    @return: integer object, None for a single window.
+    """
+    list_limit = [] if block_pixels is None else [int(block_pixels)]
+    if window_bytes is not None:
+        list_limit.append(max(int(window_bytes // itemsize), 1))
+
+    return min(list_limit) if list_limit else None
+
+
+def site_blocks_fn(sites, transform, max_pixels=None):
+    """ Split the sites into blocks (north to south, west to east) so that the window of each block holds no more
+    than max_pixels. A site larger than max_pixels is returned as a block of its own, and the nested buffers of a
+    site (site_group feature, zonal_geometry_cache) are kept in the same block.
+
+    @param sites: geo-dataframe object containing the sites in the reference crs.
+    @param transform: affine object containing the reference image transform.
+    @param max_pixels: integer object containing the largest window in pixels, None for a single block.
+    @return list_block: list object containing an integer numpy array of site positions for each block.
+    """
+    if max_pixels is None or window_pixels_fn(snap_bounds_fn(*sites.total_bounds, transform=transform),
+                                              transform) <= max_pixels:
+        return [np.arange(len(sites))]
+
+    # the blocks are planned on the envelope of each site group (each site is a group of its own without nesting).
+    if zonal_geometry_cache.SITE_GROUP in sites.columns:
+        groups = sites[zonal_geometry_cache.SITE_GROUP].values
+    else:
+        groups = np.arange(len(sites))
+    site_bounds = sites.bounds.groupby(groups, sort=True).agg(
+        {'minx': 'min', 'miny': 'min', 'maxx': 'max', 'maxy': 'max'})[['minx', 'miny', 'maxx', 'maxy']].values
+    sort = np.argsort(groups, kind='mergesort')
+    members = np.split(sort, np.unique(groups[sort], return_index=True)[1][1:])
+
+    order = np.lexsort((site_bounds[:, 0], -site_bounds[:, 3]))
+    list_block = []
+    block = []
+    block_bounds = None
+
+    for position in order:
+        minx, miny, maxx, maxy = site_bounds[position]
+        if block_bounds is not None:
+            union = (min(block_bounds[0], minx), min(block_bounds[1], miny),
+                     max(block_bounds[2], maxx), max(block_bounds[3], maxy))
+            if window_pixels_fn(snap_bounds_fn(*union, transform=transform), transform) <= max_pixels:
+                block.append(position)
+                block_bounds = union
+                continue
+
+            list_block.append(np.concatenate([members[i] for i in block]))
+
+        block = [position]
+        block_bounds = (minx, miny, maxx, maxy)
+
+    list_block.append(np.concatenate([members[i] for i in block]))
+
+    plan = (len(sites), len(list_block), tuple(transform), max_pixels)
+    if len(list_block) > 1 and plan not in REPORTED_BLOCKS:
+        REPORTED_BLOCKS.add(plan)
+        print("Streaming {0} sites in {1} blocks.".format(len(sites), len(list_block)))
+
+    return list_block
+
+
+def read_sites_window_fn(srci, other_images, band, no_data, sites):
+    """ Read the window covering the sites from the reference image and any other same date images.
+
+    @param srci: open rasterio dataset (reference image -- sets the crs and pixel grid).
+    @param other_images: list object containing the paths of the other same date images (may be empty).
+    @param band: integer object containing the band number to read.
+    @param no_data: no data value used to fill pixels not covered by any image.
+    @param sites: geo-dataframe object containing the sites in the reference crs.
+    @return array: numpy array object containing the window values.
+    @return affine: affine object containing the window transform.
+    """
+    bounds = snap_bounds_fn(*sites.total_bounds, transform=srci.transform)
+    list_dataset = [srci]
+    list_open = []
+
+    try:
+        for image in other_images:
+            src_other = rasterio.open(image)
+            list_open.append(src_other)
+
+            if src_other.crs != srci.crs:
+                # re-project on the fly (nearest neighbour) to the reference crs.
+                src_other = WarpedVRT(src_other, crs=srci.crs, resampling=Resampling.nearest)
+                list_open.append(src_other)
+
+            list_dataset.append(src_other)
+
+        mosaic, affine = merge(list_dataset, bounds=bounds, res=srci.res, nodata=no_data, indexes=[band])
+
+    finally:
+        for dataset in reversed(list_open):
+            dataset.close()
+
+    return mosaic[0], affine
+
+
+def site_zonal_stats_fn(srci, other_images, band, no_data, sites, window_bytes=None, precheck_counts=None,
+                        block_pixels=None, **zonal_kwargs):
+    """ Calculate the rasterstats zonal stats for every site from the site window(s) of the reference image and any
+    other same date images. The sites are streamed in blocks when their window exceeds window_bytes or the block
+    plan (block_pixels), and images without valid data over the sites are skipped (see zonal_image_precheck).
+
+    @param srci: open rasterio dataset (reference image -- sets the crs and pixel grid).
+    @param other_images: list object containing the paths of the other same date images (may be empty).
+    @param band: integer object containing the band number to read.
+    @param no_data: no data value of the imagery.
+    @param sites: geo-dataframe object containing the sites in the reference crs.
+    @param window_bytes: integer object containing the largest read window in bytes (MemoryPlan), None for unbounded.
+    @param precheck_counts: dictionary object counting the processed and skipped images (None: not counted).
+    @param block_pixels: integer object containing the largest site block window in pixels (zonal_engine_select),
+    None for a single window.
+    @param zonal_kwargs: keyword arguments passed to rasterstats zonal_stats (i.e. stats, all_touched).
+    @return zs: list object containing the zonal stats dictionary of each site (site order, rasterstats key order).
+    """
+    stats = zonal_kwargs.get('stats')
+    if len(sites) == 0:
+        return []
+
+    if not zonal_image_precheck.metadata_precheck_fn(srci, other_images, band, sites):
+        zonal_image_precheck.record_precheck_fn(precheck_counts, True)
+        return [zonal_image_precheck.empty_zone_stats_fn(stats) for _ in range(len(sites))]
+
+    max_pixels = max_block_pixels_fn(window_bytes, np.dtype(srci.dtypes[band - 1]).itemsize, block_pixels)
+
+    zs = [None] * len(sites)
+    has_data = False
+    for block in site_blocks_fn(sites, srci.transform, max_pixels):
+        block_sites = sites.iloc[block]
+        array, affine = read_sites_window_fn(srci, other_images, band, no_data, block_sites)
+
+        if zonal_image_precheck.window_has_data_fn(array, no_data):
+            has_data = True
+            block_zs = zonal_stats(list(block_sites.geometry), array, affine=affine, nodata=no_data, **zonal_kwargs)
+        else:
+            block_zs = [zonal_image_precheck.empty_zone_stats_fn(stats) for _ in range(len(block))]
+
+        for position, zone in zip(block, block_zs):
+            zs[position] = zonal_image_precheck.ordered_zone_stats_fn(zone, stats)
+
+    zonal_image_precheck.record_precheck_fn(precheck_counts, not has_data)
+
+    return zs
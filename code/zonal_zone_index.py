@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+
+"""
+zonal_zone_index.py
+===================
+
+Description: This script converts site polygons into a zone index for a raster pixel grid. The zone index holds the
+raster window covering all of the sites and, for every pixel inside a site, the zone (site) number and the flat
+position of the pixel within that window. Once built, the statistics for every site can be derived from a single
+window read per image without rasterising the polygons again, and overlapping sites are supported because a pixel
+can be listed once per zone.
+
+Zone indexes are cached by pixel grid (transform, width, height and crs) so that images sharing a grid reuse the
+same index.
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# import modules
+from __future__ import print_function, division
+from collections import namedtuple
+import math
+import numpy as np
+from rasterio.features import rasterize
+from rasterio.windows import Window
+from rasterio import windows
+from shapely.geometry import shape as as_shape
+
+# window: rasterio Window covering every site pixel (clipped to the raster).
+# zone_ids: int array, zone number (0 to n_zones - 1, in geometry order) for each indexed pixel.
+# pixel_index: int array, flat position of each indexed pixel within the window.
+# n_zones: number of input geometries (zones without pixels return empty statistics).
+ZoneIndex = namedtuple('ZoneIndex', ['window', 'zone_ids', 'pixel_index', 'n_zones'])
+
+
+def geometry_bounds_window_fn(geometry, transform, width, height):
+    """ Calculate the pixel window (clipped to the raster) that contains the bounds of a geometry.
+
+    @param geometry: shapely geometry object.
+    @param transform: affine object containing the raster transform.
+    @param width: integer object containing the raster width.
+    @param height: integer object containing the raster height.
+    @return row_st, row_end, col_st, col_end: integer objects containing the window pixel range.
+    """
+    minx, miny, maxx, maxy = geometry.bounds
+    col_a, row_a = ~transform * (minx, maxy)
+    col_b, row_b = ~transform * (maxx, miny)
+
+    # pad by one pixel so that all_touched pixels on the boundary are captured.
+    row_st = max(int(math.floor(min(row_a, row_b))) - 1, 0)
+    row_end = min(int(math.ceil(max(row_a, row_b))) + 1, height)
+    col_st = max(int(math.floor(min(col_a, col_b))) - 1, 0)
+    col_end = min(int(math.ceil(max(col_a, col_b))) + 1, width)
+
+    return row_st, row_end, col_st, col_end
+
+
+def build_zone_index_fn(geometries, transform, width, height, all_touched=True):
+    """ Rasterise each geometry within its own bounding window and record the pixels covered by each zone.
+
+    @param geometries: iterable object containing shapely geometries or GeoJSON-like mappings (zone order).
+    @param transform: affine object containing the raster transform.
+    @param width: integer object containing the raster width.
+    @param height: integer object containing the raster height.
+    @param all_touched: boolean object, True includes every pixel touched by the geometry (rasterstats behaviour).
+    @return zone_index: ZoneIndex object.
+    """
+    list_zone = []
+    list_row = []
+    list_col = []
+    n_zones = 0
+
+    for zone, geometry in enumerate(geometries):
+        n_zones += 1
+        if geometry is None:
+            continue
+
+        if not hasattr(geometry, 'bounds'):
+            geometry = as_shape(geometry)
+
+        if geometry.is_empty:
+            continue
+
+        row_st, row_end, col_st, col_end = geometry_bounds_window_fn(geometry, transform, width, height)
+        if row_end <= row_st or col_end <= col_st:
+            # the site does not overlap the raster.
+            continue
+
+        zone_window = Window(col_st, row_st, col_end - col_st, row_end - row_st)
+        mask = rasterize([(geometry, 1)], out_shape=(zone_window.height, zone_window.width),
+                         transform=windows.transform(zone_window, transform), fill=0, all_touched=all_touched,
+                         dtype='uint8')
+
+        rows, cols = np.nonzero(mask)
+        list_zone.append(np.full(rows.size, zone, dtype=np.int64))
+        list_row.append(rows + row_st)
+        list_col.append(cols + col_st)
+
+    if len(list_zone) == 0 or sum(z.size for z in list_zone) == 0:
+        return ZoneIndex(Window(0, 0, 0, 0), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), n_zones)
+
+    zone_ids = np.concatenate(list_zone)
+    rows = np.concatenate(list_row)
+    cols = np.concatenate(list_col)
+
+    row_off = int(rows.min())
+    col_off = int(cols.min())
+    window = Window(col_off, row_off, int(cols.max()) - col_off + 1, int(rows.max()) - row_off + 1)
+    pixel_index = (rows - row_off) * int(window.width) + (cols - col_off)
+
+    return ZoneIndex(window, zone_ids, pixel_index.astype(np.int64), n_zones)
+
+
+def grid_key_fn(transform, width, height):
+    """ Create a hashable key describing a raster pixel grid.
+
+    @param transform: affine object containing the raster transform.
+    @param width: integer object containing the raster width.
+    @param height: integer object containing the raster height.
+    @return: tuple object (transform coefficients, width, height).
+    """
+    return tuple(round(float(i), 6) for i in tuple(transform)[:6]) + (int(width), int(height))
+
+
+def zone_index_cache_fn(zone_cache, geometries, transform, width, height, all_touched=True, crs=None):
+    """ Return the zone index for a pixel grid, building it only the first time the grid is seen.
+
+    @param zone_cache: dictionary object used as the cache (grid key: ZoneIndex) -- may be shared between calls.
+    @param geometries: iterable object containing the zone geometries in the raster crs.
+    @param transform: affine object containing the raster transform.
+    @param width: integer object containing the raster width.
+    @param height: integer object containing the raster height.
+    @param all_touched: boolean object passed to the rasteriser.
+    @param crs: crs object of the raster -- grids with identical transforms in different utm zones are kept apart.
+    @return zone_index: ZoneIndex object.
+    """
+    key = grid_key_fn(transform, width, height) + (bool(all_touched), None if crs is None else str(crs))
+    zone_index = zone_cache.get(key)
+    if zone_index is None:
+        zone_index = build_zone_index_fn(geometries, transform, width, height, all_touched)
+        zone_cache[key] = zone_index
+
+    return zone_index
+
+
+def read_zone_window_fn(srci, zone_index, band=1):
+    """ Read the raster window covering all zones (a single read per image).
+
+    @param srci: open rasterio dataset.
+    @param zone_index: ZoneIndex object for the dataset pixel grid.
+    @param band: integer object containing the band number to read.
+    @return array: numpy array object containing the window values (empty when no zone overlaps the raster).
+    """
+    if zone_index.pixel_index.size == 0:
+        return np.empty((0, 0), dtype=srci.dtypes[band - 1])
+
+    return srci.read(band, window=zone_index.window)
+
+
+def zone_values_fn(array, zone_index, no_data):
+    """ Extract the valid pixel values and their zone numbers from a window array.
+
+    @param array: numpy array object returned by read_zone_window_fn.
+    @param zone_index: ZoneIndex object used to read the array.
+    @param no_data: no data value (pixels equal to no_data or NaN are excluded).
+    @return zone_ids, values: numpy array objects of equal length.
+    """
+    values = array.ravel()[zone_index.pixel_index]
+    valid = np.ones(values.shape, dtype=bool)
+    if no_data is not None:
+        valid &= values != no_data
+    if values.dtype.kind == 'f':
+        valid &= ~np.isnan(values)
+
+    return zone_index.zone_ids[valid], values[valid]